@@ -0,0 +1,94 @@
+"""
+Scaling of a parallel Parquet backfill with the number of worker processes.
+
+Writes synthetic monthly archives to a temporary directory, loads them with
+ingest_parquet for every worker count and prints the wall time and the speed-up
+over one worker.
+
+    python benchmarks/backfill.py --archives 12 --rows 2000000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import duckdb
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ingest import block_size_for, ingest_parquet  # noqa: E402
+
+
+def create_archives(directory: Path, archives: int, rows: int) -> None:
+    """
+    Write monthly .zip archives of synthetic validations in the data.gov.lv layout.
+    """
+    step = timedelta(days=28).total_seconds() / rows
+    with duckdb.connect() as conn:
+        for i in range(archives):
+            start = datetime(2022 + i // 12, 1 + i % 12, 1)
+            csv = directory / f'ValidDati{start:%m_%y}.txt'
+            conn.execute(
+                f"""
+                copy (
+                    select
+                        i % 13 as Ier_ID,
+                        ['Autobuss', 'Tramvajs', 'Trolejbuss'][1 + i % 3]
+                            as TranspVeids,
+                        i % 900 as GarNr,
+                        'R' || i % 60 as TMarsruts,
+                        strftime(
+                            timestamp '{start}' + to_seconds((i * {step})::BIGINT),
+                            '%d.%m.%Y %H:%M:%S'
+                        ) as Laiks
+                    from range({rows}) t(i)
+                ) to '{csv.as_posix()}' (delimiter ';', header)
+                """
+            )
+            with zipfile.ZipFile(
+                csv.with_suffix('.zip'), 'w', zipfile.ZIP_DEFLATED
+            ) as archive:
+                archive.write(csv, csv.name)
+            csv.unlink()
+
+
+def main() -> None:
+    """
+    Time ingest_parquet with 1, 2, 4, ... worker processes.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--archives', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--worker-memory-mb', type=int, default=64)
+    parser.add_argument('--max-workers', type=int, default=os.process_cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / 'zips'
+        source.mkdir()
+        create_archives(source, args.archives, args.rows)
+
+        workers = 1
+        baseline = None
+        print(f'{"workers":>7} {"seconds":>8} {"speed-up":>8}')
+        while workers <= args.max_workers:
+            start = time.perf_counter()
+            ingest_parquet(
+                Path(tmp) / f'data-{workers}',
+                str(source),
+                block_size_for(args.worker_memory_mb),
+                workers,
+            )
+            seconds = time.perf_counter() - start
+            baseline = baseline or seconds
+            print(f'{workers:>7} {seconds:>8.2f} {baseline / seconds:>8.2f}')
+            workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Bytes read per metric query from the Parquet layouts before and after sorting.
+
+Writes synthetic monthly archives with validations in no particular time order and
+loads them twice: as one Parquet file per archive in export order, the layout of
+ingest.py before the month partitions, and with ingest_parquet into year and month
+partitions sorted by Laiks. Runs the raw metric queries of a month and of a single
+day against both and prints the bytes read and the median wall time.
+
+The month column runs the same queries against a copy of only the partition of the
+selected month. When it equals the after column, the filter skipped every other
+partition and the bytes left are the columns of the month itself, read once per
+scan of validacijas (month_components scans it twice).
+
+    python benchmarks/parquet_layout.py --archives 6 --rows 2000000
+
+Bytes read are the rchar counter of /proc/self/io, so the benchmark runs on Linux
+only. They include reads served from the page cache.
+"""
+
+import argparse
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from collections.abc import Callable
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import duckdb
+import pyarrow.parquet as pq
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import data_manager as dm  # noqa: E402
+from database import Backend, DatabaseConnection  # noqa: E402
+from ingest import (  # noqa: E402
+    ROW_GROUP_SIZE,
+    VALIDACIJAS_TABLE,
+    archive_name,
+    ingest_parquet,
+    list_archives,
+    open_archive,
+    read_member,
+)
+from query_router import RoutedQuery  # noqa: E402
+
+QUERIES: list[RoutedQuery] = [
+    dm.SQL_MONTH_COMPONENTS,
+    dm.SQL_RIDES_PER_DAY,
+    dm.SQL_PEAK_HOUR,
+    dm.SQL_ROUTE_DENSITY,
+]
+
+
+def create_archives(directory: Path, archives: int, rows: int) -> None:
+    """
+    Write monthly .zip archives of synthetic validations in a shuffled order.
+    """
+    step = timedelta(days=28).total_seconds() / rows
+    with duckdb.connect() as conn:
+        for i in range(archives):
+            start = datetime(2024 + i // 12, 1 + i % 12, 1)
+            csv = directory / f'ValidDati{start:%m_%y}.txt'
+            conn.execute(
+                f"""
+                copy (
+                    select
+                        i % 13 as Ier_ID,
+                        ['Autobuss', 'Tramvajs', 'Trolejbuss'][1 + i % 3]
+                            as TranspVeids,
+                        i % 900 as GarNr,
+                        'R' || i % 60 as TMarsruts,
+                        strftime(
+                            timestamp '{start}' + to_seconds((i * {step})::BIGINT),
+                            '%d.%m.%Y %H:%M:%S'
+                        ) as Laiks
+                    from range({rows}) t(i)
+                    order by hash(i)
+                ) to '{csv.as_posix()}' (delimiter ';', header)
+                """
+            )
+            with zipfile.ZipFile(
+                csv.with_suffix('.zip'), 'w', zipfile.ZIP_DEFLATED
+            ) as archive:
+                archive.write(csv, csv.name)
+            csv.unlink()
+
+
+def write_unsorted(directory: Path, source: str) -> None:
+    """
+    Write every archive member to one Parquet file in export order.
+    """
+    table_dir = directory / VALIDACIJAS_TABLE
+    table_dir.mkdir(parents=True)
+    for location in list_archives(source):
+        with open_archive(location) as (archive, _, _):
+            for name in archive.namelist():
+                reader = read_member(archive, name)
+                path = table_dir / f'{archive_name(location)}-{Path(name).stem}.parquet'
+                with pq.ParquetWriter(path, reader.schema) as writer:
+                    for batch in reader:
+                        writer.write_batch(batch, row_group_size=ROW_GROUP_SIZE)
+
+
+def rchar() -> int:
+    """
+    Bytes read by this process so far.
+    """
+    with open('/proc/self/io') as io:
+        return next(int(line.split()[1]) for line in io if line.startswith('rchar'))
+
+
+def measure(run: Callable[[], object], runs: int) -> tuple[int, float]:
+    """
+    Bytes read by one run and the median wall time in milliseconds.
+    """
+    run()
+    before = rchar()
+    run()
+    read = rchar() - before
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return read, statistics.median(times) * 1000
+
+
+def connect(directory: Path) -> DatabaseConnection:
+    """
+    Create a DatabaseConnection to a Parquet data directory.
+    """
+    DatabaseConnection._instance = None
+    return DatabaseConnection(backend=Backend.PARQUET, path=str(directory))
+
+
+def main() -> None:
+    """
+    Compare bytes read per query of the unsorted and the partitioned layout.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--archives', type=int, default=6)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE)
+    parser.add_argument('--tr-type', default='Tramvajs')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / 'zips'
+        source.mkdir()
+        create_archives(source, args.archives, args.rows)
+        write_unsorted(Path(tmp) / 'before', str(source))
+        ingest_parquet(
+            Path(tmp) / 'after', str(source), row_group_size=args.row_group_size
+        )
+        month = date(2024 + (args.archives - 1) // 12, 1 + (args.archives - 1) % 12, 1)
+        partition = Path(
+            VALIDACIJAS_TABLE, f'year={month.year}', f'month={month.month}'
+        )
+        shutil.copytree(
+            Path(tmp) / 'after' / partition, Path(tmp) / 'month' / partition
+        )
+        layouts = {
+            name: connect(Path(tmp) / name) for name in ('before', 'after', 'month')
+        }
+
+        day = month.replace(day=15)
+        ranges = {'month': (month, month.replace(day=28)), 'day': (day, day)}
+        print(
+            f'{"query":<24} {"range":<6} {"before MB":>10} {"after MB":>9}'
+            f' {"month MB":>9} {"before ms":>10} {"after ms":>9}'
+        )
+        for routed in QUERIES:
+            for range_name, date_range in ranges.items():
+                results = []
+                for db in layouts.values():
+                    query, params = dm._build_query(
+                        db, routed, date_range=date_range, tr_types=[args.tr_type]
+                    )
+                    results.append(
+                        measure(
+                            lambda d=db, q=query, p=params: d.get_relation(q, p).pl(),
+                            args.runs,
+                        )
+                    )
+                (
+                    (before_bytes, before_ms),
+                    (after_bytes, after_ms),
+                    (month_bytes, _),
+                ) = results
+                print(
+                    f'{routed.name:<24} {range_name:<6}'
+                    f' {before_bytes / 2**20:>10.2f} {after_bytes / 2**20:>9.2f}'
+                    f' {month_bytes / 2**20:>9.2f}'
+                    f' {before_ms:>10.2f} {after_ms:>9.2f}'
+                )
+
+
+if __name__ == '__main__':
+    main()
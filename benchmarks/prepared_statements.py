@@ -0,0 +1,167 @@
+"""
+Micro-benchmark of the planning overhead saved by prepared statements.
+
+Runs the queries of one metrics update for a month and a transport type, as ad-hoc
+parametrized queries and as EXECUTE of statements prepared once per cursor, and
+prints the median times per query and per rerun.
+
+    python benchmarks/prepared_statements.py --path validacijas.duckdb
+
+Without --path a synthetic database with rollups is created in a temporary
+directory.
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from datetime import date
+from itertools import count
+from pathlib import Path
+
+import duckdb
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import data_manager as dm  # noqa: E402
+from database import Backend, ConnectionOptions, DatabaseConnection  # noqa: E402
+from query_router import RoutedQuery  # noqa: E402
+from rollups import refresh_rollups  # noqa: E402
+from utils import last_day_of_month  # noqa: E402
+
+RERUN_QUERIES: list[tuple[RoutedQuery, bool]] = [
+    (dm.SQL_MONTH_COMPONENTS, False),
+    (dm.SQL_TOTAL_RIDES_COMPONENTS, True),
+]
+SINGLE_QUERIES: list[tuple[RoutedQuery, bool]] = [
+    (dm.SQL_RIDES_PER_DAY, False),
+    (dm.SQL_PEAK_HOUR, False),
+    (dm.SQL_POPULAR_ROUTES, False),
+    (dm.SQL_TR_DISTRIBUTION, False),
+    (dm.SQL_PEAK_DAY, False),
+    (dm.SQL_ROUTE_DENSITY, False),
+]
+
+
+def create_database(path: Path, rows: int) -> None:
+    """
+    Create a database of synthetic validations over 20 months with rollups.
+    """
+    with duckdb.connect(str(path)) as conn:
+        conn.execute(
+            f"""
+            create table validacijas as
+            select
+                timestamp '2024-01-01' + to_minutes((i * 7) % (60 * 24 * 600)) as Laiks,
+                ['Autobuss', 'Tramvajs', 'Trolejbuss'][1 + i % 3] as TranspVeids,
+                'R' || i % 60 as TMarsruts,
+                i % 900 as GarNr
+            from range({rows}) t(i)
+            """
+        )
+        refresh_rollups(conn)
+
+
+def median_ms(run: Callable[[], object], runs: int) -> float:
+    """
+    Median wall time of run in milliseconds, after one warm-up run.
+    """
+    run()
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def prepare_ms(cursor: duckdb.DuckDBPyConnection, query: str, runs: int) -> float:
+    """
+    Median time of parsing, binding and planning query with PREPARE.
+    """
+    names = (f'plan_{i}' for i in count())
+    return median_ms(lambda: cursor.execute(f'prepare {next(names)} as {query}'), runs)
+
+
+def connect(path: Path, prepare_statements: bool) -> DatabaseConnection:
+    """
+    Create a DatabaseConnection to the local file, sharing the DuckDB connection.
+    """
+    DatabaseConnection._instance = None
+    return DatabaseConnection(
+        backend=Backend.DUCKDB,
+        path=str(path),
+        options=ConnectionOptions(prepare_statements=prepare_statements),
+    )
+
+
+def main() -> None:
+    """
+    Compare ad-hoc and prepared execution of the metric queries.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--path', type=Path, help='local DuckDB file with rollups')
+    parser.add_argument('--month', type=date.fromisoformat, default=None)
+    parser.add_argument('--tr-type', default='Tramvajs')
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument(
+        '--all',
+        action='store_true',
+        help='also benchmark the single metric queries',
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path
+        if path is None:
+            path = Path(tmp) / 'validacijas.duckdb'
+            create_database(path, args.rows)
+
+        adhoc_db = connect(path, prepare_statements=False)
+        month = args.month or dm.get_available_months(adhoc_db)[-1]
+        date_range = (month, last_day_of_month(month))
+        prepared_db = connect(path, prepare_statements=True)
+
+        queries = RERUN_QUERIES + (SINGLE_QUERIES if args.all else [])
+        print(f'{"query":<24} {"plan":>8} {"ad-hoc":>8} {"prepared":>9} {"saved":>8}')
+        totals = [0.0, 0.0, 0.0]
+        for routed, up_to in queries:
+            query, params = dm._build_query(
+                adhoc_db,
+                routed,
+                date_range=(None, date_range[1]) if up_to else date_range,
+                tr_types=[args.tr_type],
+            )
+            with adhoc_db.conn.cursor() as cursor:
+                plan = prepare_ms(cursor, query, args.runs)
+            with adhoc_db.cursor():
+                adhoc = median_ms(
+                    lambda q=query, p=params: adhoc_db.get_relation(q, p).pl(),
+                    args.runs,
+                )
+            with prepared_db.cursor():
+                prepared = median_ms(
+                    lambda q=query, p=params: prepared_db.get_relation(q, p).pl(),
+                    args.runs,
+                )
+            for i, value in enumerate((plan, adhoc, prepared)):
+                totals[i] += value
+            print(
+                f'{routed.name:<24} {plan:>8.3f} {adhoc:>8.3f} {prepared:>9.3f}'
+                f' {adhoc - prepared:>8.3f}'
+            )
+
+        plan, adhoc, prepared = totals
+        print(
+            f'{"per rerun":<24} {plan:>8.3f} {adhoc:>8.3f} {prepared:>9.3f}'
+            f' {adhoc - prepared:>8.3f}'
+        )
+        print('times in ms, median of', args.runs, 'runs; plan is PREPARE alone')
+        adhoc_db.conn.close()
+
+
+if __name__ == '__main__':
+    main()
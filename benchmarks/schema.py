@@ -0,0 +1,194 @@
+"""
+Storage and query time of the validacijas column types.
+
+Writes a synthetic monthly archive with the columns of the data.gov.lv export and
+loads it with three schemas:
+
+- text: free text dimensions and a BIGINT GarNr, the schema before compact types
+- compact: ingest.COLUMN_TYPES, dictionary encoded dimensions and INTEGER GarNr
+- enum: compact, with the dimensions stored as DuckDB ENUM types
+
+For each it prints the parse time and largest block in memory, the size of the
+DuckDB table and of a Parquet export, and the median time of the group by and
+filter patterns of the metric queries.
+
+    python benchmarks/schema.py --rows 5000000
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from collections.abc import Callable
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ingest import COLUMN_TYPES, open_archive, read_member  # noqa: E402
+
+TEXT_TYPES: dict[str, pa.DataType] = {
+    'Laiks': pa.timestamp('us'),
+    'GarNr': pa.int64(),
+}
+ENUM_COLUMNS = ('TranspVeids', 'TMarsruts', 'MarsrNos', 'Parks', 'Virziens')
+
+QUERIES: dict[str, str] = {
+    'group by TMarsruts': """
+        select TMarsruts, count(*) from validacijas group by TMarsruts
+        """,
+    'group by TranspVeids': """
+        select TranspVeids, count(*) from validacijas group by TranspVeids
+        """,
+    'TranspVeids in $tr_types': """
+        select count(distinct GarNr) from validacijas
+        where TranspVeids in $tr_types
+        """,
+    'group by route, vehicle': """
+        select TranspVeids, TMarsruts, GarNr, count(*) from validacijas group by all
+        """,
+}
+
+
+def create_archive(path: Path, rows: int) -> None:
+    """
+    Write a .zip archive of one month of synthetic validations.
+    """
+    csv = path.with_suffix('.txt')
+    step = 28 * 24 * 3600 / rows
+    with duckdb.connect() as conn:
+        conn.execute(
+            f"""
+            copy (
+                select
+                    i as Ier_ID,
+                    'Parks ' || hash(i * 11) % 5 as Parks,
+                    ['Autobuss', 'Tramvajs', 'Trolejbuss'][(1 + hash(i) % 3)::BIGINT]
+                        as TranspVeids,
+                    10000 + hash(i * 3) % 3000 as GarNr,
+                    'Centrs - Imanta ' || hash(i * 7) % 120 as MarsrNos,
+                    'R' || hash(i * 7) % 120 as TMarsruts,
+                    ['Forth', 'Back'][(1 + hash(i * 5) % 2)::BIGINT] as Virziens,
+                    1000000 + hash(i * 13) % 900000 as ValidTalonaId,
+                    strftime(
+                        timestamp '2025-05-01' + to_seconds((i * {step})::BIGINT),
+                        '%d.%m.%Y %H:%M:%S'
+                    ) as Laiks
+                from range({rows}) t(i)
+            ) to '{csv.as_posix()}' (delimiter ';', header)
+            """
+        )
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.write(csv, csv.name)
+    csv.unlink()
+
+
+def median_ms(run: Callable[[], object], runs: int) -> float:
+    """
+    Median wall time of run in milliseconds, after one warm-up run.
+    """
+    run()
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def load(
+    path: Path,
+    archive: Path,
+    column_types: dict[str, pa.DataType],
+    enums: bool,
+) -> tuple[float, int]:
+    """
+    Load the archive into a new DuckDB file.
+
+    Returns:
+        Parse and load time in seconds and the largest block in bytes
+    """
+    largest = 0
+
+    def batches(reader: pa.RecordBatchReader):
+        nonlocal largest
+        for batch in reader:
+            largest = max(largest, batch.nbytes)
+            yield batch
+
+    start = time.perf_counter()
+    with duckdb.connect(str(path)) as conn, open_archive(str(archive)) as (zf, _, _):
+        reader = read_member(zf, zf.namelist()[0], column_types=column_types)
+        conn.register(
+            'batches', pa.RecordBatchReader.from_batches(reader.schema, batches(reader))
+        )
+        conn.execute('create table validacijas as select * from batches')
+        if enums:
+            for column in ENUM_COLUMNS:
+                conn.execute(
+                    f"""
+                    create type {column}_enum as enum (
+                        select distinct {column} from validacijas
+                        where {column} is not null order by 1
+                    );
+                    alter table validacijas
+                        alter {column} type {column}_enum using {column}::{column}_enum;
+                    """
+                )
+        conn.execute('checkpoint')
+    return time.perf_counter() - start, largest
+
+
+def main() -> None:
+    """
+    Compare the text, compact and enum schemas of validacijas.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    schemas = {
+        'text': (TEXT_TYPES, False),
+        'compact': (COLUMN_TYPES, False),
+        'enum': (COLUMN_TYPES, True),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = Path(tmp) / 'ValidDati05_25.zip'
+        create_archive(archive, args.rows)
+        rows: dict[str, list[str]] = {}
+        for name, (column_types, enums) in schemas.items():
+            path = Path(tmp) / f'{name}.duckdb'
+            seconds, largest = load(path, archive, column_types, enums)
+            parquet = path.with_suffix('.parquet')
+            with duckdb.connect(str(path), read_only=True) as conn:
+                conn.execute(f"copy validacijas to '{parquet.as_posix()}'")
+                rows.setdefault('load s', []).append(f'{seconds:.2f}')
+                rows.setdefault('largest block MB', []).append(f'{largest / 2**20:.1f}')
+                rows.setdefault('DuckDB MB', []).append(
+                    f'{path.stat().st_size / 2**20:.1f}'
+                )
+                rows.setdefault('Parquet MB', []).append(
+                    f'{parquet.stat().st_size / 2**20:.1f}'
+                )
+                for label, query in QUERIES.items():
+                    ms = median_ms(
+                        lambda q=query: conn.execute(
+                            q, {'tr_types': ['Tramvajs']} if '$' in q else None
+                        ).fetchall(),
+                        args.runs,
+                    )
+                    rows.setdefault(f'{label} ms', []).append(f'{ms:.1f}')
+
+        print(f'{"":<32}' + ''.join(f'{name:>10}' for name in schemas))
+        for label, values in rows.items():
+            print(f'{label:<32}' + ''.join(f'{value:>10}' for value in values))
+        print(f'{args.rows:,} rows, median of {args.runs} runs')
+
+
+if __name__ == '__main__':
+    main()
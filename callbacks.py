@@ -32,15 +32,18 @@ def form_submit(session_state: SessionStateProxy) -> None:
         )
         return
 
-    update_available_tr_types(
-        db=db,
-        session_state=session_state,
-        date_range=date_range,
-    )
-
-    update_metrics(
-        db=db,
-        session_state=session_state,
-        date_range=date_range,
-        tr_types=selected_tr_types,
-    )
+    try:
+        update_available_tr_types(
+            db=db,
+            session_state=session_state,
+            date_range=date_range,
+        )
+
+        update_metrics(
+            db=db,
+            session_state=session_state,
+            date_range=date_range,
+            tr_types=selected_tr_types,
+        )
+    except TimeoutError as error:
+        st.toast(body=str(error), icon=':material/timer_off:')
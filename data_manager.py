@@ -2,15 +2,31 @@
 Database query functions.
 """
 
+from collections.abc import Callable
 from datetime import date
 from enum import Enum
+from functools import partial
+from time import perf_counter
 from typing import Final
 
+import duckdb
+import polars as pl
 import streamlit as st
-from dateutil.rrule import MONTHLY, rrule
 from polars import DataFrame
 
 from database import DatabaseConnection
+from instrumentation import (
+    CacheOutcome,
+    QueryRecord,
+    explain_analyze,
+    param_shape,
+    query_log,
+    tracked,
+)
+from query_router import Grain, RoutedQuery, Source, get_rollup_coverage, render
+from result_cache import ResultCache, result_cache
+from rollups import INGEST_LOG_TABLE
+from single_flight import in_flight
 
 
 class SpinnerMessages(str, Enum):
@@ -19,54 +35,119 @@ class SpinnerMessages(str, Enum):
     """
 
     AVAILABLE_MONTHS = 'Atlasa datubāzē pieejamo laika periodu...'
-    AVAILABLE_TR_TYPES = 'Atlasa pieejamos transporta veidus...'
     METRICS = 'Lejuplādē datus...'
 
 
+class MonthMetric(str, Enum):
+    """
+    Month level metrics assembled from the SQL_MONTH_COMPONENTS rows.
+    """
+
+    RIDES_PER_DAY = 'rides_per_day'
+    PEAK_HOUR = 'peak_hour'
+    POPULAR_ROUTES = 'popular_routes'
+    TR_DISTRIBUTION = 'tr_distribution'
+    PEAK_DAY = 'peak_day'
+    ROUTE_DENSITY = 'route_density'
+
+
+# ISO day of week names for the peak day metric
+DAY_NAMES: Final[dict[int, str]] = {
+    1: 'Pirmdiena',
+    2: 'Otrdiena',
+    3: 'Trešdiena',
+    4: 'Ceturtdiena',
+    5: 'Piektdiena',
+    6: 'Sestdiena',
+    7: 'Svētdiena',
+}
+
 # SQL query constants
+#
+# The {source} placeholders are filled in by query_router with the cheapest table
+# that has the needed grain: a rollup from rollups.py or the raw validacijas table.
 
-SQL_AVAILABLE_MONTHS: Final[str] = """--sql
+# Sequence number of the latest ingest. Checked on every rerun, so it reads a single
+# aggregate of the small ingest log.
+SQL_WATERMARK: Final[str] = f"""--sql
     select
-        date(min(Laiks)) as min_date,
-        date(max(Laiks)) as max_date
+        coalesce(max(seq), 0) as watermark
     from
-        validacijas;
+        {INGEST_LOG_TABLE};
     """
 
-SQL_AVAILABLE_TR_TYPES: Final[str] = """--sql
+# Data version of databases without an ingest log, such as a Parquet data directory.
+# DuckDB answers the count from table or Parquet footer metadata, without a scan.
+SQL_ROW_COUNT: Final[str] = f"""--sql
     select
-        distinct TranspVeids
+        count(*) as row_count
     from
-        validacijas
-    {where_clause}
-    order by
-        TranspVeids;
+        {Source.RAW.value};
     """
 
-SQL_TOTAL_RIDES: Final[str] = """--sql
+SQL_INGEST_LOG: Final[str] = f"""--sql
     select
-        count(*) as total_rides,
-        round(count(*) / count(distinct date(Laiks)), 0) as avg_rides_per_day,
-        date_trunc('month', Laiks) as moy
+        seq,
+        loaded_from,
+        loaded_until
     from
-        validacijas
-    {where_clause}
-    group by moy
-    order by moy;
+        {INGEST_LOG_TABLE}
+    order by seq;
     """
 
-SQL_RIDES_PER_DAY: Final[str] = """--sql
+# Months and transport types present in the data. Answered from the monthly summary,
+# which is refreshed at ingest time, so the lookup never scans the fact table.
+SQL_CATALOG: Final[RoutedQuery] = RoutedQuery(
+    name='catalog',
+    grains={'source': Grain.MONTH},
+    sql="""--sql
+    select
+        month,
+        TranspVeids,
+        sum(ride_count)::BIGINT as ride_count
+    from
+        {source}
+    group by all
+    order by all;
+    """,
+)
+
+# Additive per month components of the month totals. day_mask has a bit set for
+# every day of month with data, so OR-ing the masks of several transport types
+# counts their distinct days.
+SQL_TOTAL_RIDES_COMPONENTS: Final[RoutedQuery] = RoutedQuery(
+    name='total_rides_components',
+    grains={'source': Grain.MONTH},
+    sql="""--sql
     select
-        count(*) as total_rides,
-        date_trunc('day', Laiks) as dom
+        month,
+        sum(ride_count)::BIGINT as ride_count,
+        bit_or(day_mask) as day_mask
     from
-        validacijas
-    {where_clause}
+        {source}
+    group by month
+    order by month;
+    """,
+)
+
+SQL_RIDES_PER_DAY: Final[RoutedQuery] = RoutedQuery(
+    name='rides_per_day',
+    grains={'source': Grain.DAY},
+    sql="""--sql
+    select
+        sum(ride_count)::BIGINT as total_rides,
+        day::TIMESTAMP as dom
+    from
+        {source}
     group by dom
     order by dom;
-    """
+    """,
+)
 
-SQL_PEAK_HOUR: Final[str] = """--sql
+SQL_PEAK_HOUR: Final[RoutedQuery] = RoutedQuery(
+    name='peak_hour',
+    grains={'source': Grain.HOUR},
+    sql="""--sql
     with hs as
     (
         select range as hour from range(24)
@@ -74,12 +155,11 @@ SQL_PEAK_HOUR: Final[str] = """--sql
     hd as
     (
         select
-            count(*) as ride_count,
-            hour(Laiks) as hour,
-            count(distinct date(Laiks)) as distinct_days
+            sum(ride_count) as ride_count,
+            hour,
+            count(distinct day) as distinct_days
         from
-            validacijas
-        {where_clause}
+            {source}
         group by hour
     )
     select
@@ -93,41 +173,50 @@ SQL_PEAK_HOUR: Final[str] = """--sql
     left join
         hd on hs.hour = hd.hour
     order by hs.hour;
-    """
+    """,
+)
 
-SQL_POPULAR_ROUTES: Final[str] = """--sql
+SQL_POPULAR_ROUTES: Final[RoutedQuery] = RoutedQuery(
+    name='popular_routes',
+    grains={'source': Grain.DAY},
+    sql="""--sql
     select
-        count(*) as 'Braucienu skaits',
+        sum(ride_count)::BIGINT as 'Braucienu skaits',
         TMarsruts as 'Maršruts',
     from
-        validacijas
-    {where_clause}
-    group by Tmarsruts
-    order by count(*) desc
+        {source}
+    group by TMarsruts
+    order by sum(ride_count) desc, TMarsruts
     limit 15;
-    """
+    """,
+)
 
-SQL_TR_DISTRIBUTION: Final[str] = """--sql
+SQL_TR_DISTRIBUTION: Final[RoutedQuery] = RoutedQuery(
+    name='tr_distribution',
+    grains={'source': Grain.DAY},
+    sql="""--sql
     select
-        count(*) as 'Braucienu skaits',
+        sum(ride_count)::BIGINT as 'Braucienu skaits',
         TranspVeids as 'Transporta veids'
     from
-        validacijas
-    {where_clause}
+        {source}
     group by TranspVeids
-    order by count(*) desc;
-    """
+    order by sum(ride_count) desc, TranspVeids;
+    """,
+)
 
-SQL_PEAK_DAY: Final[str] = """--sql
+SQL_PEAK_DAY: Final[RoutedQuery] = RoutedQuery(
+    name='peak_day',
+    grains={'source': Grain.DAY},
+    sql="""--sql
     with dow as
     (
         select
-            isodow(Laiks) as dow,
-            round(count(*) / count(distinct date(Laiks)), 0) as avg_rides_per_day
+            isodow(day) as dow,
+            round(sum(ride_count) / count(distinct day), 0) as avg_rides_per_day
         from
-            validacijas
-        {where_clause}
-        group by isodow(Laiks)
+            {source}
+        group by isodow(day)
     )
     select
         case dow
@@ -143,49 +232,84 @@ SQL_PEAK_DAY: Final[str] = """--sql
     from
         dow
     order by dow;
-    """
+    """,
+)
 
-SQL_ROUTE_DENSITY: Final[str] = """--sql
+SQL_ROUTE_DENSITY: Final[RoutedQuery] = RoutedQuery(
+    name='route_density',
+    grains={'source': Grain.VEHICLE},
+    sql="""--sql
     select
         TMarsruts as 'Maršruts',
-        round(count(*) / count(distinct GarNr), 0) as 'Vidējais braucienu skaits'
+        round(sum(ride_count) / count(distinct GarNr), 0) as 'Vidējais braucienu skaits'
     from
-        validacijas
-    {where_clause}
+        {source}
     group by TMarsruts
-    order by count(*) desc
+    order by sum(ride_count) desc, TMarsruts
     limit 15;
-    """
+    """,
+)
 
+# Additive components of all month metrics: ride counts per day and hour, and per
+# route and vehicle. Keeping the days and vehicles lets the distinct day and
+# distinct vehicle counts be recomputed exactly for any set of transport types.
+SQL_MONTH_COMPONENTS: Final[RoutedQuery] = RoutedQuery(
+    name='month_components',
+    grains={'hourly': Grain.HOUR, 'vehicles': Grain.VEHICLE},
+    sql="""--sql
+    select
+        'hour' as component,
+        day,
+        hour,
+        sum(ride_count)::BIGINT as ride_count
+    from
+        {hourly}
+    group by day, hour
+    union all by name
+    select
+        'vehicle' as component,
+        TranspVeids,
+        TMarsruts,
+        GarNr,
+        sum(ride_count)::BIGINT as ride_count
+    from
+        {vehicles}
+    group by TranspVeids, TMarsruts, GarNr;
+    """,
+)
 
-def _get_data_with_filters(
+
+def _build_query(
     db: DatabaseConnection,
-    sql_query: str,
-    up_to_date: date | None = None,
-    date_range: tuple[date, date] | None = None,
+    sql_query: str | RoutedQuery,
+    date_range: tuple[date | None, date] | None = None,
     tr_types: list[str] | None = None,
-) -> DataFrame:
+) -> tuple[str, dict[str, date | list[str]]]:
     """
-    Get data with optional date and transport type filtering.
+    Build query string and parameters for the date and transport type filters.
+
+    A date range without a start date selects all dates up to its end. Plain string
+    queries run against the raw validacijas table and get their {where_clause}
+    placeholder filled in. Routed queries get their sources from query_router.
     """
     where_clauses: list[str] = []
     params: dict[str, date | list[str]] = {}
+    start_date, end_date = date_range or (None, None)
 
-    if date_range and len(date_range) == 2:
-        start_date, end_date = date_range
+    if start_date:
         date_clause = """--sql
-            Laiks >= $start_date and Laiks < $end_date::DATE + 1
+            {date_column} >= $start_date and {date_column} < $end_date::DATE + 1
             """
         where_clauses.append(date_clause)
         params['start_date'] = start_date
         params['end_date'] = end_date
 
-    elif up_to_date:
+    elif end_date:
         up_to_date_clause = """--sql
-            Laiks < $up_to_date::DATE + 1
+            {date_column} < $up_to_date::DATE + 1
             """
         where_clauses.append(up_to_date_clause)
-        params['up_to_date'] = up_to_date
+        params['up_to_date'] = end_date
 
     if tr_types:
         tr_clause = """--sql
@@ -194,193 +318,417 @@ def _get_data_with_filters(
         where_clauses.append(tr_clause)
         params['tr_types'] = tr_types
 
-    where_clause = 'where ' + ' and '.join(where_clauses) if where_clauses else ''
+    def where_clause(date_column: str) -> str:
+        if not where_clauses:
+            return ''
+        clause = 'where ' + ' and '.join(where_clauses)
+        return clause.format(date_column=date_column)
 
-    query = sql_query.format(where_clause=where_clause)
+    if isinstance(sql_query, RoutedQuery):
+        query = render(
+            query=sql_query,
+            coverage=get_rollup_coverage(db),
+            where_clause=where_clause,
+            date_range=(start_date, end_date) if start_date else None,
+            up_to_date=None if start_date else end_date,
+        )
+    else:
+        query = sql_query.format(where_clause=where_clause('Laiks'))
 
-    rel = db.get_relation(query, params)
-    return rel.pl()
+    return query, params
 
 
-@st.cache_data(
-    show_spinner=SpinnerMessages.AVAILABLE_MONTHS.value,
-    show_time=True,
-)
-def get_available_months(_db: DatabaseConnection) -> list[date]:
-    """
-    Get available months from database.
-    """
-    rel_bounds = _db.get_relation(SQL_AVAILABLE_MONTHS)
-    bounds = rel_bounds.fetchone()
-    if bounds is None:
-        raise ValueError('Datubāzē netika atrasta kolonna "Laiks".')
-    start_date, end_date = bounds
-    # Normalize the dates to start of month
-
-    start_date = date(start_date.year, start_date.month, 1)
-    end_date = date(end_date.year, end_date.month, 1)
-
-    # Use the min and max value of column 'Laiks' to create a list of months inbetween
-    res: list[date] = []
-    for i in rrule(
-        freq=MONTHLY,
-        dtstart=start_date,
-        until=end_date,
-    ):
-        res.append(i.date())
-    return res
-
-
-@st.cache_data(
-    show_spinner=SpinnerMessages.AVAILABLE_TR_TYPES.value,
-    show_time=True,
-)
-def get_available_tr_types(
-    _db: DatabaseConnection,
-    date_range: tuple[date, date],
+def _get_data_with_filters(
+    db: DatabaseConnection,
+    sql_query: str | RoutedQuery,
+    date_range: tuple[date | None, date] | None = None,
+    tr_types: list[str] | None = None,
+    *,
+    data_version: int = 0,
 ) -> DataFrame:
     """
-    Get available transport types based on current filters.
+    Get data with optional date and transport type filtering.
+
+    A date range without a start date selects all dates up to its end.
+
+    Results with a data version are also looked up in and stored to the persistent
+    result cache, when it is enabled. Concurrent identical calls share one execution,
+    waiting for it at most the query timeout and only while their scope is active.
     """
-    return _get_data_with_filters(
-        db=_db,
-        sql_query=SQL_AVAILABLE_TR_TYPES,
-        date_range=date_range,
+    query, params = _build_query(db, sql_query, date_range, tr_types)
+    name = sql_query.name if isinstance(sql_query, RoutedQuery) else 'query'
+    key = ResultCache.key(query, params, str(data_version))
+    cache_key = key if result_cache.enabled and data_version else None
+
+    start = perf_counter()
+    df, shared = in_flight.do(
+        key,
+        partial(_load, db, query, params, name, cache_key),
+        scope=db.current_scope,
+        timeout=db.query_timeout_s,
     )
+    if shared:
+        query_log.log(
+            _record(name, perf_counter() - start, df, params, CacheOutcome.SHARED)
+        )
+    return df
 
 
-@st.cache_data(
-    show_spinner=SpinnerMessages.METRICS.value,
-    show_time=True,
-)
-def get_total_rides(
-    _db: DatabaseConnection,
-    up_to_date: date,
-    tr_types: list[str] | None = None,
+def _load(
+    db: DatabaseConnection,
+    query: str,
+    params: dict[str, date | list[str]],
+    name: str,
+    cache_key: str | None,
 ) -> DataFrame:
     """
-    Get count of rides for each month up to selected month (excluding).
+    Read query result from the persistent result cache or run the query.
     """
-    return _get_data_with_filters(
-        db=_db,
-        sql_query=SQL_TOTAL_RIDES,
-        up_to_date=up_to_date,
-        tr_types=tr_types,
+    if cache_key is None:
+        return _fetch(db, query, params, name)
+
+    start = perf_counter()
+    df = result_cache.get(cache_key)
+    if df is not None:
+        query_log.log(
+            _record(name, perf_counter() - start, df, params, CacheOutcome.HIT)
+        )
+        return df
+    df = _fetch(db, query, params, name, CacheOutcome.MISS)
+    result_cache.put(cache_key, df)
+    return df
+
+
+def _fetch(
+    db: DatabaseConnection,
+    query: str,
+    params: dict[str, date | list[str]],
+    name: str,
+    cache: str = CacheOutcome.OFF,
+) -> DataFrame:
+    """
+    Run query on the session's cursor and record its timing to the query log.
+    """
+    start = perf_counter()
+    with db.cursor():
+        rel = db.get_relation(query, params)
+        df = rel.pl()
+    query_log.log(
+        _record(name, perf_counter() - start, df, params, cache),
+        partial(explain_analyze, db, query, params),
     )
+    return df
 
 
-@st.cache_data(show_spinner=SpinnerMessages.METRICS.value, show_time=True)
-def get_rides_per_day(
-    _db: DatabaseConnection,
-    date_range: tuple[date, date],
-    tr_types: list[str] | None = None,
+def _record(
+    name: str,
+    wall_s: float,
+    df: DataFrame,
+    params: dict[str, date | list[str]],
+    cache: str,
+) -> QueryRecord:
+    """
+    Query record of a result.
+    """
+    return QueryRecord(
+        name=name,
+        wall_s=wall_s,
+        rows=df.height,
+        bytes=df.estimated_size(),
+        params=param_shape(params),
+        cache=cache,
+    )
+
+
+def _collect_components(
+    fetch: Callable[[str | None], DataFrame],
+    tr_types: list[str] | None,
 ) -> DataFrame:
     """
-    Get count of rides for each day of the selected month.
+    Concatenate the cached components of every selected transport type.
+
+    Types are de-duplicated and sorted, so any selection order reuses the same
+    cache entries. No selection fetches the unfiltered components.
+    """
+    if not tr_types:
+        return fetch(None)
+    return pl.concat([fetch(tr_type) for tr_type in sorted(set(tr_types))])
+
+
+def _avg(total: pl.Expr, count: pl.Expr) -> pl.Expr:
+    """
+    Average rounded like the SQL round(x, 0).
+    """
+    return (total / count).round(0, mode='half_away_from_zero')
+
+
+def _merge_total_rides(df: DataFrame) -> DataFrame:
+    """
+    Merge SQL_TOTAL_RIDES_COMPONENTS rows into month totals and daily averages.
+    """
+    return (
+        df.group_by('month')
+        .agg(pl.col('ride_count').sum(), pl.col('day_mask').bitwise_or())
+        .sort('month')
+        .select(
+            pl.col('ride_count').alias('total_rides'),
+            _avg(pl.col('ride_count'), pl.col('day_mask').bitwise_count_ones()).alias(
+                'avg_rides_per_day'
+            ),
+            pl.col('month').cast(pl.Datetime('us')).alias('moy'),
+        )
+    )
+
+
+def _merge_month_components(df: DataFrame) -> dict[MonthMetric, DataFrame]:
+    """
+    Merge SQL_MONTH_COMPONENTS rows into DataFrames of the single metric queries.
+    """
+    hours = df.filter(pl.col('component') == 'hour')
+    vehicles = df.filter(pl.col('component') == 'vehicle')
+
+    days = hours.group_by('day').agg(pl.col('ride_count').sum()).sort('day')
+    routes = (
+        vehicles.group_by('TMarsruts')
+        .agg(pl.col('ride_count').sum(), pl.col('GarNr').n_unique().alias('vehicles'))
+        .sort(['ride_count', 'TMarsruts'], descending=[True, False])
+        .head(15)
+    )
+
+    return {
+        MonthMetric.RIDES_PER_DAY: days.select(
+            pl.col('ride_count').alias('total_rides'),
+            pl.col('day').cast(pl.Datetime('us')).alias('dom'),
+        ),
+        MonthMetric.PEAK_HOUR: pl.DataFrame({'hour': range(24)})
+        .join(
+            hours.group_by('hour').agg(
+                _avg(pl.col('ride_count').sum(), pl.col('day').n_unique()).alias(
+                    'avg_rides_per_hour'
+                )
+            ),
+            on='hour',
+            how='left',
+        )
+        .with_columns(pl.col('avg_rides_per_hour').fill_null(0.0)),
+        MonthMetric.POPULAR_ROUTES: routes.select(
+            pl.col('ride_count').alias('Braucienu skaits'),
+            pl.col('TMarsruts').alias('Maršruts'),
+        ),
+        MonthMetric.TR_DISTRIBUTION: vehicles.group_by('TranspVeids')
+        .agg(pl.col('ride_count').sum())
+        .sort(['ride_count', 'TranspVeids'], descending=[True, False])
+        .select(
+            pl.col('ride_count').alias('Braucienu skaits'),
+            pl.col('TranspVeids').alias('Transporta veids'),
+        ),
+        MonthMetric.PEAK_DAY: days.group_by(pl.col('day').dt.weekday().alias('dow'))
+        .agg(_avg(pl.col('ride_count').sum(), pl.len()).alias('avg_rides_per_day'))
+        .sort('dow')
+        .select(
+            pl.col('dow').replace_strict(DAY_NAMES).alias('Nedēļas diena'),
+            pl.col('avg_rides_per_day').alias('Braucieni vidēji dienā'),
+        ),
+        MonthMetric.ROUTE_DENSITY: routes.select(
+            pl.col('TMarsruts').alias('Maršruts'),
+            _avg(pl.col('ride_count'), pl.col('vehicles')).alias(
+                'Vidējais braucienu skaits'
+            ),
+        ),
+    }
+
+
+@tracked(st.cache_data(ttl=5, show_spinner=False))
+def get_watermark(_db: DatabaseConnection) -> int:
+    """
+    Get the sequence number of the latest ingest.
+
+    Without an ingest log the row count of the raw table is the watermark, so the
+    persistent result cache stays enabled and is invalidated when rows are loaded.
+    It is 0 when neither table exists. Checked on every rerun, so the value is
+    cached for a few seconds.
+    """
+    try:
+        with _db.cursor():
+            row = _db.get_relation(SQL_WATERMARK).fetchone()
+    except duckdb.CatalogException:
+        try:
+            with _db.cursor():
+                row = _db.get_relation(SQL_ROW_COUNT).fetchone()
+        except duckdb.CatalogException:
+            return 0
+    return row[0] if row else 0
+
+
+@tracked(st.cache_data(show_spinner=False))
+def get_ingest_log(_db: DatabaseConnection, watermark: int) -> DataFrame:
+    """
+    Get the ingest log up to watermark, empty when the database has none.
+    """
+    try:
+        return _fetch(_db, SQL_INGEST_LOG, {}, 'ingest_log')
+    except duckdb.CatalogException:
+        return pl.DataFrame(
+            schema={'seq': pl.Int64, 'loaded_from': pl.Date, 'loaded_until': pl.Date}
+        )
+
+
+def get_data_version(
+    _db: DatabaseConnection,
+    watermark: int,
+    date_range: tuple[date | None, date | None],
+) -> int:
+    """
+    Get the data version of a date range.
+
+    It is the latest ingest that loaded any of the dates. Getters are cached by this
+    version, so only their entries whose dates were loaded again are invalidated.
+    Open range and log bounds are unbounded. Without an ingest log every date range
+    has the watermark as its version.
+    """
+    if not watermark:
+        return 0
+    start_date, end_date = date_range
+    log = get_ingest_log(_db, watermark)
+    if log.is_empty():
+        return watermark
+    log = log.filter(
+        pl.col('loaded_from').is_null()
+        | (pl.col('loaded_from') <= (end_date or date.max)),
+        pl.col('loaded_until').is_null()
+        | (pl.col('loaded_until') >= (start_date or date.min)),
+    )
+    return log.select(pl.col('seq').max()).item() or 0
+
+
+@tracked(
+    st.cache_data(
+        show_spinner=SpinnerMessages.AVAILABLE_MONTHS.value,
+        show_time=True,
+    )
+)
+def get_catalog(_db: DatabaseConnection, data_version: int = 0) -> DataFrame:
+    """
+    Get ride counts for every month and transport type present in the database.
     """
     return _get_data_with_filters(
         db=_db,
-        sql_query=SQL_RIDES_PER_DAY,
-        date_range=date_range,
-        tr_types=tr_types,
+        sql_query=SQL_CATALOG,
+        data_version=data_version,
     )
 
 
-@st.cache_data(
-    show_spinner=SpinnerMessages.METRICS.value,
-    show_time=True,
-)
-def get_peak_hour(
+def get_available_months(_db: DatabaseConnection, watermark: int = 0) -> list[date]:
+    """
+    Get the months that have data in the catalog.
+
+    Months without any validations are left out, so the list has gaps where the
+    data has them.
+    """
+    months = get_catalog(_db, watermark).get_column('month').unique().sort()
+    if months.is_empty():
+        raise ValueError('Datubāzē netika atrasti validāciju dati.')
+    return months.to_list()
+
+
+def get_available_tr_types(
     _db: DatabaseConnection,
     date_range: tuple[date, date],
-    tr_types: list[str] | None = None,
+    watermark: int = 0,
 ) -> DataFrame:
     """
-    Get the count for number of rides per each hour of day.
+    Get available transport types in the months of the date range from the catalog.
     """
-    return _get_data_with_filters(
-        db=_db,
-        sql_query=SQL_PEAK_HOUR,
-        date_range=date_range,
-        tr_types=tr_types,
+    start_date, end_date = date_range
+    return (
+        get_catalog(_db, watermark)
+        .filter(
+            pl.col('month') >= start_date.replace(day=1),
+            pl.col('month') <= end_date,
+        )
+        .select(pl.col('TranspVeids').unique().sort())
     )
 
 
-@st.cache_data(
-    show_spinner=SpinnerMessages.METRICS.value,
-    show_time=True,
+@tracked(
+    st.cache_data(
+        show_spinner=SpinnerMessages.METRICS.value,
+        show_time=True,
+    )
 )
-def get_popular_routes(
+def get_total_rides_components(
     _db: DatabaseConnection,
-    date_range: tuple[date, date],
-    tr_types: list[str] | None = None,
+    up_to_date: date,
+    tr_type: str | None = None,
+    data_version: int = 0,
 ) -> DataFrame:
     """
-    Get the list of routes ordered by count of rides.
+    Get month total components of one transport type, or of all when None.
     """
     return _get_data_with_filters(
         db=_db,
-        sql_query=SQL_POPULAR_ROUTES,
-        date_range=date_range,
-        tr_types=tr_types,
+        sql_query=SQL_TOTAL_RIDES_COMPONENTS,
+        date_range=(None, up_to_date),
+        tr_types=[tr_type] if tr_type else None,
+        data_version=data_version,
     )
 
 
-@st.cache_data(
-    show_spinner=SpinnerMessages.METRICS.value,
-    show_time=True,
-)
-def get_tr_distribution(
+def get_total_rides(
     _db: DatabaseConnection,
-    date_range: tuple[date, date],
+    up_to_date: date,
     tr_types: list[str] | None = None,
+    watermark: int = 0,
 ) -> DataFrame:
     """
-    Get the distribution of rides between the transport types.
+    Get count of rides for each month up to selected month (excluding).
     """
-    return _get_data_with_filters(
-        db=_db,
-        sql_query=SQL_TR_DISTRIBUTION,
-        date_range=date_range,
-        tr_types=tr_types,
+    version = get_data_version(_db, watermark, (None, up_to_date))
+    return _merge_total_rides(
+        _collect_components(
+            partial(get_total_rides_components, _db, up_to_date, data_version=version),
+            tr_types,
+        )
     )
 
 
-@st.cache_data(
-    show_spinner=SpinnerMessages.METRICS.value,
-    show_time=True,
+@tracked(
+    st.cache_data(
+        show_spinner=SpinnerMessages.METRICS.value,
+        show_time=True,
+    )
 )
-def get_peak_day(
+def get_month_components(
     _db: DatabaseConnection,
     date_range: tuple[date, date],
-    tr_types: list[str] | None = None,
+    tr_type: str | None = None,
+    data_version: int = 0,
 ) -> DataFrame:
     """
-    Get the average count of rides per each day of week in month.
+    Get month metric components of one transport type, or of all when None.
     """
     return _get_data_with_filters(
         db=_db,
-        sql_query=SQL_PEAK_DAY,
+        sql_query=SQL_MONTH_COMPONENTS,
         date_range=date_range,
-        tr_types=tr_types,
+        tr_types=[tr_type] if tr_type else None,
+        data_version=data_version,
     )
 
 
-@st.cache_data(
-    show_spinner=SpinnerMessages.METRICS.value,
-    show_time=True,
-)
-def get_route_density(
+def get_month_metrics(
     _db: DatabaseConnection,
     date_range: tuple[date, date],
     tr_types: list[str] | None = None,
-) -> DataFrame:
+    watermark: int = 0,
+) -> dict[MonthMetric, DataFrame]:
     """
-    Get ridership density (rides per vehicle) for top routes.
+    Get all month level metrics from the cached per transport type components.
     """
-    return _get_data_with_filters(
-        db=_db,
-        sql_query=SQL_ROUTE_DENSITY,
-        date_range=date_range,
-        tr_types=tr_types,
+    version = get_data_version(_db, watermark, date_range)
+    return _merge_month_components(
+        _collect_components(
+            partial(get_month_components, _db, date_range, data_version=version),
+            tr_types,
+        )
     )
@@ -1,11 +1,228 @@
 """
-DuckDB MotherDuck database connection.
+DuckDB database connection.
+
+Supports MotherDuck (default), a local DuckDB file or a directory of Parquet files.
 """
 
+import hashlib
 import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from datetime import date, datetime
+from enum import Enum
+from pathlib import Path
 
 import duckdb
+import polars as pl
+import pyarrow as pa
 import streamlit as st
+from polars import DataFrame
+
+DEFAULT_BATCH_SIZE = 100_000
+
+
+class Backend(str, Enum):
+    """
+    Supported database backends.
+    """
+
+    MOTHERDUCK = 'motherduck'
+    DUCKDB = 'duckdb'
+    PARQUET = 'parquet'
+
+
+@dataclass
+class PoolStats:
+    """
+    Cursor pool usage counters.
+    """
+
+    size: int
+    created: int = 0
+    in_use: int = 0
+    checkouts: int = 0
+    waits: int = 0
+    total_wait_s: float = 0.0
+    max_wait_s: float = 0.0
+
+
+@dataclass(frozen=True)
+class ConnectionOptions:
+    """
+    Cursor pool and query options of a DatabaseConnection.
+
+    Attributes:
+        pool_size: maximum number of cursors used concurrently
+        query_timeout_s: seconds after which a query is interrupted, None waits
+            forever
+        prepare_statements: prepare parametrized queries once per cursor and
+            execute them with the parameter values
+    """
+
+    pool_size: int = 8
+    query_timeout_s: float | None = None
+    prepare_statements: bool = False
+
+
+class CursorPool:
+    """
+    Bounded pool of DuckDB cursors with per-thread affinity.
+
+    Cursors are created lazily with `conn.cursor()` up to `size`. A thread gets
+    back the cursor it used last time whenever that cursor is idle.
+    """
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection, size: int):
+        """
+        Initialize an empty pool of at most size cursors of conn.
+        """
+        if size < 1:
+            raise ValueError('Kursoru pūla izmēram jābūt vismaz 1.')
+
+        self._conn = conn
+        self._idle: list[duckdb.DuckDBPyConnection] = []
+        self._condition = threading.Condition()
+        self._affinity = threading.local()
+        self._stats = PoolStats(size=size)
+
+    @property
+    def stats(self) -> PoolStats:
+        """
+        Get a snapshot of the pool counters.
+        """
+        with self._condition:
+            return replace(self._stats)
+
+    def checkout(self, timeout: float | None = None) -> duckdb.DuckDBPyConnection:
+        """
+        Take a cursor from the pool, waiting for one to be returned if needed.
+
+        Args:
+            timeout: seconds to wait for a free cursor, None waits forever
+
+        Returns:
+            A cursor that must be given back with `checkin`
+
+        Raises:
+            TimeoutError: no cursor became free within `timeout`
+        """
+        start = time.perf_counter()
+        waited = False
+        with self._condition:
+            while (cursor := self._take_idle()) is None:
+                if self._stats.created < self._stats.size:
+                    cursor = self._conn.cursor()
+                    self._stats.created += 1
+                    break
+                waited = True
+                remaining = (
+                    None if timeout is None else timeout - (time.perf_counter() - start)
+                )
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError('Neizdevās iegūt brīvu datubāzes kursoru.')
+                self._condition.wait(timeout=remaining)
+
+            wait_s = time.perf_counter() - start
+            self._stats.checkouts += 1
+            self._stats.in_use += 1
+            if waited:
+                self._stats.waits += 1
+                self._stats.total_wait_s += wait_s
+                self._stats.max_wait_s = max(self._stats.max_wait_s, wait_s)
+
+        self._affinity.cursor = cursor
+        return cursor
+
+    def checkin(self, cursor: duckdb.DuckDBPyConnection) -> None:
+        """
+        Return a cursor to the pool.
+        """
+        with self._condition:
+            self._idle.append(cursor)
+            self._stats.in_use -= 1
+            self._condition.notify()
+
+    def _take_idle(self) -> duckdb.DuckDBPyConnection | None:
+        """
+        Pop an idle cursor, preferring the one last used by this thread.
+        """
+        preferred = getattr(self._affinity, 'cursor', None)
+        for i, cursor in enumerate(self._idle):
+            if cursor is preferred:
+                return self._idle.pop(i)
+        return self._idle.pop() if self._idle else None
+
+
+def _sql_literal(value: object) -> str:
+    """
+    Format a query parameter as an SQL literal, for EXECUTE of a prepared statement.
+
+    DuckDB does not bind parameters of an EXECUTE statement, so dates, strings,
+    numbers and lists of them are written as typed literals.
+    """
+    match value:
+        case bool() | int() | float():
+            return repr(value)
+        case datetime():
+            return f"TIMESTAMP '{value.isoformat(sep=' ')}'"
+        case date():
+            return f"DATE '{value.isoformat()}'"
+        case str():
+            return "'" + value.replace("'", "''") + "'"
+        case list() | tuple():
+            return '[' + ', '.join(_sql_literal(item) for item in value) + ']'
+        case _:
+            raise TypeError(f'Neatbalstīts vaicājuma parametra tips: {type(value)}.')
+
+
+class QueryScope:
+    """
+    Queries of one metrics update, interrupted together when it is superseded.
+
+    Cursors checked out within `DatabaseConnection.scope` are registered while
+    they are held. After `cancel`, running queries are interrupted and new
+    checkouts fail with duckdb.InterruptException.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize a scope without cursors.
+        """
+        self._lock = threading.Lock()
+        self._cursors: list[duckdb.DuckDBPyConnection] = []
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """
+        Interrupt the running queries of the scope and refuse new ones.
+
+        The cursors are interrupted under the lock that `discard` takes, so a
+        cursor cannot be given back to the pool and run a query of another
+        session meanwhile.
+        """
+        with self._lock:
+            self.cancelled = True
+            for cursor in self._cursors:
+                cursor.interrupt()
+
+    def add(self, cursor: duckdb.DuckDBPyConnection) -> None:
+        """
+        Register a cursor that is about to run queries of the scope.
+        """
+        with self._lock:
+            if self.cancelled:
+                raise duckdb.InterruptException('Vaicājums ir atcelts.')
+            self._cursors.append(cursor)
+
+    def discard(self, cursor: duckdb.DuckDBPyConnection) -> None:
+        """
+        Unregister a cursor given back to the pool.
+        """
+        with self._lock:
+            if cursor in self._cursors:
+                self._cursors.remove(cursor)
 
 
 class DatabaseConnection:
@@ -23,15 +240,36 @@ class DatabaseConnection:
                     cls._instance = super().__new__(cls)
         return cls._instance
 
-    def __init__(self: 'DatabaseConnection', token: str):
+    def __init__(
+        self: 'DatabaseConnection',
+        token: str | None = None,
+        backend: Backend = Backend.MOTHERDUCK,
+        path: str | None = None,
+        options: ConnectionOptions | None = None,
+    ):
         """
         Initialize the DatabaseConnection instance.
+
+        Args:
+            token: MotherDuck token, required for the MotherDuck backend
+            backend: which database backend to connect to
+            path: DuckDB file or Parquet directory for the local backends
+            options: cursor pool and query options, the defaults when None
         """
         if getattr(self, '_initialized', False):
             return
 
+        options = options or ConnectionOptions()
         self._conn: duckdb.DuckDBPyConnection | None = None
+        self._pool: CursorPool | None = None
+        self._pool_size = options.pool_size
+        self._query_timeout_s = options.query_timeout_s
+        self._prepare_statements = options.prepare_statements
+        self._prepared: dict[int, set[str]] = {}
+        self._local = threading.local()
         self._token = token
+        self._backend = Backend(backend)
+        self._path = path
         self._initialized = True
 
     @property
@@ -41,20 +279,130 @@ class DatabaseConnection:
         """
 
         if self._conn is None:
-            self._conn = self._create_connection(self._token)
+            self._conn = self._create_connection(
+                self._token,
+                self._backend,
+                self._path,
+            )
         return self._conn
 
+    @property
+    def pool(self) -> CursorPool:
+        """
+        Get the cursor pool of the cached connection.
+        """
+
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = CursorPool(self.conn, self._pool_size)
+        return self._pool
+
+    @contextmanager
+    def cursor(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """
+        Check out a cursor for the current thread.
+
+        Nested calls on the same thread reuse the outer cursor. Relations from
+        `get_relation` should be materialized while the cursor is held. The cursor
+        is registered in the thread's query scope and interrupted when it is held
+        longer than the query timeout.
+
+        Raises:
+            TimeoutError: no cursor became free, or the query did not finish,
+                within the query timeout
+            duckdb.InterruptException: the query scope was cancelled
+        """
+        current = getattr(self._local, 'cursor', None)
+        if current is not None:
+            yield current
+            return
+
+        cursor = self.pool.checkout(timeout=self._query_timeout_s)
+        self._local.cursor = cursor
+        scope: QueryScope | None = getattr(self._local, 'scope', None)
+        expired = threading.Event()
+        timer = None
+        if self._query_timeout_s is not None:
+
+            def expire() -> None:
+                expired.set()
+                cursor.interrupt()
+
+            timer = threading.Timer(self._query_timeout_s, expire)
+            timer.daemon = True
+            timer.start()
+        try:
+            if scope is not None:
+                scope.add(cursor)
+            yield cursor
+        except duckdb.InterruptException as error:
+            if expired.is_set():
+                raise TimeoutError(
+                    f'Vaicājums netika izpildīts {self._query_timeout_s} s laikā.'
+                ) from error
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if scope is not None:
+                scope.discard(cursor)
+            self._local.cursor = None
+            self.pool.checkin(cursor)
+
+    @property
+    def query_timeout_s(self) -> float | None:
+        """
+        Get the seconds after which a query is interrupted, None without a limit.
+        """
+        return self._query_timeout_s
+
+    @property
+    def current_scope(self) -> QueryScope | None:
+        """
+        Get the query scope of the current thread, None outside of `scope`.
+        """
+        return getattr(self._local, 'scope', None)
+
+    @contextmanager
+    def scope(self, scope: QueryScope) -> Iterator[QueryScope]:
+        """
+        Register the cursors checked out by the current thread in scope.
+        """
+        previous = getattr(self._local, 'scope', None)
+        self._local.scope = scope
+        try:
+            yield scope
+        finally:
+            self._local.scope = previous
+
     @staticmethod
     @st.cache_resource(show_spinner='Veido savienojumu ar datubāzi...', show_time=True)
-    def _create_connection(token: str) -> duckdb.DuckDBPyConnection:
+    def _create_connection(
+        token: str | None,
+        backend: Backend = Backend.MOTHERDUCK,
+        path: str | None = None,
+    ) -> duckdb.DuckDBPyConnection:
         """
-        Create cached DuckDB MotherDuck connection.
+        Create cached DuckDB connection for the selected backend.
         """
 
-        return duckdb.connect(
-            f'md:validacijas?motherduck_token={token}',
-            read_only=True,
-        )
+        match backend:
+            case Backend.MOTHERDUCK:
+                if not token:
+                    raise ValueError('MotherDuck savienojumam nepieciešams token.')
+                return duckdb.connect(
+                    f'md:validacijas?motherduck_token={token}',
+                    read_only=True,
+                )
+            case Backend.DUCKDB:
+                if not path:
+                    raise ValueError('Nav norādīts DuckDB datubāzes faila ceļš.')
+                return duckdb.connect(path, read_only=True)
+            case Backend.PARQUET:
+                if not path:
+                    raise ValueError('Nav norādīts Parquet datu direktorijas ceļš.')
+                return _connect_parquet(Path(path))
 
     def get_relation(
         self,
@@ -72,15 +420,143 @@ class DatabaseConnection:
             A DuckDBPyRelation that can be further modified before returning
             a result
         """
-        if sql_params:
-            result = self.conn.sql(
-                query=sql_query,
-                params=sql_params,
-            )
-        else:
-            result = self.conn.sql(query=sql_query)
+        with self.cursor() as cursor:
+            if sql_params and self._prepare_statements:
+                name = self._prepare(cursor, sql_query)
+                args = ', '.join(
+                    f'{key} := {_sql_literal(value)}'
+                    for key, value in sql_params.items()
+                )
+                result = cursor.sql(query=f'execute {name}({args})')
+            elif sql_params:
+                result = cursor.sql(
+                    query=sql_query,
+                    params=sql_params,
+                )
+            else:
+                result = cursor.sql(query=sql_query)
 
         return result
 
+    def _prepare(self, cursor: duckdb.DuckDBPyConnection, sql_query: str) -> str:
+        """
+        Prepare query on cursor unless it already is, and return the statement name.
+
+        Prepared statements belong to the cursor, so each pooled cursor prepares
+        every query shape once.
+        """
+        name = 'q_' + hashlib.sha1(sql_query.encode()).hexdigest()[:16]
+        with self._lock:
+            prepared = self._prepared.setdefault(id(cursor), set())
+        if name not in prepared:
+            cursor.execute(f'prepare {name} as {sql_query}')
+            prepared.add(name)
+        return name
+
+    @contextmanager
+    def stream(
+        self,
+        sql_query: str,
+        sql_params: dict | None = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> Iterator[pa.RecordBatchReader]:
+        """
+        Execute query and stream the result as Arrow record batches.
+
+        The stream holds its own cursor until the block exits, so other queries of
+        the thread do not interrupt it. Inside a `cursor` block the stream reuses the
+        thread's cursor instead, which must not run other queries until the stream
+        is closed, so a single-cursor pool does not deadlock. The reader must be
+        consumed inside the block.
+
+        Args:
+            sql_query: SQL query string
+            sql_params: dictionary of additional parameters to pass to SQL query
+            batch_size: maximum number of rows in a record batch
+
+        Yields:
+            A RecordBatchReader over the result
+
+        Raises:
+            TimeoutError: no cursor became free within the query timeout
+        """
+        current = getattr(self._local, 'cursor', None)
+        if current is None:
+            cursor = self.pool.checkout(timeout=self._query_timeout_s)
+        else:
+            cursor = current
+        try:
+            if sql_params:
+                relation = cursor.sql(query=sql_query, params=sql_params)
+            else:
+                relation = cursor.sql(query=sql_query)
+            reader = relation.to_arrow_reader(batch_size)
+            try:
+                yield reader
+            finally:
+                reader.close()
+        finally:
+            if current is None:
+                self.pool.checkin(cursor)
+
+    def iter_frames(
+        self,
+        sql_query: str,
+        sql_params: dict | None = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> Iterator[DataFrame]:
+        """
+        Execute query and yield the result as Polars DataFrames of batch_size rows.
+
+        The frames share memory with the Arrow batches, without a copy. The cursor is
+        returned when the iterator is exhausted or closed.
+        """
+        with self.stream(sql_query, sql_params, batch_size) as reader:
+            for batch in reader:
+                yield pl.DataFrame(batch)
+
+
+def _connect_parquet(directory: Path) -> duckdb.DuckDBPyConnection:
+    """
+    Create in-memory connection with a view for every table directory.
+
+    Each subdirectory of `directory` holds the Parquet files of one table and is
+    exposed as a view with the same name, e.g. `<directory>/validacijas/*.parquet`
+    becomes the `validacijas` view. Hidden directories, such as the staging
+    directory of ingest.py, are skipped. The year and month of Hive partitioned
+    directories, such as validacijas/year=YYYY/month=M, are read as year and month
+    columns of the view; the files themselves do not have them.
+    """
+    if not directory.is_dir():
+        raise ValueError(f'Parquet datu direktorija "{directory}" neeksistē.')
+
+    conn = duckdb.connect()
+    for table_dir in sorted(
+        p for p in directory.iterdir() if p.is_dir() and not p.name.startswith('.')
+    ):
+        files = (table_dir / '**' / '*.parquet').as_posix().replace("'", "''")
+        conn.execute(
+            f"""--sql
+            create view "{table_dir.name}" as
+            select * from read_parquet(
+                '{files}',
+                hive_partitioning = true,
+                union_by_name = true
+            );
+            """
+        )
+    return conn
+
+
+_config = st.secrets.duckdb
 
-db = DatabaseConnection(token=st.secrets.duckdb.md_token)
+db = DatabaseConnection(
+    token=_config.get('md_token'),
+    backend=Backend(_config.get('backend', Backend.MOTHERDUCK.value)),
+    path=_config.get('path'),
+    options=ConnectionOptions(
+        pool_size=_config.get('pool_size', 8),
+        query_timeout_s=_config.get('query_timeout_s'),
+        prepare_statements=_config.get('prepare_statements', False),
+    ),
+)
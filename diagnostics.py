@@ -0,0 +1,130 @@
+"""
+Operational statistics of the running server process for the diagnostics page.
+"""
+
+import hmac
+import sys
+from collections.abc import Iterable, Mapping
+
+import polars as pl
+import streamlit as st
+from polars import DataFrame
+from streamlit import runtime
+
+from instrumentation import QueryRecord
+from query_router import Source
+from state_manager import StateKeys
+
+DIAGNOSTICS_PARAM = 'diagnostics'
+
+_config = st.secrets.duckdb
+
+DIAGNOSTICS_TOKEN: str | None = _config.get('diagnostics_token')
+
+
+def is_diagnostics_request(query_params: Mapping[str, str]) -> bool:
+    """
+    Whether the URL opens the diagnostics page with the configured token.
+    """
+    if not DIAGNOSTICS_TOKEN:
+        return False
+    token = query_params.get(DIAGNOSTICS_PARAM, '')
+    return hmac.compare_digest(token.encode(), DIAGNOSTICS_TOKEN.encode())
+
+
+def latency_percentiles(records: Iterable[QueryRecord]) -> DataFrame:
+    """
+    Count and p50/p95/p99 wall time in ms per query name and cache outcome.
+
+    Pass a QueryLog.snapshot(), the recent records change while queries run.
+    """
+    schema = {'name': pl.String, 'cache': pl.String, 'wall_s': pl.Float64}
+    df = pl.DataFrame(
+        [(r.name, r.cache, r.wall_s) for r in records], schema=schema, orient='row'
+    )
+    wall_ms = pl.col('wall_s') * 1000
+    return (
+        df.group_by('name', 'cache')
+        .agg(
+            count=pl.len(),
+            p50_ms=wall_ms.quantile(0.5),
+            p95_ms=wall_ms.quantile(0.95),
+            p99_ms=wall_ms.quantile(0.99),
+        )
+        .sort('p95_ms', descending=True)
+    )
+
+
+def route_shares(counts: Mapping[tuple[str, Source], int]) -> DataFrame:
+    """
+    Count of every source per query and its share of the query's renders.
+
+    Pass a route_count_snapshot(). A rollup share below one means the rest of the
+    renders of the query read the raw validacijas table or a finer rollup.
+    """
+    schema = {'query': pl.String, 'source': pl.String, 'count': pl.Int64}
+    df = pl.DataFrame(
+        [(query, source.value, count) for (query, source), count in counts.items()],
+        schema=schema,
+        orient='row',
+    )
+    return df.with_columns(
+        share=pl.col('count') / pl.col('count').sum().over('query')
+    ).sort('query', 'count', descending=[False, True])
+
+
+def cache_memory() -> DataFrame:
+    """
+    Memory of the Streamlit caches and session states in bytes, per cache.
+    """
+    schema = {'category': pl.String, 'cache': pl.String, 'bytes': pl.Int64}
+    if not runtime.exists():
+        return pl.DataFrame(schema=schema)
+
+    stats = runtime.get_instance().stats_mgr.get_stats(['cache_memory_bytes'])
+    return (
+        pl.DataFrame(
+            [
+                (stat.category_name, stat.cache_name, stat.byte_length)
+                for stat in stats.get('cache_memory_bytes', [])
+            ],
+            schema=schema,
+            orient='row',
+        )
+        .group_by('category', 'cache')
+        .agg(pl.col('bytes').sum())
+        .sort('bytes', descending=True)
+    )
+
+
+def metrics_size(metrics: Mapping[str, object]) -> int:
+    """
+    Estimated size of a StateKeys.METRICS dict in bytes.
+    """
+    return sum(
+        value.estimated_size() if isinstance(value, DataFrame) else sys.getsizeof(value)
+        for value in metrics.values()
+    )
+
+
+def session_sizes() -> DataFrame:
+    """
+    Estimated size of the metrics of every active session.
+
+    The session manager is not a public Streamlit API, the same one feeds the
+    session state memory of cache_memory. Without it no sessions are listed.
+    """
+    schema = {'session': pl.String, 'metrics_bytes': pl.Int64}
+    instance = runtime.get_instance() if runtime.exists() else None
+    session_mgr = getattr(instance, '_session_mgr', None)
+    if session_mgr is None:
+        return pl.DataFrame(schema=schema)
+
+    rows = []
+    for info in session_mgr.list_active_sessions():
+        state = info.session.session_state
+        metrics = state[StateKeys.METRICS] if StateKeys.METRICS in state else {}
+        rows.append((info.session.id, metrics_size(metrics)))
+    return pl.DataFrame(rows, schema=schema, orient='row').sort(
+        'metrics_bytes', descending=True
+    )
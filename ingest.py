@@ -0,0 +1,896 @@
+"""
+Streaming ingestion of the monthly validation archives from data.gov.lv.
+
+Every .csv or .txt member of a .zip archive is decompressed and parsed block by
+block and the record batches go straight into the validacijas table of a DuckDB
+database or into Parquet files, so no extracted file is written and the memory use
+is bounded by the block size, not by the size of the month.
+
+A backfill of many archives is parsed and compressed by a pool of worker processes.
+Every worker writes the Parquet partition of one archive to a staging directory and
+the main process publishes finished partitions one at a time.
+
+Loads are incremental: archives whose checksum is in the manifest are skipped and
+republished archives replace the rows of their previous load, see manifest.py.
+
+    python ingest.py data/zips --database validacijas.duckdb
+    python ingest.py file:///data/2025-07.zip --parquet data
+    python ingest.py data/zips --parquet data --workers 8 --worker-memory-mb 512
+"""
+
+import argparse
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zipfile
+from collections.abc import Iterator, Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from datetime import date, datetime, timedelta
+from email.message import Message
+from pathlib import Path
+from typing import IO, Final, Self
+from urllib.error import URLError
+from urllib.parse import urlparse
+from urllib.request import Request, url2pathname, urlopen
+
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from manifest import (
+    MANIFEST_FILE,
+    Manifest,
+    ManifestEntry,
+    RemoteVersion,
+    clear_manifest,
+    read_manifest,
+    read_manifest_file,
+    record_archive,
+    write_manifest_file,
+)
+from rollups import refresh_month
+from utils import last_day_of_month
+
+logger = logging.getLogger(__name__)
+
+VALIDACIJAS_TABLE = 'validacijas'
+DEFAULT_BLOCK_SIZE = 8 * 2**20
+MEMBER_SUFFIXES = ('.csv', '.txt')
+DELIMITERS = (',', ';', '\t', '|')
+STAGING_DIR = '.staging'
+# One DuckDB row group; a month of a few million validations sorted by Laiks gets
+# row groups of a few hours, so a day range reads a handful of them
+ROW_GROUP_SIZE = 122_880
+# DuckDB needs about this much memory per thread to sort, it fails with less
+SORT_THREAD_MEMORY = 32 * 2**20
+# Seconds a download or HEAD request may wait for the server before it fails
+HTTP_TIMEOUT_S = 60
+
+# Text dimensions with a few hundred distinct values are read dictionary encoded,
+# which halves the memory of a parsed block. DuckDB and Parquet store them as
+# dictionary compressed strings in any case, see benchmarks/schema.py.
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+COLUMN_TYPES: Final[dict[str, pa.DataType]] = {
+    'Laiks': pa.timestamp('us'),
+    'TranspVeids': CATEGORY,
+    'TMarsruts': CATEGORY,
+    'MarsrNos': CATEGORY,
+    'Parks': CATEGORY,
+    'Virziens': CATEGORY,
+    'GarNr': pa.int32(),
+}
+TIMESTAMP_PARSERS: Final[list] = [
+    pa_csv.ISO8601,
+    '%d.%m.%Y %H:%M:%S',
+    '%d.%m.%Y %H:%M',
+]
+
+# Every row remembers the archive it was loaded from, so a republished archive
+# replaces exactly its own rows
+SQL_CREATE_TABLE = f"""--sql
+    create table if not exists {VALIDACIJAS_TABLE} as
+    select *, null::VARCHAR as source_archive from batches limit 0;
+    """
+
+SQL_INSERT = f"""--sql
+    insert into {VALIDACIJAS_TABLE} by name
+    select *, $archive as source_archive from batches;
+    """
+
+SQL_TABLE_EXISTS = f"""--sql
+    select count(*) > 0 from duckdb_tables() where table_name = '{VALIDACIJAS_TABLE}';
+    """
+
+SQL_ADD_SOURCE_COLUMN = f"""--sql
+    alter table {VALIDACIJAS_TABLE} add column if not exists source_archive VARCHAR;
+    """
+
+SQL_ARCHIVE_MONTHS = f"""--sql
+    select distinct
+        date_trunc('month', Laiks)::DATE
+    from
+        {VALIDACIJAS_TABLE}
+    where
+        source_archive = $archive;
+    """
+
+SQL_DELETE_ARCHIVE = f"""--sql
+    delete from {VALIDACIJAS_TABLE} where source_archive = $archive;
+    """
+
+# Rows loaded before the manifest existed have no source archive. They are replaced
+# by the archive whose validations span their time.
+SQL_DELETE_UNTRACKED = f"""--sql
+    delete from {VALIDACIJAS_TABLE}
+    where
+        source_archive is null
+        and Laiks between $first and $last;
+    """
+
+# One file per month sorted by Laiks, so the Laiks statistics of the row groups do
+# not overlap and a date range filter skips all row groups and files outside of it
+SQL_SORT_MONTH = """--sql
+    copy (
+        select
+            *
+        from
+            read_parquet($files, union_by_name = true, hive_partitioning = false)
+        where
+            Laiks >= $start_date
+            and Laiks < $end_date
+        order by
+            Laiks
+    ) to '{target}' (
+        format parquet,
+        row_group_size {row_group_size}
+    );
+    """
+
+
+@dataclass(frozen=True)
+class WriteOptions:
+    """
+    How write_archive writes the Parquet files of an archive.
+
+    Unsorted files are written per member as they are read, for a load that does
+    not need them sorted by Laiks.
+    """
+
+    block_size: int = DEFAULT_BLOCK_SIZE
+    row_group_size: int = ROW_GROUP_SIZE
+    sort: bool = True
+
+
+@dataclass
+class IngestResult:
+    """
+    Outcome of loading archives.
+
+    Archives, members and rows loaded, the first and last Laiks and the months of
+    the rows, the months whose validations they changed, the manifest entries of
+    the loaded archives and the unchanged archives skipped.
+    """
+
+    archives: int = 0
+    members: int = 0
+    rows: int = 0
+    first: datetime | None = None
+    last: datetime | None = None
+    months: set[date] = field(default_factory=set)
+    entries: list[ManifestEntry] = field(default_factory=list)
+    skipped: int = 0
+
+    def add(self, other: Self) -> None:
+        """
+        Add the counts, times, months and entries of another result.
+        """
+        self.archives += other.archives
+        self.members += other.members
+        self.rows += other.rows
+        self.span(other.first, other.last)
+        self.months |= other.months
+        self.entries += other.entries
+        self.skipped += other.skipped
+
+    def span(self, first: datetime | None, last: datetime | None) -> None:
+        """
+        Extend the first and last Laiks and the months to cover first to last.
+        """
+        if first is None or last is None:
+            return
+        self.first = min(first, self.first or first)
+        self.last = max(last, self.last or last)
+        self.months |= _months(first, last)
+
+    def entry(
+        self,
+        archive: str,
+        sha256: str,
+        remote: RemoteVersion | None = None,
+    ) -> ManifestEntry:
+        """
+        Manifest entry of a result of one archive.
+        """
+        return ManifestEntry(
+            archive=archive,
+            sha256=sha256,
+            row_count=self.rows,
+            months=sorted(self.months),
+            loaded_at=datetime.now(),
+            remote=remote,
+        )
+
+
+def list_archives(source: str) -> list[str]:
+    """
+    List the .zip archives of a source.
+
+    Args:
+        source: local directory or .zip file, or a file, http or https URL of one
+
+    Returns:
+        Local paths or URLs of the archives, sorted by name
+    """
+    url = urlparse(source)
+    if url.scheme in {'http', 'https'}:
+        return [source]
+
+    path = Path(url2pathname(url.path)) if url.scheme == 'file' else Path(source)
+    if path.is_dir():
+        return [str(p) for p in sorted(path.glob('*.zip'))]
+    if path.is_file():
+        return [str(path)]
+    raise ValueError(f'Datu avots nav atrasts: {source}')
+
+
+@contextmanager
+def open_archive(
+    location: str,
+) -> Iterator[tuple[zipfile.ZipFile, str, RemoteVersion | None]]:
+    """
+    Open a local archive, or download a remote one to a temporary file.
+
+    Zip members are found through the directory at the end of the archive, so a
+    remote archive is spooled to disk in chunks instead of held in memory.
+
+    Yields:
+        The archive, the SHA-256 checksum of its file and the HTTP validators of
+        its download, None for a local archive
+    """
+    with _local_file(location) as (file, remote):
+        sha256 = hashlib.file_digest(file, 'sha256').hexdigest()
+        file.seek(0)
+        with zipfile.ZipFile(file) as archive:
+            yield archive, sha256, remote
+
+
+@contextmanager
+def _local_file(location: str) -> Iterator[tuple[IO[bytes], RemoteVersion | None]]:
+    """
+    Open a local file, or a temporary copy of a remote one and its HTTP validators.
+    """
+    if not _is_remote(location):
+        with open(location, 'rb') as file:
+            yield file, None
+        return
+
+    with tempfile.TemporaryFile() as spool:
+        with urlopen(location, timeout=HTTP_TIMEOUT_S) as response:
+            remote = _remote_version(response.headers)
+            shutil.copyfileobj(response, spool, length=2**20)
+        spool.seek(0)
+        yield spool, remote
+
+
+def _is_remote(location: str) -> bool:
+    """
+    Whether an archive location is an http or https URL.
+    """
+    return urlparse(location).scheme in {'http', 'https'}
+
+
+def _remote_version(headers: Message) -> RemoteVersion:
+    """
+    HTTP validators of a response.
+    """
+    length = headers.get('Content-Length')
+    return RemoteVersion(
+        etag=headers.get('ETag'),
+        last_modified=headers.get('Last-Modified'),
+        content_length=int(length) if length is not None else None,
+    )
+
+
+def _remote_unchanged(location: str, entry: ManifestEntry) -> bool:
+    """
+    Whether a HEAD request finds the remote archive of entry unchanged.
+
+    Archives without validators from their previous download, and those whose
+    HEAD request fails or times out, are downloaded and compared by checksum.
+    """
+    if entry.remote is None or not _is_remote(location):
+        return False
+    try:
+        request = Request(location, method='HEAD')
+        with urlopen(request, timeout=HTTP_TIMEOUT_S) as response:
+            return entry.remote.matches(_remote_version(response.headers))
+    except (URLError, TimeoutError) as error:
+        logger.warning('HEAD request of %s failed: %s', location, error)
+        return False
+
+
+def sniff_header(member: IO[bytes]) -> tuple[str, list[str]]:
+    """
+    Read the header line of a member and guess its delimiter.
+
+    Returns:
+        The delimiter and the column names
+    """
+    line = io.TextIOWrapper(member, encoding='utf-8-sig').readline().strip()
+    delimiter = max(DELIMITERS, key=line.count)
+    return delimiter, [name.strip() for name in line.split(delimiter)]
+
+
+def read_member(
+    archive: zipfile.ZipFile,
+    name: str,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    column_types: Mapping[str, pa.DataType] = COLUMN_TYPES,
+) -> pa.RecordBatchReader:
+    """
+    Open a streaming CSV reader of an archive member.
+
+    The columns in column_types get their types and all other columns are read
+    as strings, so every block of every month has the same schema.
+    """
+    with archive.open(name) as member:
+        delimiter, columns = sniff_header(member)
+
+    column_types = {c: column_types.get(c, pa.string()) for c in columns}
+    return pa_csv.open_csv(
+        archive.open(name),
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        parse_options=pa_csv.ParseOptions(delimiter=delimiter),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=column_types,
+            timestamp_parsers=TIMESTAMP_PARSERS,
+        ),
+    )
+
+
+def _track(
+    reader: pa.RecordBatchReader,
+    result: IngestResult,
+) -> pa.RecordBatchReader:
+    """
+    Pass batches through, counting rows and the time span of their Laiks.
+    """
+
+    def batches() -> Iterator[pa.RecordBatch]:
+        for batch in reader:
+            result.rows += batch.num_rows
+            if 'Laiks' in batch.schema.names and batch.num_rows:
+                bounds = pc.min_max(batch.column('Laiks'))
+                result.span(bounds['min'].as_py(), bounds['max'].as_py())
+            yield batch
+
+    return pa.RecordBatchReader.from_batches(reader.schema, batches())
+
+
+def _months(start: datetime | None, end: datetime | None) -> set[date]:
+    """
+    First days of the months from start to end.
+    """
+    if start is None or end is None:
+        return set()
+    months = set()
+    month = date(start.year, start.month, 1)
+    while month <= end.date():
+        months.add(month)
+        month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return months
+
+
+def _members(archive: zipfile.ZipFile) -> list[str]:
+    """
+    Names of the CSV and TXT members of an archive.
+    """
+    return [
+        info.filename
+        for info in archive.infolist()
+        if not info.is_dir() and info.filename.lower().endswith(MEMBER_SUFFIXES)
+    ]
+
+
+def ingest_duckdb(
+    conn: duckdb.DuckDBPyConnection,
+    source: str,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    refresh: bool = True,
+) -> IngestResult:
+    """
+    Stream the changed archives of source into the validacijas table.
+
+    The table is created from the first member when it does not exist. Columns are
+    matched by name. Every archive replaces the rows of its previous load in one
+    transaction. With refresh, the rollups of every changed month are refreshed
+    afterwards.
+    """
+    locations = list_archives(source)
+    archives = _known(locations, read_manifest(conn))
+    result = IngestResult(skipped=len(locations) - len(archives))
+    for location, known in archives.items():
+        name = archive_name(location)
+        with open_archive(location) as (archive, sha256, remote):
+            if sha256 == known:
+                result.skipped += 1
+                logger.info('Skipped unchanged %s', location)
+                continue
+
+            loaded = IngestResult(archives=1)
+            with _replacing(conn, name) as replaced:
+                for member in _members(archive):
+                    reader = read_member(archive, member, block_size)
+                    _insert(conn, _track(reader, loaded), name)
+                    loaded.members += 1
+                loaded.entries.append(loaded.entry(name, sha256, remote))
+                _record(conn, loaded)
+            loaded.months |= replaced
+            result.add(loaded)
+            logger.info('Loaded %s', location)
+
+    if refresh:
+        for month in sorted(result.months):
+            refresh_month(conn, month)
+    return result
+
+
+@contextmanager
+def _replacing(conn: duckdb.DuckDBPyConnection, archive: str) -> Iterator[set[date]]:
+    """
+    Transaction that deletes the rows of the previous load of an archive.
+
+    The rows of the new load are inserted and recorded in the body. Readers see
+    either the old or the new rows of the archive.
+
+    Yields:
+        The months of the deleted rows
+    """
+    conn.execute('begin transaction;')
+    try:
+        months = set()
+        if conn.execute(SQL_TABLE_EXISTS).fetchone()[0]:
+            conn.execute(SQL_ADD_SOURCE_COLUMN)
+            rows = conn.execute(SQL_ARCHIVE_MONTHS, {'archive': archive}).fetchall()
+            months = {row[0] for row in rows}
+            conn.execute(SQL_DELETE_ARCHIVE, {'archive': archive})
+        yield months
+        conn.execute('commit;')
+    except Exception:
+        conn.execute('rollback;')
+        raise
+
+
+def _insert(
+    conn: duckdb.DuckDBPyConnection,
+    batches: pa.RecordBatchReader | duckdb.DuckDBPyRelation,
+    archive: str,
+) -> None:
+    """
+    Insert batches into the validacijas table, creating it when it does not exist.
+    """
+    conn.register('batches', batches)
+    try:
+        conn.execute(SQL_CREATE_TABLE)
+        conn.execute(SQL_INSERT, {'archive': archive})
+    finally:
+        conn.unregister('batches')
+
+
+def _record(conn: duckdb.DuckDBPyConnection, loaded: IngestResult) -> None:
+    """
+    Replace untracked rows in the time span of an archive and record it.
+
+    loaded is the result of the one archive.
+    """
+    if loaded.first is not None:
+        conn.execute(SQL_DELETE_UNTRACKED, {'first': loaded.first, 'last': loaded.last})
+    record_archive(conn, loaded.entries[-1])
+
+
+def write_archive(
+    location: str,
+    directory: Path,
+    options: WriteOptions | None = None,
+    known: str | None = None,
+) -> IngestResult:
+    """
+    Write one archive as Hive partitioned Parquet files sorted by Laiks.
+
+    The members are streamed into unsorted files first, then sorted into one file
+    per month, directory/<archive>/year=YYYY/month=M/<archive>.parquet. Without
+    options.sort the unsorted member files are the partition. Nothing is written
+    when the checksum of the archive equals known.
+    """
+    options = options or WriteOptions()
+    name = archive_name(location)
+    with open_archive(location) as (archive, sha256, remote):
+        if sha256 == known:
+            logger.info('Skipped unchanged %s', location)
+            return IngestResult(skipped=1)
+
+        result = IngestResult(archives=1)
+        unsorted = directory / f'{name}.unsorted'
+        unsorted.mkdir(parents=True, exist_ok=True)
+        for member in _members(archive):
+            batches = _track(read_member(archive, member, options.block_size), result)
+            path = unsorted / f'{Path(member).stem}.parquet'
+            with pq.ParquetWriter(path, batches.schema) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+            result.members += 1
+
+    if options.sort:
+        files = sorted(unsorted.glob('*.parquet'))
+        (directory / name).mkdir()
+        if files:
+            sort_partition(files, directory / name, result.months, options)
+        shutil.rmtree(unsorted)
+    else:
+        unsorted.rename(directory / name)
+    result.entries.append(result.entry(name, sha256, remote))
+    logger.info('Wrote %s from %s', directory / name, location)
+    return result
+
+
+def sort_partition(
+    files: list[Path],
+    partition: Path,
+    months: set[date],
+    options: WriteOptions | None = None,
+) -> None:
+    """
+    Sort Parquet files by Laiks into one file per month of one archive.
+
+    DuckDB sorts within a memory limit of four blocks, with as many threads as fit
+    in it, and spills the rest to a temporary directory next to the partition.
+    """
+    options = options or WriteOptions()
+    memory = max(4 * options.block_size, SORT_THREAD_MEMORY)
+    config = {
+        'memory_limit': f'{memory}B',
+        'threads': max(1, min(pa.cpu_count(), memory // SORT_THREAD_MEMORY)),
+        'temp_directory': f'{partition}.tmp',
+        'preserve_insertion_order': False,
+    }
+    with duckdb.connect(config=config) as conn:
+        for month in sorted(months):
+            target = partition / f'year={month.year}' / f'month={month.month}'
+            target.mkdir(parents=True, exist_ok=True)
+            conn.execute(
+                SQL_SORT_MONTH.format(
+                    target=(target / f'{partition.name}.parquet')
+                    .as_posix()
+                    .replace("'", "''"),
+                    row_group_size=options.row_group_size,
+                ),
+                {
+                    'files': [f.as_posix() for f in files],
+                    'start_date': month,
+                    'end_date': last_day_of_month(month) + timedelta(days=1),
+                },
+            )
+    shutil.rmtree(f'{partition}.tmp', ignore_errors=True)
+
+
+def archive_name(location: str) -> str:
+    """
+    Name of the partition of an archive, the file name without .zip.
+    """
+    return Path(urlparse(location).path).stem
+
+
+def publish(partition: Path, table_dir: Path, previous: list[str]) -> list[str]:
+    """
+    Move the staged files of an archive into the month partitions of the table.
+
+    An archive has one file per month, moved with a rename that replaces the file
+    of the previous load, so readers see either the old or the new month, never a
+    partly written one. The files of the previous load in months the new one does
+    not have are removed afterwards. The staging directory must be on the same
+    file system.
+
+    Args:
+        partition: staged partition of the archive
+        table_dir: directory of the table
+        previous: files of the previous load relative to table_dir
+
+    Returns:
+        The published files relative to table_dir
+    """
+    published = []
+    for file in sorted(partition.rglob('*.parquet')):
+        relative = file.relative_to(partition).as_posix()
+        target = table_dir / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        file.replace(target)
+        published.append(relative)
+
+    for stale in sorted(set(previous) - set(published)):
+        (table_dir / stale).unlink(missing_ok=True)
+    shutil.rmtree(partition)
+    return published
+
+
+def stage_archives(
+    archives: Mapping[str, str | None],
+    staging: Path,
+    options: WriteOptions | None = None,
+    workers: int = 1,
+) -> Iterator[tuple[Path, IngestResult]]:
+    """
+    Write the partitions of archives to staging, in a process pool with workers > 1.
+
+    Args:
+        archives: checksum of the previous load by location, None when not loaded
+        staging: directory of the partitions
+        options: how the partitions are written
+        workers: archives written in parallel
+
+    Yields:
+        Every staged partition and its result, in the order they are finished.
+        Unchanged archives are skipped and have no partition.
+    """
+    if workers == 1:
+        for location, known in archives.items():
+            yield (
+                staging / archive_name(location),
+                write_archive(location, staging, options, known),
+            )
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('forkserver'),
+        initializer=_init_worker,
+    ) as executor:
+        futures = {
+            executor.submit(write_archive, location, staging, options, known): location
+            for location, known in archives.items()
+        }
+        for future in as_completed(futures):
+            yield staging / archive_name(futures[future]), future.result()
+
+
+def _init_worker() -> None:
+    """
+    Limit a pool worker to one Arrow thread, the pool provides the parallelism.
+    """
+    pa.set_cpu_count(1)
+    pa.set_io_thread_count(1)
+
+
+def block_size_for(worker_memory_mb: int) -> int:
+    """
+    CSV block size that keeps a worker within its memory budget.
+
+    A worker holds about four blocks at once: the decompressed CSV text, its parsed
+    columns, and the column and page buffers of the Parquet row group being written.
+    """
+    return worker_memory_mb * 2**20 // 4
+
+
+def ingest_parquet(
+    directory: Path,
+    source: str,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    workers: int = 1,
+    row_group_size: int = ROW_GROUP_SIZE,
+) -> IngestResult:
+    """
+    Stream the changed archives of source into Parquet partitions of validacijas.
+
+    The files are Hive partitioned by year and month of Laiks under
+    directory/validacijas, the layout read by the parquet database backend, so a
+    month query reads the row groups of one partition only. Archives are written
+    to directory/.staging and published as soon as they are complete, then
+    recorded with their files in directory/ingest_manifest.json.
+    """
+    staging = directory / STAGING_DIR
+    table_dir = directory / VALIDACIJAS_TABLE
+    manifest_path = directory / MANIFEST_FILE
+    manifest = read_manifest_file(manifest_path)
+    locations = list_archives(source)
+    archives = _known(locations, manifest)
+    result = IngestResult(skipped=len(locations) - len(archives))
+    try:
+        for partition, staged in stage_archives(
+            archives,
+            staging,
+            WriteOptions(block_size, row_group_size),
+            workers,
+        ):
+            if not staged.skipped:
+                previous = manifest.get(partition.name)
+                published = publish(
+                    partition,
+                    table_dir,
+                    previous.files if previous is not None else [],
+                )
+                manifest[partition.name] = replace(staged.entries[0], files=published)
+                write_manifest_file(manifest_path, manifest)
+            result.add(staged)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return result
+
+
+def backfill_duckdb(
+    conn: duckdb.DuckDBPyConnection,
+    source: str,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    refresh: bool = True,
+    workers: int = 2,
+) -> IngestResult:
+    """
+    Load the changed archives of source into the validacijas table with a process pool.
+
+    The workers stage unsorted Parquet files in a temporary directory, the insert
+    does not need them sorted, and every finished partition replaces the rows of
+    the previous load of its archive in one transaction, so an archive is either
+    loaded whole or not at all.
+    """
+    locations = list_archives(source)
+    archives = _known(locations, read_manifest(conn))
+    result = IngestResult(skipped=len(locations) - len(archives))
+    options = WriteOptions(block_size, sort=False)
+    with tempfile.TemporaryDirectory(prefix='ingest-') as tmp:
+        for partition, staged in stage_archives(archives, Path(tmp), options, workers):
+            if not staged.skipped:
+                staged.months |= _register_partition(conn, partition, staged)
+                shutil.rmtree(partition)
+                logger.info('Loaded %s', partition.name)
+            result.add(staged)
+
+    if refresh:
+        for month in sorted(result.months):
+            refresh_month(conn, month)
+    return result
+
+
+def _known(locations: list[str], manifest: Manifest) -> dict[str, str | None]:
+    """
+    Checksum of the previous load of every archive location, None when not loaded.
+
+    Remote archives that a HEAD request finds unchanged are left out.
+    """
+    known = {}
+    for location in locations:
+        entry = manifest.get(archive_name(location))
+        if entry is None:
+            known[location] = None
+        elif _remote_unchanged(location, entry):
+            logger.info('Skipped unchanged %s', location)
+        else:
+            known[location] = entry.sha256
+    return known
+
+
+def _register_partition(
+    conn: duckdb.DuckDBPyConnection,
+    partition: Path,
+    staged: IngestResult,
+) -> set[date]:
+    """
+    Replace the rows of an archive with its staged partition atomically.
+
+    Returns:
+        The months of the replaced rows
+    """
+    files = [p.as_posix() for p in sorted(partition.rglob('*.parquet'))]
+    with _replacing(conn, partition.name) as replaced:
+        if files:
+            batches = conn.read_parquet(
+                files, union_by_name=True, hive_partitioning=False
+            )
+            _insert(conn, batches, partition.name)
+        _record(conn, staged)
+    return replaced
+
+
+def main() -> None:
+    """
+    Load monthly validation archives into DuckDB or Parquet.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        'source',
+        help='directory or .zip file, or a file, http or https URL of one',
+    )
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+        '--database',
+        help='DuckDB database file or MotherDuck connection string (md:...)',
+    )
+    target.add_argument('--parquet', type=Path, help='Parquet data directory')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help=f'archives processed in parallel, up to {os.process_cpu_count()} cores',
+    )
+    memory = parser.add_mutually_exclusive_group()
+    memory.add_argument(
+        '--worker-memory-mb',
+        type=int,
+        help='memory budget of one worker, sets the block size',
+    )
+    memory.add_argument(
+        '--block-size',
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help='bytes of CSV parsed at once, bounds the memory use',
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='load every archive again, also those unchanged since the last load',
+    )
+    parser.add_argument(
+        '--no-rollups',
+        action='store_true',
+        help='do not refresh the rollups of the loaded months',
+    )
+    args = parser.parse_args()
+
+    block_size = args.block_size
+    if args.worker_memory_mb:
+        block_size = block_size_for(args.worker_memory_mb)
+    if args.parquet and 4 * block_size < SORT_THREAD_MEMORY:
+        parser.error(
+            f'--parquet sorts within four blocks, it needs --worker-memory-mb'
+            f' {SORT_THREAD_MEMORY // 2**20} or --block-size {SORT_THREAD_MEMORY // 4}'
+            ' at least'
+        )
+    logging.basicConfig(level=logging.INFO)
+    if args.parquet:
+        manifest_path = args.parquet / MANIFEST_FILE
+        if args.force and manifest_path.exists():
+            # Keep the published files, so the new load still replaces them
+            manifest = read_manifest_file(manifest_path)
+            write_manifest_file(
+                manifest_path,
+                {archive: replace(e, sha256='') for archive, e in manifest.items()},
+            )
+        result = ingest_parquet(args.parquet, args.source, block_size, args.workers)
+    else:
+        with duckdb.connect(args.database) as conn:
+            if args.force:
+                clear_manifest(conn)
+            refresh = not args.no_rollups
+            if args.workers == 1:
+                result = ingest_duckdb(conn, args.source, block_size, refresh)
+            else:
+                result = backfill_duckdb(
+                    conn, args.source, block_size, refresh, args.workers
+                )
+    logger.info(
+        'Loaded %d rows of %s from %d archives, %d unchanged archives skipped',
+        result.rows,
+        ', '.join(m.strftime('%Y-%m') for m in sorted(result.months)),
+        result.archives,
+        result.skipped,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""
+Per-query instrumentation of the data_manager queries.
+"""
+
+import json
+import logging
+import threading
+from collections import Counter, deque
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, date, datetime
+from enum import Enum
+from functools import update_wrapper, wraps
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+import polars as pl
+import streamlit as st
+from polars import DataFrame
+
+from database import DatabaseConnection
+
+logger = logging.getLogger(__name__)
+
+
+class CacheOutcome(str, Enum):
+    """
+    Persistent result cache outcomes of a query.
+    """
+
+    HIT = 'hit'
+    MISS = 'miss'
+    OFF = 'off'
+    SHARED = 'shared'
+
+
+@dataclass
+class QueryRecord:
+    """
+    Measurements of one logical query.
+
+    Attributes:
+        name: logical query name, the RoutedQuery name for routed queries
+        wall_s: seconds spent executing the query or reading the cached result
+        rows: rows in the result
+        bytes: estimated in-memory size of the result
+        params: type, or length for lists, of every parameter
+        cache: persistent result cache outcome, 'off' when it was not used and
+            'shared' for a result of a concurrent identical query
+        at: UTC time the record was taken
+        explain: EXPLAIN ANALYZE output of slow queries
+    """
+
+    name: str
+    wall_s: float
+    rows: int
+    bytes: int
+    params: dict[str, str]
+    cache: str = CacheOutcome.OFF
+    at: str = field(
+        default_factory=lambda: datetime.now(UTC).isoformat(timespec='milliseconds')
+    )
+    explain: str | None = None
+
+
+def param_shape(params: dict[str, date | list[str]]) -> dict[str, str]:
+    """
+    Describe query parameters without their values.
+    """
+    return {
+        name: f'list[{len(value)}]' if isinstance(value, list) else type(value).__name__
+        for name, value in params.items()
+    }
+
+
+def explain_analyze(
+    db: DatabaseConnection,
+    query: str,
+    params: dict[str, date | list[str]],
+) -> str:
+    """
+    Run query again with EXPLAIN ANALYZE and return the profiled plan.
+    """
+    with db.cursor() as cursor:
+        rows = cursor.sql(f'explain analyze {query}', params=params).fetchall()
+    return '\n'.join(str(row[1]) for row in rows)
+
+
+class QueryLog:
+    """
+    Recent query records in memory and, with a path, in a rotating JSONL file.
+
+    Queries slower than explain_threshold_s are profiled with EXPLAIN ANALYZE on a
+    background thread, so the profile never delays the session, and are logged
+    once the profile is ready.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        max_bytes: int = 10 * 2**20,
+        backups: int = 3,
+        explain_threshold_s: float | None = None,
+    ) -> None:
+        """
+        Create the log, with a rotating JSONL file when path is given.
+        """
+        self.recent: deque[QueryRecord] = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._explain_threshold_s = explain_threshold_s
+        self._explainer: ThreadPoolExecutor | None = None
+        self._file_logger: logging.Logger | None = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8'
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._file_logger = logging.getLogger(f'{__name__}.jsonl.{path}')
+            self._file_logger.setLevel(logging.INFO)
+            self._file_logger.propagate = False
+            self._file_logger.handlers = [handler]
+
+    def log(
+        self,
+        record: QueryRecord,
+        explain: Callable[[], str] | None = None,
+    ) -> None:
+        """
+        Store a record, after profiling it with explain when the query was slow.
+        """
+        threshold = self._explain_threshold_s
+        if explain is None or threshold is None or record.wall_s < threshold:
+            self._write(record)
+            return
+
+        with self._lock:
+            if self._explainer is None:
+                self._explainer = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='explain'
+                )
+        self._explainer.submit(self._explain, record, explain)
+
+    def snapshot(self) -> list[QueryRecord]:
+        """
+        Copy the recent records, safe while other threads log queries.
+        """
+        with self._lock:
+            return list(self.recent)
+
+    def _explain(self, record: QueryRecord, explain: Callable[[], str]) -> None:
+        """
+        Attach the profile of a slow query and store the record.
+        """
+        try:
+            record.explain = explain()
+        except Exception:
+            logger.warning('EXPLAIN ANALYZE of %s failed', record.name, exc_info=True)
+        self._write(record)
+
+    def _write(self, record: QueryRecord) -> None:
+        """
+        Append a record to the recent records and the JSONL file.
+        """
+        with self._lock:
+            self.recent.append(record)
+        if self._file_logger is not None:
+            self._file_logger.info(json.dumps(asdict(record), ensure_ascii=False))
+
+
+class CacheStats:
+    """
+    Calls and misses of the st.cache_data getters, per getter name.
+    """
+
+    def __init__(self) -> None:
+        """
+        Start with no counted calls.
+        """
+        self._lock = threading.Lock()
+        self.calls: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+
+    def count(self, name: str, *, miss: bool = False) -> None:
+        """
+        Count a call of a getter, or a miss that ran its body.
+        """
+        with self._lock:
+            (self.misses if miss else self.calls)[name] += 1
+
+    def frame(self) -> DataFrame:
+        """
+        Tabulate calls, hits, misses and hit ratio of every getter called so far.
+        """
+        with self._lock:
+            rows = [
+                {'name': name, 'calls': calls, 'misses': self.misses[name]}
+                for name, calls in sorted(self.calls.items())
+            ]
+        return pl.DataFrame(
+            rows, schema={'name': pl.String, 'calls': pl.Int64, 'misses': pl.Int64}
+        ).with_columns(
+            hits=pl.col('calls') - pl.col('misses'),
+            hit_ratio=1 - pl.col('misses') / pl.col('calls'),
+        )
+
+
+class TrackedCache[**P, R]:
+    """
+    Cached getter that counts its calls and misses in cache_stats.
+    """
+
+    def __init__(self, func: Callable[P, R], cache: Callable) -> None:
+        """
+        Wrap func with the cache decorator, counting the calls that miss.
+        """
+        name = func.__name__
+
+        @wraps(func)
+        def miss(*args: P.args, **kwargs: P.kwargs) -> R:
+            cache_stats.count(name, miss=True)
+            return func(*args, **kwargs)
+
+        self._name = name
+        self._cached = cache(miss)
+        update_wrapper(self, func)
+
+    def __call__(self, *args: P.args, **kwargs: P.kwargs) -> R:
+        """
+        Count the call and return the cached value.
+        """
+        cache_stats.count(self._name)
+        return self._cached(*args, **kwargs)
+
+    def clear(self, *args: object, **kwargs: object) -> None:
+        """
+        Clear the cached values, all of them without arguments.
+        """
+        self._cached.clear(*args, **kwargs)
+
+
+def tracked[**P, R](cache: Callable) -> Callable[[Callable[P, R]], TrackedCache[P, R]]:
+    """
+    Apply a st.cache_data decorator and count the hits and misses of the getter.
+
+    Usage:
+        @tracked(st.cache_data(show_spinner=False))
+        def get_something(_db: DatabaseConnection) -> DataFrame: ...
+    """
+
+    def decorator(func: Callable[P, R]) -> TrackedCache[P, R]:
+        return TrackedCache(func, cache)
+
+    return decorator
+
+
+cache_stats = CacheStats()
+
+_config = st.secrets.duckdb
+
+query_log = QueryLog(
+    path=_config.get('query_log_path'),
+    max_bytes=_config.get('query_log_max_mb', 10) * 2**20,
+    backups=_config.get('query_log_backups', 3),
+    explain_threshold_s=_config.get('explain_threshold_s'),
+)
@@ -0,0 +1,199 @@
+"""
+Manifest of the source archives loaded by ingest.py.
+
+One entry per archive with the SHA-256 checksum of the .zip file, the rows loaded
+from it, the months they fall in and the load time. An archive whose checksum is
+unchanged is skipped on the next run, one that was republished with corrections is
+replaced. A remote archive also keeps the HTTP validators of its download, so an
+unchanged one is skipped after a HEAD request, without downloading it.
+
+A DuckDB database keeps the manifest in the ingest_manifest table, written in the
+transaction that loads the archive. A Parquet data directory keeps it in
+ingest_manifest.json next to the table directories, together with the files each
+archive was published as, so a new load removes exactly those.
+"""
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import Self
+
+import duckdb
+
+MANIFEST_TABLE = 'ingest_manifest'
+MANIFEST_FILE = 'ingest_manifest.json'
+
+SQL_CREATE_MANIFEST = f"""--sql
+    create table if not exists {MANIFEST_TABLE}
+    (
+        archive VARCHAR primary key,
+        sha256 VARCHAR not null,
+        row_count BIGINT not null,
+        months DATE[] not null,
+        loaded_at TIMESTAMP not null,
+        etag VARCHAR,
+        last_modified VARCHAR,
+        content_length BIGINT
+    );
+    alter table {MANIFEST_TABLE} add column if not exists etag VARCHAR;
+    alter table {MANIFEST_TABLE} add column if not exists last_modified VARCHAR;
+    alter table {MANIFEST_TABLE} add column if not exists content_length BIGINT;
+    """
+
+SQL_READ_MANIFEST = f"""--sql
+    select
+        archive,
+        sha256,
+        row_count,
+        months,
+        loaded_at,
+        etag,
+        last_modified,
+        content_length
+    from
+        {MANIFEST_TABLE};
+    """
+
+SQL_RECORD_ARCHIVE = f"""--sql
+    insert or replace into {MANIFEST_TABLE}
+    values (
+        $archive,
+        $sha256,
+        $row_count,
+        $months,
+        $loaded_at,
+        $etag,
+        $last_modified,
+        $content_length
+    );
+    """
+
+SQL_CLEAR_MANIFEST = f"""--sql
+    delete from {MANIFEST_TABLE};
+    """
+
+
+@dataclass(frozen=True)
+class RemoteVersion:
+    """
+    HTTP validators of a downloaded archive, None where the server sent none.
+    """
+
+    etag: str | None = None
+    last_modified: str | None = None
+    content_length: int | None = None
+
+    def matches(self, other: Self) -> bool:
+        """
+        Whether other is the same file, by ETag or else by Last-Modified and size.
+        """
+        if self.etag or other.etag:
+            return self.etag == other.etag
+        return self.last_modified is not None and (
+            self.last_modified,
+            self.content_length,
+        ) == (other.last_modified, other.content_length)
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    """
+    Checksum and contents of a loaded archive.
+
+    remote is None for local archives. files are the published Parquet files
+    relative to the table directory, they are only kept in manifest files.
+    """
+
+    archive: str
+    sha256: str
+    row_count: int
+    months: list[date]
+    loaded_at: datetime
+    remote: RemoteVersion | None = None
+    files: list[str] = field(default_factory=list)
+
+
+type Manifest = dict[str, ManifestEntry]
+
+
+def read_manifest(conn: duckdb.DuckDBPyConnection) -> Manifest:
+    """
+    Entries of the manifest table by archive, created when it does not exist.
+    """
+    conn.execute(SQL_CREATE_MANIFEST)
+    rows = conn.execute(SQL_READ_MANIFEST).fetchall()
+    return {
+        row[0]: ManifestEntry(
+            *row[:5],
+            remote=RemoteVersion(*row[5:]) if any(row[5:]) else None,
+        )
+        for row in rows
+    }
+
+
+def record_archive(conn: duckdb.DuckDBPyConnection, entry: ManifestEntry) -> None:
+    """
+    Add or replace the manifest entry of an archive.
+    """
+    conn.execute(SQL_CREATE_MANIFEST)
+    conn.execute(
+        SQL_RECORD_ARCHIVE,
+        {
+            'archive': entry.archive,
+            'sha256': entry.sha256,
+            'row_count': entry.row_count,
+            'months': entry.months,
+            'loaded_at': entry.loaded_at,
+            **asdict(entry.remote or RemoteVersion()),
+        },
+    )
+
+
+def clear_manifest(conn: duckdb.DuckDBPyConnection) -> None:
+    """
+    Forget all entries, so every archive is loaded again.
+    """
+    conn.execute(SQL_CREATE_MANIFEST)
+    conn.execute(SQL_CLEAR_MANIFEST)
+
+
+def read_manifest_file(path: Path) -> Manifest:
+    """
+    Entries of a manifest file by archive, empty when the file does not exist.
+    """
+    if not path.exists():
+        return {}
+    return {
+        archive: ManifestEntry(
+            archive=archive,
+            sha256=entry['sha256'],
+            row_count=entry['row_count'],
+            months=[date.fromisoformat(m) for m in entry['months']],
+            loaded_at=datetime.fromisoformat(entry['loaded_at']),
+            remote=RemoteVersion(**entry['remote']) if entry.get('remote') else None,
+            files=entry.get('files', []),
+        )
+        for archive, entry in json.loads(path.read_text()).items()
+    }
+
+
+def write_manifest_file(path: Path, manifest: Manifest) -> None:
+    """
+    Replace a manifest file, so readers never see a partly written one.
+    """
+    content = {
+        archive: {
+            'sha256': entry.sha256,
+            'row_count': entry.row_count,
+            'months': [m.isoformat() for m in entry.months],
+            'loaded_at': entry.loaded_at.isoformat(),
+            'remote': asdict(entry.remote) if entry.remote else None,
+            'files': entry.files,
+        }
+        for archive, entry in sorted(manifest.items())
+    }
+    temporary = path.with_name(f'.{path.name}.tmp')
+    temporary.write_text(json.dumps(content, indent=2))
+    os.replace(temporary, path)
@@ -0,0 +1,225 @@
+"""
+Speculative prefetch of the months next to the selected one.
+
+Users step the month slider back and forth, so after each render the metrics of the
+adjacent months are computed in the background and the next form submit is a cache
+hit.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+
+import duckdb
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.runtime.state.session_state_proxy import SessionStateProxy
+
+from data_manager import get_month_metrics, get_total_rides
+from database import DatabaseConnection, QueryScope
+from state_manager import StateKeys
+from utils import last_day_of_month
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PrefetchRequest:
+    """
+    Selection whose metrics are computed ahead of time.
+    """
+
+    date_range: tuple[date, date]
+    tr_types: tuple[str, ...]
+    watermark: int
+
+
+class Prefetcher:
+    """
+    Background worker that computes the metrics of likely next selections.
+
+    Requests run one at a time and only while no cursor of the pool is in use, so
+    the prefetch never competes with interactive queries. A running request is
+    interrupted through its query scope as soon as an interactive query checks out
+    a cursor, and dropped. Waiting requests are kept per session, taken in turn,
+    and every submit replaces the requests its session still has waiting, as they
+    belong to a selection the user has left. A request waiting in several sessions
+    runs once.
+    """
+
+    def __init__(self, db: DatabaseConnection, idle_poll_s: float = 0.05) -> None:
+        """
+        Initialize the prefetcher, the worker thread starts on the first submit.
+        """
+        self._db = db
+        self._idle_poll_s = idle_poll_s
+        self._pending: dict[str, list[PrefetchRequest]] = {}
+        self._running: PrefetchRequest | None = None
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self.completed = 0
+        self.interrupted = 0
+
+    def submit(self, session_id: str, requests: list[PrefetchRequest]) -> None:
+        """
+        Replace the waiting requests of a session and start the worker if needed.
+        """
+        with self._condition:
+            self._pending.pop(session_id, None)
+            waiting = [r for r in requests if r != self._running]
+            if waiting:
+                self._pending[session_id] = waiting
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='prefetch', daemon=True
+                )
+                self._thread.start()
+            self._condition.notify_all()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Wait until all requests are done, returns False on timeout.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._pending and self._running is None, timeout
+            )
+
+    def _run(self) -> None:
+        """
+        Run requests as they arrive.
+        """
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: bool(self._pending))
+            self._wait_until_idle()
+
+            with self._condition:
+                if not self._pending:
+                    continue
+                request = self._running = self._take()
+
+            scope = QueryScope()
+            fetched = threading.Event()
+            watcher = threading.Thread(
+                target=self._watch,
+                args=(scope, fetched),
+                name='prefetch-watch',
+                daemon=True,
+            )
+            watcher.start()
+            yielded = False
+            try:
+                with self._db.scope(scope):
+                    self._fetch(request)
+            except duckdb.InterruptException:
+                yielded = True
+                logger.info('Prefetch of %s yielded', request.date_range[0])
+            except Exception:
+                logger.exception('Prefetch of %s failed', request.date_range)
+            finally:
+                fetched.set()
+                watcher.join()
+
+            with self._condition:
+                self._running = None
+                if yielded:
+                    self.interrupted += 1
+                else:
+                    self.completed += 1
+                self._condition.notify_all()
+
+    def _take(self) -> PrefetchRequest:
+        """
+        Take the next request of the first session and move it behind the others.
+
+        Equal requests waiting in other sessions are removed, so each runs once.
+        """
+        session_id = next(iter(self._pending))
+        requests = self._pending.pop(session_id)
+        request = requests.pop(0)
+        if requests:
+            self._pending[session_id] = requests
+        for other in list(self._pending):
+            remaining = [r for r in self._pending[other] if r != request]
+            if remaining:
+                self._pending[other] = remaining
+            else:
+                del self._pending[other]
+        return request
+
+    def _wait_until_idle(self) -> None:
+        """
+        Wait until no cursor is checked out by an interactive query.
+        """
+        while self._db.pool.stats.in_use > 0:
+            time.sleep(self._idle_poll_s)
+
+    def _watch(self, scope: QueryScope, fetched: threading.Event) -> None:
+        """
+        Cancel scope when an interactive query runs before the prefetch is done.
+
+        The prefetch holds at most one cursor at a time, so any further cursor in
+        use belongs to another query.
+        """
+        while not fetched.wait(self._idle_poll_s):
+            if self._db.pool.stats.in_use > 1:
+                scope.cancel()
+                return
+
+    def _fetch(self, request: PrefetchRequest) -> None:
+        """
+        Compute the metrics of a request into the data_manager caches.
+        """
+        start = time.perf_counter()
+        tr_types = list(request.tr_types)
+        get_month_metrics(
+            self._db, request.date_range, tr_types, watermark=request.watermark
+        )
+        get_total_rides(
+            self._db, request.date_range[1], tr_types, watermark=request.watermark
+        )
+        logger.info(
+            'Prefetched %s in %.2f s',
+            request.date_range[0],
+            time.perf_counter() - start,
+        )
+
+
+@st.cache_resource(show_spinner=False)
+def get_prefetcher(_db: DatabaseConnection) -> Prefetcher:
+    """
+    Get the prefetcher of the server process.
+    """
+    return Prefetcher(_db)
+
+
+def prefetch_adjacent_months(
+    db: DatabaseConnection,
+    session_state: SessionStateProxy,
+) -> None:
+    """
+    Prefetch the metrics of the months next to the selected one.
+
+    The next month is fetched first, then the previous one.
+    """
+    months: list[date] = session_state[StateKeys.AVAILABLE_MONTHS]
+    selected: date = session_state[StateKeys.SELECTED_MONTH]
+    tr_types = tuple(session_state[StateKeys.SELECTED_TR_TYPES])
+    if selected not in months or not tr_types:
+        return
+
+    i = months.index(selected)
+    adjacent = [months[j] for j in (i + 1, i - 1) if 0 <= j < len(months)]
+    watermark = session_state.get(StateKeys.DATA_VERSION, 0)
+    ctx = get_script_run_ctx(suppress_warning=True)
+
+    get_prefetcher(db).submit(
+        ctx.session_id if ctx is not None else '',
+        [
+            PrefetchRequest((month, last_day_of_month(month)), tr_types, watermark)
+            for month in adjacent
+        ],
+    )
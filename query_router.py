@@ -0,0 +1,261 @@
+"""
+Route queries to the cheapest table that can answer them exactly.
+"""
+
+import logging
+import threading
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import date
+from enum import Enum
+from typing import Final
+
+import duckdb
+import streamlit as st
+
+from database import DatabaseConnection
+from rollups import (
+    COVERAGE_TABLE,
+    DAILY_TABLE,
+    HOURLY_TABLE,
+    MONTHLY_TABLE,
+    VEHICLES_TABLE,
+)
+from utils import last_day_of_month
+
+logger = logging.getLogger(__name__)
+
+
+class Grain(str, Enum):
+    """
+    Finest level of detail a query needs from its source.
+    """
+
+    MONTH = 'month'
+    DAY = 'day'
+    HOUR = 'hour'
+    VEHICLE = 'vehicle'
+
+
+class Source(str, Enum):
+    """
+    Tables a query can be answered from, ordered from cheapest to most expensive.
+    """
+
+    MONTHLY = MONTHLY_TABLE
+    DAILY = DAILY_TABLE
+    VEHICLES = VEHICLES_TABLE
+    HOURLY = HOURLY_TABLE
+    RAW = 'validacijas'
+
+
+SOURCE_GRAINS: Final[dict[Source, frozenset[Grain]]] = {
+    Source.MONTHLY: frozenset({Grain.MONTH}),
+    Source.DAILY: frozenset({Grain.MONTH, Grain.DAY}),
+    Source.VEHICLES: frozenset({Grain.MONTH, Grain.DAY, Grain.VEHICLE}),
+    Source.HOURLY: frozenset({Grain.MONTH, Grain.DAY, Grain.HOUR}),
+    Source.RAW: frozenset(Grain),
+}
+
+SQL_ROLLUP_COVERAGE: Final[str] = f"""--sql
+    select
+        table_name,
+        covered_from,
+        covered_until
+    from
+        {COVERAGE_TABLE};
+    """
+
+# Raw records exposed with the rollup column names. Filters stay on `Laiks` so they
+# are pushed down to the scan of validacijas.
+SQL_RAW_SOURCE: Final[str] = """--sql
+    (
+        select
+            Laiks,
+            date_trunc('month', Laiks)::DATE as month,
+            date(Laiks) as day,
+            hour(Laiks) as hour,
+            (1 << (dayofmonth(Laiks) - 1))::UINTEGER as day_mask,
+            TranspVeids,
+            TMarsruts,
+            GarNr,
+            1 as ride_count
+        from
+            validacijas
+        {where_clause}
+    )
+    """
+
+# Day level rollups also expose the month columns of validacijas_monthly.
+SQL_DAY_ROLLUP_SOURCE: Final[str] = """--sql
+    (
+        select
+            *,
+            date_trunc('month', day)::DATE as month,
+            (1 << (dayofmonth(day) - 1))::UINTEGER as day_mask
+        from
+            {table}
+        {where_clause}
+    )
+    """
+
+SQL_MONTH_ROLLUP_SOURCE: Final[str] = """--sql
+    (
+        select
+            *
+        from
+            {table}
+        {where_clause}
+    )
+    """
+
+
+@dataclass(frozen=True)
+class RoutedQuery:
+    """
+    SQL query template whose source placeholders are filled in by the router.
+
+    Every placeholder in `grains` is replaced with a filtered subquery of the
+    cheapest source that has the required grain and covers the filtered dates.
+    The subqueries expose the rollup columns month, day, hour, day_mask, TranspVeids,
+    TMarsruts, GarNr and ride_count, as far as the chosen source has them.
+    """
+
+    name: str
+    sql: str
+    grains: dict[str, Grain]
+
+
+_route_counts_lock = threading.Lock()
+route_counts: Counter[tuple[str, Source]] = Counter()
+"""Number of times each (query, source) pair was chosen in this process."""
+
+
+def route_count_snapshot() -> dict[tuple[str, Source], int]:
+    """
+    Copy of route_counts, safe to read while queries are rendered.
+    """
+    with _route_counts_lock:
+        return dict(route_counts)
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def get_rollup_coverage(_db: DatabaseConnection) -> dict[Source, tuple[date, date]]:
+    """
+    Get the first and last day covered by each rollup table.
+
+    Returns an empty dict when the database has no rollups, so every query is
+    answered from the raw table.
+    """
+    try:
+        with _db.cursor():
+            rows = _db.get_relation(SQL_ROLLUP_COVERAGE).fetchall()
+    except duckdb.CatalogException:
+        logger.warning('Rollup coverage table not found, using raw data only.')
+        return {}
+
+    sources = {source.value: source for source in Source}
+    return {
+        sources[table_name]: (covered_from, covered_until)
+        for table_name, covered_from, covered_until in rows
+        if table_name in sources
+    }
+
+
+def route(
+    grain: Grain,
+    coverage: dict[Source, tuple[date, date]],
+    date_range: tuple[date, date] | None = None,
+    up_to_date: date | None = None,
+) -> Source:
+    """
+    Choose the cheapest source with the grain that covers the filtered dates.
+
+    The monthly rollup is only exact when the date filters select whole months.
+    Queries without a start date rely on the rollups covering the raw data from its
+    first day, which holds as refresh_rollups aggregates all of it and refresh_month
+    only extends the coverage.
+    """
+    first_day, last_day = date_range if date_range else (None, up_to_date)
+
+    for source in Source:
+        if grain not in SOURCE_GRAINS[source]:
+            continue
+        if source is Source.RAW:
+            break
+        if source is Source.MONTHLY and not _whole_months(date_range, up_to_date):
+            continue
+        if source not in coverage:
+            continue
+        covered_from, covered_until = coverage[source]
+        if first_day is not None and first_day < covered_from:
+            continue
+        if last_day is None or last_day <= covered_until:
+            return source
+
+    return Source.RAW
+
+
+def _whole_months(
+    date_range: tuple[date, date] | None,
+    up_to_date: date | None,
+) -> bool:
+    """
+    Check whether the date filters select whole months only.
+    """
+    if date_range:
+        start_date, end_date = date_range
+        return start_date.day == 1 and end_date == last_day_of_month(end_date)
+    if up_to_date:
+        return up_to_date == last_day_of_month(up_to_date)
+    return True
+
+
+def render(
+    query: RoutedQuery,
+    coverage: dict[Source, tuple[date, date]],
+    where_clause: Callable[[str], str],
+    date_range: tuple[date, date] | None = None,
+    up_to_date: date | None = None,
+) -> str:
+    """
+    Fill the source placeholders of the query with routed, filtered subqueries.
+
+    Args:
+        query: query template to render
+        coverage: rollup coverage from get_rollup_coverage
+        where_clause: builds the where clause for the given date column
+        date_range: date range filter of the query
+        up_to_date: upper date bound filter of the query
+
+    Returns:
+        SQL query string
+    """
+    subqueries: dict[str, str] = {}
+
+    for placeholder, grain in query.grains.items():
+        source = route(grain, coverage, date_range, up_to_date)
+        match source:
+            case Source.RAW:
+                subqueries[placeholder] = SQL_RAW_SOURCE.format(
+                    where_clause=where_clause('Laiks'),
+                )
+            case Source.MONTHLY:
+                subqueries[placeholder] = SQL_MONTH_ROLLUP_SOURCE.format(
+                    table=source.value,
+                    where_clause=where_clause('month'),
+                )
+            case _:
+                subqueries[placeholder] = SQL_DAY_ROLLUP_SOURCE.format(
+                    table=source.value,
+                    where_clause=where_clause('day'),
+                )
+
+        with _route_counts_lock:
+            route_counts[query.name, source] += 1
+        logger.info(
+            'Query %s (%s) served from %s', query.name, placeholder, source.value
+        )
+
+    return query.sql.format(**subqueries)
@@ -0,0 +1,155 @@
+"""
+Persistent query result cache shared by app processes and restarts.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import polars as pl
+import streamlit as st
+from polars import DataFrame
+
+logger = logging.getLogger(__name__)
+
+# Temporary files older than this belong to writers killed before the rename
+STALE_TMP_S = 10 * 60
+
+
+class ResultCache:
+    """
+    Query results stored as Arrow IPC files in a local directory.
+
+    Files are written under a temporary name and renamed into place, so readers in
+    other processes never see a partial file, and temporary files left by killed
+    writers are removed once stale. A hit refreshes the file's mtime and every
+    write evicts the least recently used files beyond max_bytes. Without a path
+    the cache is disabled.
+    """
+
+    def __init__(self, path: str | None = None, max_bytes: int = 512 * 2**20) -> None:
+        """
+        Initialize the cache in path, creating the directory when needed.
+        """
+        self._dir = Path(path) if path else None
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self._dir is not None:
+            self._dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether results are stored on disk.
+        """
+        return self._dir is not None
+
+    @staticmethod
+    def key(query: str, params: dict, version: str) -> str:
+        """
+        Cache key of a query, its parameters and the data version.
+
+        Whitespace in the query text is normalized, so formatting does not matter.
+        """
+        payload = json.dumps(
+            {'query': ' '.join(query.split()), 'params': params, 'version': version},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> DataFrame | None:
+        """
+        Get a cached result, or None when it is missing or unreadable.
+        """
+        if self._dir is None:
+            return None
+        file = self._dir / f'{key}.arrow'
+        try:
+            df = pl.read_ipc(file)
+        except (OSError, pl.exceptions.PolarsError) as error:
+            logger.debug('Cached result %s not read: %s', file, error)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        try:
+            os.utime(file)
+        except OSError as error:
+            logger.debug('Cached result %s not touched: %s', file, error)
+        return df
+
+    def put(self, key: str, df: DataFrame) -> None:
+        """
+        Store a result and evict the least recently used results over the limit.
+        """
+        if self._dir is None:
+            return
+        file = self._dir / f'{key}.arrow'
+        tmp = file.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            df.write_ipc(tmp)
+            tmp.replace(file)
+        except (OSError, pl.exceptions.PolarsError) as error:
+            logger.warning('Could not write cached result %s: %s', file, error)
+            tmp.unlink(missing_ok=True)
+            return
+        self._evict(self._dir)
+
+    def clear(self) -> None:
+        """
+        Remove all cached results and stale temporary files.
+        """
+        if self._dir is None:
+            return
+        for file in self._dir.glob('*.arrow'):
+            file.unlink(missing_ok=True)
+        self._remove_stale_tmp(self._dir)
+
+    def _evict(self, directory: Path) -> None:
+        """
+        Remove the least recently used files until the cache fits in max_bytes.
+        """
+        self._remove_stale_tmp(directory)
+        files: list[tuple[float, int, Path]] = []
+        for file in directory.glob('*.arrow'):
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, file))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, file in sorted(files):
+            if total <= self._max_bytes:
+                break
+            file.unlink(missing_ok=True)
+            total -= size
+
+    @staticmethod
+    def _remove_stale_tmp(directory: Path) -> None:
+        """
+        Remove temporary files not renamed into place within STALE_TMP_S.
+        """
+        cutoff = time.time() - STALE_TMP_S
+        for file in directory.glob('*.tmp'):
+            try:
+                if file.stat().st_mtime < cutoff:
+                    file.unlink()
+            except FileNotFoundError:
+                continue
+
+
+_config = st.secrets.duckdb
+
+result_cache = ResultCache(
+    path=_config.get('result_cache_path'),
+    max_bytes=_config.get('result_cache_max_mb', 512) * 2**20,
+)
@@ -0,0 +1,329 @@
+"""
+Pre-aggregated rollup tables of the validacijas data.
+
+Every dashboard metric is a count of rides grouped by some mix of day, hour, weekday,
+transport type and route, so the getters in data_manager read these rollups instead
+of the raw validation records whenever they cover the requested dates:
+
+- validacijas_daily - rides per (day, TranspVeids, TMarsruts)
+- validacijas_hourly - rides per (day, hour, TranspVeids, TMarsruts)
+- validacijas_vehicles - rides per (day, TranspVeids, TMarsruts, GarNr), needed for
+  the distinct vehicle counts of route density
+- validacijas_monthly - rides per (month, TranspVeids) with a bitmask of the days
+  of month that have data, so days with data stay exact for any transport types
+- rollup_coverage - first day and last covered day of every rollup
+- ingest_log - one row per refresh with an increasing sequence number and the dates
+  it loaded, the data version that the data_manager caches are keyed by
+
+When a new month is loaded, refresh_month aggregates only that month and swaps it
+into the rollups, so the work is proportional to the month and not to the history.
+"""
+
+import argparse
+from datetime import date
+
+import duckdb
+
+from utils import last_day_of_month
+
+DAILY_TABLE = 'validacijas_daily'
+HOURLY_TABLE = 'validacijas_hourly'
+VEHICLES_TABLE = 'validacijas_vehicles'
+MONTHLY_TABLE = 'validacijas_monthly'
+COVERAGE_TABLE = 'rollup_coverage'
+INGEST_LOG_TABLE = 'ingest_log'
+
+SQL_REFRESH_HOURLY = f"""--sql
+    create or replace table {HOURLY_TABLE} as
+    select
+        date(Laiks) as day,
+        hour(Laiks) as hour,
+        TranspVeids,
+        TMarsruts,
+        count(*) as ride_count
+    from
+        validacijas
+    group by all
+    order by day, hour;
+    """
+
+SQL_REFRESH_DAILY = f"""--sql
+    create or replace table {DAILY_TABLE} as
+    select
+        day,
+        TranspVeids,
+        TMarsruts,
+        sum(ride_count)::BIGINT as ride_count
+    from
+        {HOURLY_TABLE}
+    group by all
+    order by day;
+    """
+
+SQL_REFRESH_MONTHLY = f"""--sql
+    create or replace table {MONTHLY_TABLE} as
+    select
+        date_trunc('month', day)::DATE as month,
+        TranspVeids,
+        sum(ride_count)::BIGINT as ride_count,
+        bit_or((1 << (dayofmonth(day) - 1))::UINTEGER) as day_mask
+    from
+        {DAILY_TABLE}
+    group by all
+    order by month;
+    """
+
+SQL_REFRESH_VEHICLES = f"""--sql
+    create or replace table {VEHICLES_TABLE} as
+    select
+        date(Laiks) as day,
+        TranspVeids,
+        TMarsruts,
+        GarNr,
+        count(*) as ride_count
+    from
+        validacijas
+    group by all
+    order by day;
+    """
+
+# Data is loaded in whole months, so a rollup covers its data up to the end of the
+# last month it contains.
+SQL_REFRESH_COVERAGE = f"""--sql
+    create or replace table {COVERAGE_TABLE} as
+    select
+        table_name,
+        covered_from,
+        covered_until,
+        now() as refreshed_at
+    from
+    (
+        select '{DAILY_TABLE}' as table_name, min(day) as covered_from,
+            last_day(max(day)) as covered_until from {DAILY_TABLE}
+        union all
+        select '{HOURLY_TABLE}', min(day), last_day(max(day)) from {HOURLY_TABLE}
+        union all
+        select '{VEHICLES_TABLE}', min(day), last_day(max(day)) from {VEHICLES_TABLE}
+        union all
+        select '{MONTHLY_TABLE}', min(month), last_day(max(month)) from {MONTHLY_TABLE}
+    )
+    where covered_until is not null;
+    """
+
+
+SQL_STAGE_HOURLY = """--sql
+    create or replace temp table stage_hourly as
+    select
+        date(Laiks) as day,
+        hour(Laiks) as hour,
+        TranspVeids,
+        TMarsruts,
+        count(*) as ride_count
+    from
+        validacijas
+    where
+        Laiks >= $start_date and Laiks < $end_date::DATE + 1
+    group by all
+    order by day, hour;
+    """
+
+SQL_STAGE_VEHICLES = """--sql
+    create or replace temp table stage_vehicles as
+    select
+        date(Laiks) as day,
+        TranspVeids,
+        TMarsruts,
+        GarNr,
+        count(*) as ride_count
+    from
+        validacijas
+    where
+        Laiks >= $start_date and Laiks < $end_date::DATE + 1
+    group by all
+    order by day;
+    """
+
+SQL_MERGE_MONTH = f"""--sql
+    delete from {HOURLY_TABLE} where day >= $start_date and day <= $end_date;
+    insert into {HOURLY_TABLE} by name select * from stage_hourly;
+
+    delete from {DAILY_TABLE} where day >= $start_date and day <= $end_date;
+    insert into {DAILY_TABLE} by name
+    select
+        day,
+        TranspVeids,
+        TMarsruts,
+        sum(ride_count)::BIGINT as ride_count
+    from
+        stage_hourly
+    group by all
+    order by day;
+
+    delete from {MONTHLY_TABLE} where month = $start_date;
+    insert into {MONTHLY_TABLE} by name
+    select
+        date_trunc('month', day)::DATE as month,
+        TranspVeids,
+        sum(ride_count)::BIGINT as ride_count,
+        bit_or((1 << (dayofmonth(day) - 1))::UINTEGER) as day_mask
+    from
+        stage_hourly
+    group by all;
+
+    delete from {VEHICLES_TABLE} where day >= $start_date and day <= $end_date;
+    insert into {VEHICLES_TABLE} by name select * from stage_vehicles;
+    """
+
+SQL_MERGE_COVERAGE = f"""--sql
+    create or replace table {COVERAGE_TABLE} as
+    select
+        t.table_name,
+        least(c.covered_from, $start_date::DATE) as covered_from,
+        greatest(c.covered_until, $end_date::DATE) as covered_until,
+        now() as refreshed_at
+    from
+        (
+            values
+                ('{DAILY_TABLE}'),
+                ('{HOURLY_TABLE}'),
+                ('{VEHICLES_TABLE}'),
+                ('{MONTHLY_TABLE}')
+        ) as t(table_name)
+    left join
+        {COVERAGE_TABLE} as c using (table_name);
+    """
+
+SQL_CREATE_INGEST_LOG = f"""--sql
+    create table if not exists {INGEST_LOG_TABLE}
+    (
+        seq BIGINT primary key,
+        loaded_from DATE,
+        loaded_until DATE,
+        loaded_at TIMESTAMP
+    );
+    """
+
+# A full rebuild can change any date, so its entry has open bounds.
+SQL_LOG_INGEST = f"""--sql
+    insert into {INGEST_LOG_TABLE}
+    select
+        coalesce(max(seq), 0) + 1,
+        $start_date::DATE,
+        $end_date::DATE,
+        now()
+    from
+        {INGEST_LOG_TABLE};
+    """
+
+SQL_ROLLUP_TABLES = """--sql
+    select
+        table_name
+    from
+        duckdb_tables()
+    where
+        database_name = current_database()
+        and schema_name = current_schema();
+    """
+
+
+def refresh_rollups(conn: duckdb.DuckDBPyConnection) -> None:
+    """
+    Rebuild all rollup tables from the validacijas table in one transaction.
+
+    The rebuild is logged in the ingest log without date bounds, as it may change
+    any date.
+    """
+    conn.execute('begin transaction;')
+    try:
+        conn.execute(SQL_REFRESH_HOURLY)
+        conn.execute(SQL_REFRESH_DAILY)
+        conn.execute(SQL_REFRESH_MONTHLY)
+        conn.execute(SQL_REFRESH_VEHICLES)
+        conn.execute(SQL_REFRESH_COVERAGE)
+        conn.execute(SQL_CREATE_INGEST_LOG)
+        conn.execute(SQL_LOG_INGEST, {'start_date': None, 'end_date': None})
+    except Exception:
+        conn.execute('rollback;')
+        raise
+    conn.execute('commit;')
+
+
+def refresh_month(conn: duckdb.DuckDBPyConnection, month: date) -> None:
+    """
+    Aggregate one month of validacijas and swap it into the rollups.
+
+    The month is aggregated into temporary staging tables first. The old rows of the
+    month are then replaced in a single transaction, so readers see either the old or
+    the new rollups, never a half-built one. The same transaction logs the month in
+    the ingest log. Builds all rollups from scratch when they do not exist yet.
+
+    Args:
+        conn: read-write connection to the database with the validacijas table
+        month: any day of the month to refresh
+    """
+    tables = {row[0] for row in conn.execute(SQL_ROLLUP_TABLES).fetchall()}
+    rollups = {DAILY_TABLE, HOURLY_TABLE, VEHICLES_TABLE, MONTHLY_TABLE}
+    if not rollups | {COVERAGE_TABLE} <= tables:
+        refresh_rollups(conn)
+        return
+
+    start_date = month.replace(day=1)
+    params = {'start_date': start_date, 'end_date': last_day_of_month(start_date)}
+
+    conn.execute(SQL_STAGE_HOURLY, params)
+    conn.execute(SQL_STAGE_VEHICLES, params)
+
+    conn.execute('begin transaction;')
+    try:
+        _execute_script(conn, SQL_MERGE_MONTH, params)
+        conn.execute(SQL_MERGE_COVERAGE, params)
+        conn.execute(SQL_CREATE_INGEST_LOG)
+        conn.execute(SQL_LOG_INGEST, params)
+    except Exception:
+        conn.execute('rollback;')
+        raise
+    conn.execute('commit;')
+
+    conn.execute('drop table if exists stage_hourly;')
+    conn.execute('drop table if exists stage_vehicles;')
+
+
+def _execute_script(
+    conn: duckdb.DuckDBPyConnection,
+    script: str,
+    params: dict[str, date],
+) -> None:
+    """
+    Execute semicolon separated statements, each with the parameters it references.
+    """
+    for statement in script.split(';'):
+        if statement.strip():
+            used = {name: v for name, v in params.items() if f'${name}' in statement}
+            conn.execute(statement, used)
+
+
+def main() -> None:
+    """
+    Rebuild the rollups of a DuckDB or MotherDuck database.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        'database',
+        help='DuckDB database file or MotherDuck connection string (md:...)',
+    )
+    parser.add_argument(
+        '--month',
+        type=lambda value: date.fromisoformat(f'{value}-01'),
+        help='only refresh this month (YYYY-MM) instead of the whole history',
+    )
+    args = parser.parse_args()
+
+    with duckdb.connect(args.database) as conn:
+        if args.month:
+            refresh_month(conn, args.month)
+        else:
+            refresh_rollups(conn)
+
+
+if __name__ == '__main__':
+    main()
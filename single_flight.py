@@ -0,0 +1,111 @@
+"""
+Coalescing of identical concurrent queries.
+"""
+
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, wait
+
+import duckdb
+
+from database import QueryScope
+
+WAIT_POLL_S = 0.05
+
+
+class SingleFlight[T]:
+    """
+    Runs one call per key at a time and shares its result with concurrent callers.
+
+    The first caller of a key executes it, callers arriving while it runs wait
+    and get the same result or exception. Exceptions of the retry_on types belong
+    to the executing caller only, e.g. its interrupted session, and the waiting
+    callers run the call again instead. Waiting callers still honour their own
+    query scope and timeout.
+    """
+
+    def __init__(self, retry_on: tuple[type[BaseException], ...] = ()) -> None:
+        """
+        Initialize without running calls.
+        """
+        self._lock = threading.Lock()
+        self._calls: dict[str, Future[T]] = {}
+        self._retry_on = retry_on
+        self.executions = 0
+        self.shared = 0
+
+    def do(
+        self,
+        key: str,
+        call: Callable[[], T],
+        scope: QueryScope | None = None,
+        timeout: float | None = None,
+    ) -> tuple[T, bool]:
+        """
+        Run call, or wait for the running call of the same key.
+
+        Args:
+            key: calls with equal keys are coalesced
+            call: function to run when no call of key is running
+            scope: query scope of the caller, waiting stops when it is cancelled
+            timeout: seconds to wait for a running call, None waits forever
+
+        Returns:
+            The result and whether it was shared from another caller
+
+        Raises:
+            TimeoutError: the running call did not finish within timeout
+            duckdb.InterruptException: scope was cancelled while waiting
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                if future is None:
+                    future = self._calls[key] = Future()
+                    self.executions += 1
+                    break
+                self.shared += 1
+
+            _wait(future, scope, deadline, timeout)
+            try:
+                return future.result(), True
+            except self._retry_on:
+                continue
+
+        try:
+            result = call()
+        except BaseException as error:
+            self._finish(key)
+            future.set_exception(error)
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result, False
+
+    def _finish(self, key: str) -> None:
+        """
+        Let the next caller of key execute it again.
+        """
+        with self._lock:
+            del self._calls[key]
+
+
+def _wait(
+    future: Future,
+    scope: QueryScope | None,
+    deadline: float | None,
+    timeout: float | None,
+) -> None:
+    """
+    Wait until future is done, checking scope and deadline in between.
+    """
+    while not wait([future], timeout=WAIT_POLL_S).done:
+        if scope is not None and scope.cancelled:
+            raise duckdb.InterruptException('Vaicājums ir atcelts.')
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f'Vaicājums netika izpildīts {timeout} s laikā.')
+
+
+in_flight: SingleFlight = SingleFlight(retry_on=(duckdb.InterruptException,))
@@ -2,25 +2,33 @@
 Functions for st.session_state management.
 """
 
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import date
 from enum import Enum
+from functools import partial
 
+import streamlit as st
+from streamlit.runtime.scriptrunner import (
+    ScriptRunContext,
+    add_script_run_ctx,
+    get_script_run_ctx,
+)
 from streamlit.runtime.state.session_state_proxy import SessionStateProxy
 
 from data_manager import (
     get_available_months,
     get_available_tr_types,
-    get_peak_day,
-    get_peak_hour,
-    get_popular_routes,
-    get_rides_per_day,
-    get_route_density,
+    get_month_metrics,
     get_total_rides,
-    get_tr_distribution,
+    get_watermark,
 )
-from database import DatabaseConnection
+from database import DatabaseConnection, QueryScope
 from utils import last_day_of_month
 
+RERUN_POLL_S = 0.1
+
 
 class StateKeys(str, Enum):
     """
@@ -32,6 +40,7 @@ class StateKeys(str, Enum):
     AVAILABLE_TR_TYPES = 'available_tr_types'
     SELECTED_TR_TYPES = 'selected_tr_types'
     METRICS = 'metrics'
+    DATA_VERSION = 'data_version'
 
 
 class MetricsKeys(str, Enum):
@@ -53,9 +62,18 @@ def init_state(db: DatabaseConnection, session_state: SessionStateProxy) -> None
     Initializes necessary st.session_state objects.
     """
 
+    # Data version, checked on every rerun
+    watermark = get_watermark(db)
+    if StateKeys.DATA_VERSION not in session_state:
+        session_state[StateKeys.DATA_VERSION] = watermark
+    elif session_state[StateKeys.DATA_VERSION] != watermark:
+        reload_data(db, session_state, watermark)
+
     # Available months
     if StateKeys.AVAILABLE_MONTHS not in session_state:
-        session_state[StateKeys.AVAILABLE_MONTHS] = get_available_months(db)
+        session_state[StateKeys.AVAILABLE_MONTHS] = get_available_months(
+            db, watermark=watermark
+        )
 
     # Default month
     default_month = session_state[StateKeys.AVAILABLE_MONTHS][-1]
@@ -74,32 +92,77 @@ def init_state(db: DatabaseConnection, session_state: SessionStateProxy) -> None
         session_state[StateKeys.SELECTED_TR_TYPES] = session_state[
             StateKeys.AVAILABLE_TR_TYPES
         ]
-    # Metrics for initial app load
+    # Metrics for initial app load, retried on the next rerun until one completes
     if StateKeys.METRICS not in session_state:
-        session_state[StateKeys.METRICS] = {}
-
         tr_types: list[str] = session_state[StateKeys.AVAILABLE_TR_TYPES]
 
-        update_metrics(
-            db=db,
-            session_state=session_state,
-            date_range=(min_date, max_date),
-            tr_types=tr_types,
-        )
+        try:
+            update_metrics(
+                db=db,
+                session_state=session_state,
+                date_range=(min_date, max_date),
+                tr_types=tr_types,
+            )
+        except TimeoutError as error:
+            st.toast(body=str(error), icon=':material/timer_off:')
+
+
+def reload_data(
+    db: DatabaseConnection,
+    session_state: SessionStateProxy,
+    watermark: int,
+) -> None:
+    """
+    Reload months, transport types and metrics after new data was loaded.
+
+    The new data version is stored once the reload completes, so a reload that timed
+    out runs again on the next rerun. Cached results of date ranges without new
+    data keep their data version, so only the affected queries run again.
+    """
+    try:
+        months = get_available_months(db, watermark=watermark)
+        if StateKeys.METRICS in session_state:
+            min_date: date = session_state[StateKeys.SELECTED_MONTH]
+            date_range = (min_date, last_day_of_month(min_date))
+            update_available_tr_types(
+                db=db,
+                session_state=session_state,
+                date_range=date_range,
+                watermark=watermark,
+            )
+            update_metrics(
+                db=db,
+                session_state=session_state,
+                date_range=date_range,
+                tr_types=session_state[StateKeys.SELECTED_TR_TYPES],
+                watermark=watermark,
+            )
+    except TimeoutError as error:
+        st.toast(body=str(error), icon=':material/timer_off:')
+        return
+
+    session_state[StateKeys.AVAILABLE_MONTHS] = months
+    session_state[StateKeys.DATA_VERSION] = watermark
 
 
 def update_available_tr_types(
     db: DatabaseConnection,
     session_state: SessionStateProxy,
     date_range: tuple[date, date],
+    watermark: int | None = None,
 ) -> None:
     """
     Update available transport types based on current selections.
+
+    Without a watermark the data version of the session is used.
     """
+    if watermark is None:
+        watermark = session_state.get(StateKeys.DATA_VERSION, 0)
 
     available_tr_types = get_available_tr_types(
         db,
         date_range=date_range,
+        watermark=watermark,
     )
 
     session_state[StateKeys.AVAILABLE_TR_TYPES] = available_tr_types.get_column(
@@ -112,50 +175,77 @@ def update_metrics(
     session_state: SessionStateProxy,
     date_range: tuple[date, date],
     tr_types: list[str],
+    watermark: int | None = None,
 ) -> None:
     """
     Update all metrics in session state based on current selections.
+
+    The month history and the fused month metrics queries run concurrently, each
+    on its own thread and database cursor. The metrics are replaced only when both
+    complete. While they run, the script thread updates an empty placeholder, which
+    is a point where Streamlit stops the run for a newer rerun request. The queries
+    are then interrupted and the metrics are left unchanged. Without a watermark
+    the data version of the session is used.
     """
     min_date, max_date = date_range
-
-    session_state[StateKeys.METRICS][MetricsKeys.TOTAL_RIDES] = get_total_rides(
-        _db=db,
-        up_to_date=max_date,
-        tr_types=tr_types,
-    )
-
-    session_state[StateKeys.METRICS][MetricsKeys.RIDES_PER_DAY] = get_rides_per_day(
-        _db=db,
-        date_range=date_range,
-        tr_types=tr_types,
-    )
-
-    session_state[StateKeys.METRICS][MetricsKeys.PEAK_HOUR] = get_peak_hour(
-        _db=db,
-        date_range=date_range,
-        tr_types=tr_types,
-    )
-
-    session_state[StateKeys.METRICS][MetricsKeys.POPULAR_ROUTES] = get_popular_routes(
-        _db=db,
-        date_range=date_range,
-        tr_types=tr_types,
-    )
-
-    session_state[StateKeys.METRICS][MetricsKeys.TR_DISTRIBUTION] = get_tr_distribution(
-        _db=db,
-        date_range=date_range,
-        tr_types=tr_types,
-    )
-
-    session_state[StateKeys.METRICS][MetricsKeys.PEAK_DAY] = get_peak_day(
-        _db=db,
-        date_range=date_range,
-        tr_types=tr_types,
-    )
-
-    session_state[StateKeys.METRICS][MetricsKeys.ROUTE_DENSITY] = get_route_density(
-        _db=db,
-        date_range=date_range,
-        tr_types=tr_types,
-    )
+    if watermark is None:
+        watermark = session_state.get(StateKeys.DATA_VERSION, 0)
+
+    ctx = get_script_run_ctx(suppress_warning=True)
+    scope = QueryScope()
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='metrics') as executor:
+        total_rides = executor.submit(
+            _run_in_context,
+            ctx,
+            db,
+            scope,
+            partial(
+                get_total_rides,
+                _db=db,
+                up_to_date=max_date,
+                tr_types=tr_types,
+                watermark=watermark,
+            ),
+        )
+        month_metrics = executor.submit(
+            _run_in_context,
+            ctx,
+            db,
+            scope,
+            partial(
+                get_month_metrics,
+                _db=db,
+                date_range=date_range,
+                tr_types=tr_types,
+                watermark=watermark,
+            ),
+        )
+        futures = {total_rides, month_metrics}
+        placeholder = st.empty()
+        try:
+            while wait(futures, timeout=RERUN_POLL_S).not_done:
+                placeholder.empty()
+        except BaseException:
+            # Superseded by a newer rerun, which updates the metrics
+            scope.cancel()
+            raise
+
+    metrics = {MetricsKeys.TOTAL_RIDES: total_rides.result()}
+    for metric, df in month_metrics.result().items():
+        metrics[MetricsKeys[metric.name]] = df
+    session_state[StateKeys.METRICS] = metrics
+
+
+def _run_in_context[T](
+    ctx: ScriptRunContext | None,
+    db: DatabaseConnection,
+    scope: QueryScope,
+    query: Callable[[], T],
+) -> T:
+    """
+    Run query on a worker thread attached to the session's script run context.
+    """
+    if ctx is not None:
+        add_script_run_ctx(threading.current_thread(), ctx)
+    with db.scope(scope):
+        return query()
@@ -7,12 +7,22 @@ Loads CSV data from data.gov.lv and displays charts.
 import streamlit as st
 
 from database import db
+from diagnostics import is_diagnostics_request
+from prefetch import prefetch_adjacent_months
 from state_manager import StateKeys, init_state
 from utils import format_month_repr_long, last_day_of_month
+from warmup import WARMUP_MONTHS, start_warmup
 from widgets.charts import render_charts
+from widgets.diagnostics import render_diagnostics
 from widgets.metrics import render_metrics
 from widgets.sidebar import render_sidebar
 
+warmup = start_warmup(db, WARMUP_MONTHS)
+
+if is_diagnostics_request(st.query_params):
+    render_diagnostics(db, warmup)
+    st.stop()
+
 init_state(db, st.session_state)
 min_month = st.session_state[StateKeys.AVAILABLE_MONTHS][0]
 max_month = st.session_state[StateKeys.AVAILABLE_MONTHS][-1]
@@ -53,6 +63,9 @@ transporta veidu.
 
 render_sidebar(st.session_state)
 
-render_metrics(st.session_state)
+if StateKeys.METRICS in st.session_state:
+    render_metrics(st.session_state)
+
+    render_charts(st.session_state)
 
-render_charts(st.session_state)
+prefetch_adjacent_months(db, st.session_state)
@@ -105,3 +105,23 @@ def test_form_submit_leap_year_february(session_state):
             date_range=(date(2024, 2, 1), date(2024, 2, 29)),
             tr_types=['Tramvajs'],
         )
+
+
+def test_form_submit_timeout(session_state):
+    """Test form_submit shows a toast message when a query times out"""
+    session_state[StateKeys.SELECTED_TR_TYPES] = ['Tramvajs']
+
+    with (
+        patch('callbacks.st.toast') as mock_toast,
+        patch('callbacks.update_available_tr_types'),
+        patch(
+            'callbacks.update_metrics',
+            side_effect=TimeoutError('Vaicājums netika izpildīts 30 s laikā.'),
+        ),
+        patch('callbacks.db'),
+    ):
+        form_submit(session_state=session_state)
+
+    mock_toast.assert_called_once_with(
+        body='Vaicājums netika izpildīts 30 s laikā.', icon=':material/timer_off:'
+    )
@@ -1,48 +1,91 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
+import duckdb
 import polars as pl
 import pytest
+from polars.testing import assert_frame_equal
+from streamlit import cache_resource
 
 from data_manager import (
+    SQL_PEAK_DAY,
+    SQL_PEAK_HOUR,
+    SQL_POPULAR_ROUTES,
+    SQL_RIDES_PER_DAY,
+    SQL_ROUTE_DENSITY,
+    SQL_TR_DISTRIBUTION,
+    MonthMetric,
     _get_data_with_filters,
     get_available_months,
     get_available_tr_types,
-    get_peak_day,
-    get_peak_hour,
-    get_popular_routes,
-    get_rides_per_day,
-    get_route_density,
+    get_catalog,
+    get_data_version,
+    get_ingest_log,
+    get_month_components,
+    get_month_metrics,
     get_total_rides,
-    get_tr_distribution,
+    get_total_rides_components,
+    get_watermark,
 )
+from database import Backend, DatabaseConnection
+from instrumentation import QueryLog
+from query_router import get_rollup_coverage
+from result_cache import ResultCache
+from rollups import refresh_month, refresh_rollups
+from single_flight import SingleFlight
 
 
 @pytest.fixture
 def mock_db():
     """Mock DatabaseConnection with get_relation method"""
-    db = MagicMock()
+    db = MagicMock(current_scope=None, query_timeout_s=None)
     db.get_relation.return_value = MagicMock(
         pl=MagicMock(return_value=pl.DataFrame({'test': [1, 2]}))
     )
-    return db
+    with patch('data_manager.get_rollup_coverage', return_value={}):
+        yield db
 
 
 @pytest.fixture(autouse=True)
 def clear_cache():
     """Clear streamlit cache"""
-    get_available_months.clear()
-    get_available_tr_types.clear()
-    get_total_rides.clear()
-    get_rides_per_day.clear()
-    get_peak_hour.clear()
-    get_popular_routes.clear()
-    get_tr_distribution.clear()
-    get_peak_day.clear()
-    get_route_density.clear()
+    get_catalog.clear()
+    get_ingest_log.clear()
+    get_watermark.clear()
+    get_total_rides_components.clear()
+    get_month_components.clear()
+    get_rollup_coverage.clear()
     yield
 
 
+@pytest.fixture
+def duck_db(tmp_path):
+    """Local DuckDB database with a synthetic validacijas table"""
+    DatabaseConnection._instance = None
+    db_file = tmp_path / 'validacijas.duckdb'
+    with duckdb.connect(str(db_file)) as setup_conn:
+        setup_conn.execute(
+            """
+            create table validacijas as
+            select
+                timestamp '2025-06-25' + to_minutes(i * 7) as Laiks,
+                ['Autobuss', 'Tramvajs', 'Trolejbuss'][1 + i % 3] as TranspVeids,
+                'R' || floor(sqrt(i % 400))::INT as TMarsruts,
+                i % 37 as GarNr
+            from range(20000) t(i)
+            """
+        )
+        refresh_rollups(setup_conn)
+    db = DatabaseConnection(backend=Backend.DUCKDB, path=str(db_file))
+    yield db
+    db.conn.close()
+    DatabaseConnection._instance = None
+    cache_resource.clear()
+
+
 class TestGetDataWithFilters:
     """Test cases for _get_data_with_filters function"""
 
@@ -110,7 +153,7 @@ class TestGetDataWithFilters:
         _get_data_with_filters(
             db=mock_db,
             sql_query='select * from table {where_clause}',
-            up_to_date=up_to_date,
+            date_range=(None, up_to_date),
         )
         mock_db.get_relation.assert_called_once()
         call_args = mock_db.get_relation.call_args
@@ -118,17 +161,285 @@ class TestGetDataWithFilters:
         assert call_args.args[1]['up_to_date'] == up_to_date
 
 
+class TestResultCache:
+    """Test cases for the persistent result cache in _get_data_with_filters"""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        """Enabled result cache in a temporary directory"""
+        cache = ResultCache(str(tmp_path))
+        with patch('data_manager.result_cache', cache):
+            yield cache
+
+    def test_result_survives_memory_cache(self, duck_db, cache):
+        """Test that a cold process reads the result from disk"""
+        date_range = (date(2025, 7, 1), date(2025, 7, 31))
+        expected = get_month_components(duck_db, date_range, 'Tramvajs', data_version=1)
+
+        get_month_components.clear()
+        with patch.object(
+            duck_db, 'get_relation', wraps=duck_db.get_relation
+        ) as get_relation:
+            result = get_month_components(
+                duck_db, date_range, 'Tramvajs', data_version=1
+            )
+
+        assert_frame_equal(result, expected)
+        assert cache.hits == 1
+        get_relation.assert_not_called()
+
+    def test_keyed_by_data_version(self, duck_db, cache):
+        """Test that a new data version misses the persisted results"""
+        date_range = (date(2025, 7, 1), date(2025, 7, 31))
+        get_month_components(duck_db, date_range, data_version=1)
+
+        get_month_components.clear()
+        get_month_components(duck_db, date_range, data_version=2)
+
+        assert cache.hits == 0
+        assert cache.misses == 2
+
+    def test_unversioned_results_are_not_persisted(self, duck_db, cache, tmp_path):
+        """Test that results without a data version stay in memory only"""
+        get_month_components(duck_db, (date(2025, 7, 1), date(2025, 7, 31)))
+
+        assert not list(tmp_path.glob('*.arrow'))
+
+
+class TestQueryLog:
+    """Test cases for the query records of _get_data_with_filters"""
+
+    @pytest.fixture
+    def query_log(self):
+        """Query log without a file"""
+        query_log = QueryLog()
+        with patch('data_manager.query_log', query_log):
+            yield query_log
+
+    def test_records_query(self, duck_db, query_log):
+        """Test that a query is recorded by its name"""
+        date_range = (date(2025, 7, 1), date(2025, 7, 31))
+        result = get_month_components(duck_db, date_range, 'Tramvajs')
+
+        (record,) = query_log.recent
+        assert record.name == 'month_components'
+        assert record.rows == result.height
+        assert record.bytes == result.estimated_size()
+        assert record.params == {
+            'start_date': 'date',
+            'end_date': 'date',
+            'tr_types': 'list[1]',
+        }
+        assert record.cache == 'off'
+        assert record.wall_s > 0
+
+    def test_records_cache_outcome(self, duck_db, query_log, tmp_path):
+        """Test that persistent cache hits and misses are recorded"""
+        date_range = (date(2025, 7, 1), date(2025, 7, 31))
+        with patch('data_manager.result_cache', ResultCache(str(tmp_path))):
+            get_month_components(duck_db, date_range, data_version=1)
+            get_month_components.clear()
+            get_month_components(duck_db, date_range, data_version=1)
+
+        assert [r.cache for r in query_log.recent] == ['miss', 'hit']
+
+    def test_explains_slow_queries(self, duck_db):
+        """Test that slow queries are recorded with their EXPLAIN ANALYZE plan"""
+        query_log = QueryLog(explain_threshold_s=0)
+        with patch('data_manager.query_log', query_log):
+            get_month_components(duck_db, (date(2025, 7, 1), date(2025, 7, 31)))
+        query_log._explainer.shutdown(wait=True)  # ty:ignore[possibly-missing-attribute]
+
+        (record,) = query_log.recent
+        assert 'Total Time' in record.explain  # ty:ignore[unsupported-operator]
+
+
+class TestSingleFlight:
+    """Test cases for the coalescing of identical queries"""
+
+    def test_concurrent_identical_queries_run_once(self, mock_db):
+        """Test that concurrent sessions share one execution of a query"""
+        release = threading.Event()
+        df = pl.DataFrame({'test': [1, 2]})
+
+        def materialize():
+            release.wait(timeout=5)
+            return df
+
+        mock_db.get_relation.return_value.pl.side_effect = materialize
+        date_range = (date(2025, 7, 1), date(2025, 7, 31))
+        query_log = QueryLog()
+        flight = SingleFlight()
+        with (
+            patch('data_manager.query_log', query_log),
+            patch('data_manager.in_flight', flight),
+        ):
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [
+                    executor.submit(
+                        _get_data_with_filters,
+                        mock_db,
+                        SQL_POPULAR_ROUTES,
+                        date_range=date_range,
+                        tr_types=['Tramvajs'],
+                    )
+                    for _ in range(4)
+                ]
+                while flight.shared < 3:
+                    time.sleep(0.01)
+                release.set()
+            results = [future.result() for future in futures]
+
+        assert all(result is df for result in results)
+        mock_db.get_relation.assert_called_once()
+        assert sorted(r.cache for r in query_log.recent) == ['off'] + ['shared'] * 3
+
+
+class TestDataVersion:
+    """Test cases for the ingest watermark and data versions"""
+
+    def test_watermark_after_rebuild(self, duck_db):
+        """Test that a full rollup rebuild is the first ingest"""
+        assert get_watermark(duck_db) == 1
+        assert get_data_version(duck_db, 1, (date(2025, 7, 1), date(2025, 7, 31))) == 1
+
+    def test_watermark_without_tables(self, mock_db):
+        """Test that a database without ingest log and raw table has watermark 0"""
+        mock_db.get_relation.side_effect = duckdb.CatalogException('ingest_log')
+
+        assert get_watermark(mock_db) == 0
+        assert get_data_version(mock_db, 0, (None, None)) == 0
+
+    def test_watermark_without_ingest_log(self, tmp_path):
+        """Test that the row count versions a database without an ingest log"""
+        db_file = tmp_path / 'validacijas.duckdb'
+        with duckdb.connect(str(db_file)) as conn:
+            conn.execute(
+                """
+                create table validacijas as
+                select timestamp '2025-06-01' + to_minutes(i) as Laiks
+                from range(1500) t(i)
+                """
+            )
+
+        DatabaseConnection._instance = None
+        db = DatabaseConnection(backend=Backend.DUCKDB, path=str(db_file))
+        june = (date(2025, 6, 1), date(2025, 6, 30))
+
+        assert get_watermark(db) == 1500
+        assert get_data_version(db, 1500, june) == 1500
+
+        db.conn.close()
+        DatabaseConnection._instance = None
+        cache_resource.clear()
+
+    def test_only_loaded_ranges_get_new_version(self, tmp_path):
+        """Test that loading a month changes only versions of ranges including it"""
+        db_file = tmp_path / 'validacijas.duckdb'
+        with duckdb.connect(str(db_file)) as conn:
+            conn.execute(
+                """
+                create table validacijas as
+                select
+                    timestamp '2025-06-01' + to_minutes(i * 60) as Laiks,
+                    'Autobuss' as TranspVeids,
+                    'R1' as TMarsruts,
+                    1 as GarNr
+                from range(2000) t(i)
+                """
+            )
+            refresh_rollups(conn)
+            refresh_month(conn, date(2025, 7, 1))
+
+        DatabaseConnection._instance = None
+        db = DatabaseConnection(backend=Backend.DUCKDB, path=str(db_file))
+        watermark = get_watermark(db)
+        june = (date(2025, 6, 1), date(2025, 6, 30))
+        july = (date(2025, 7, 1), date(2025, 7, 31))
+
+        assert watermark == 2
+        assert get_data_version(db, watermark, june) == 1
+        assert get_data_version(db, watermark, july) == 2
+        assert get_data_version(db, watermark, (None, date(2025, 6, 30))) == 1
+        assert get_data_version(db, watermark, (None, date(2025, 7, 31))) == 2
+
+        db.conn.close()
+        DatabaseConnection._instance = None
+        cache_resource.clear()
+
+    def test_unchanged_ranges_stay_cached(self, duck_db):
+        """Test that metrics of other months are served from cache after an ingest"""
+        june = (date(2025, 6, 1), date(2025, 6, 30))
+        july = (date(2025, 7, 1), date(2025, 7, 31))
+        log = pl.DataFrame(
+            {
+                'seq': [1, 2],
+                'loaded_from': [None, date(2025, 7, 1)],
+                'loaded_until': [None, date(2025, 7, 31)],
+            },
+            schema={'seq': pl.Int64, 'loaded_from': pl.Date, 'loaded_until': pl.Date},
+        )
+        get_month_metrics(duck_db, june, ['Autobuss'], watermark=1)
+        get_month_metrics(duck_db, july, ['Autobuss'], watermark=1)
+
+        with (
+            patch('data_manager.get_ingest_log', return_value=log),
+            patch.object(
+                duck_db, 'get_relation', wraps=duck_db.get_relation
+            ) as get_relation,
+        ):
+            get_month_metrics(duck_db, june, ['Autobuss'], watermark=2)
+            get_relation.assert_not_called()
+            get_month_metrics(duck_db, july, ['Autobuss'], watermark=2)
+            get_relation.assert_called_once()
+
+
+def catalog(rows: list[tuple[date, str, int]]) -> pl.DataFrame:
+    """Catalog DataFrame with (month, TranspVeids, ride_count) rows"""
+    return pl.DataFrame(
+        rows,
+        schema={'month': pl.Date, 'TranspVeids': pl.String, 'ride_count': pl.Int64},
+        orient='row',
+    )
+
+
+class TestGetCatalog:
+    """Test cases for get_catalog function"""
+
+    def test_get_catalog(self, mock_db):
+        """Test that the catalog is read once and cached"""
+        mock_db.get_relation.return_value.pl.return_value = catalog(
+            [(date(2025, 1, 1), 'Autobuss', 100)]
+        )
+
+        get_catalog(mock_db)
+        result = get_catalog(mock_db)
+
+        mock_db.get_relation.assert_called_once()
+        assert 'month' in mock_db.get_relation.call_args.args[0]
+        assert result['ride_count'].to_list() == [100]
+
+    def test_month_and_type_lookups_reuse_catalog(self, mock_db):
+        """Test that month and transport type lookups do not query again"""
+        mock_db.get_relation.return_value.pl.return_value = catalog(
+            [(date(2025, 1, 1), 'Autobuss', 100)]
+        )
+
+        get_available_months(mock_db)
+        get_available_tr_types(mock_db, (date(2025, 1, 1), date(2025, 1, 31)))
+        get_available_tr_types(mock_db, (date(2025, 2, 1), date(2025, 2, 28)))
+
+        mock_db.get_relation.assert_called_once()
+
+
 class TestGetAvailableMonths:
     """Test cases for get_available_months function"""
 
     def test_get_available_months(self, mock_db):
         """Test basic functionality"""
-        months_mock = MagicMock()
-        months_mock.fetchone.return_value = (
-            date(2024, 1, 1),
-            date(2024, 12, 31),
+        mock_db.get_relation.return_value.pl.return_value = catalog(
+            [(date(2024, m, 1), tr, 10) for m in range(1, 13) for tr in ('A', 'B')]
         )
-        mock_db.get_relation.return_value = months_mock
 
         result = get_available_months(mock_db)
         assert len(result) == 12
@@ -138,48 +449,23 @@ class TestGetAvailableMonths:
         actual_months = [d.month for d in result]
         assert actual_months == expected_months
 
-    def test_get_available_months_partial_year(self, mock_db):
-        """Test with a partial year range"""
-        months_mock = MagicMock()
-        months_mock.fetchone.return_value = (
-            date(2023, 1, 1),
-            date(2023, 3, 31),
-        )
-        mock_db.get_relation.return_value = months_mock
-
-        result = get_available_months(mock_db)
-        assert len(result) == 3
-        assert result[0] == date(2023, 1, 1)
-        assert result[-1] == date(2023, 3, 1)
-        expected_months = list(range(1, 4))
-        actual_months = [d.month for d in result]
-        assert actual_months == expected_months
-
     def test_get_available_months_single_month(self, mock_db):
-        """Test with single month range"""
-        months_mock = MagicMock()
-        months_mock.fetchone.return_value = (
-            date(2025, 1, 1),
-            date(2025, 1, 31),
+        """Test with single month in the catalog"""
+        mock_db.get_relation.return_value.pl.return_value = catalog(
+            [(date(2025, 1, 1), 'Autobuss', 10)]
         )
-        mock_db.get_relation.return_value = months_mock
 
         result = get_available_months(mock_db)
-        assert len(result) == 1
-        assert result[0] == date(2025, 1, 1)
-        assert result[-1] == date(2025, 1, 1)
-        expected_months = [1]
-        actual_months = [d.month for d in result]
-        assert actual_months == expected_months
+        assert result == [date(2025, 1, 1)]
 
     def test_get_available_months_cross_year(self, mock_db):
-        """Test with range crossing year boundary"""
-        months_mock = MagicMock()
-        months_mock.fetchone.return_value = (
-            date(2025, 12, 1),
-            date(2026, 1, 31),
+        """Test with months crossing year boundary"""
+        mock_db.get_relation.return_value.pl.return_value = catalog(
+            [
+                (date(2026, 1, 1), 'Autobuss', 10),
+                (date(2025, 12, 1), 'Autobuss', 10),
+            ]
         )
-        mock_db.get_relation.return_value = months_mock
 
         result = get_available_months(mock_db)
         assert len(result) == 2
@@ -189,41 +475,41 @@ class TestGetAvailableMonths:
         actual_months = [d.month for d in result]
         assert actual_months == expected_months
 
+    def test_get_available_months_only_present_months(self, mock_db):
+        """Test that months missing from the data are not offered"""
+        mock_db.get_relation.return_value.pl.return_value = catalog(
+            [
+                (date(2025, 1, 1), 'Autobuss', 10),
+                (date(2025, 3, 1), 'Autobuss', 10),
+            ]
+        )
+
+        result = get_available_months(mock_db)
+        assert result == [date(2025, 1, 1), date(2025, 3, 1)]
+
     def test_get_available_months_empty_result(self, mock_db):
         """Test when database returns no data"""
-        months_mock = MagicMock()
-        months_mock.fetchone.return_value = None
-        mock_db.get_relation.return_value = months_mock
+        mock_db.get_relation.return_value.pl.return_value = catalog([])
 
         with pytest.raises(
-            ValueError, match='Datubāzē netika atrasta kolonna "Laiks".'
+            ValueError, match='Datubāzē netika atrasti validāciju dati.'
         ):
             get_available_months(mock_db)
 
-    def test_get_available_months_same_start_end(self, mock_db):
-        """Test when start and end dates are the same"""
-        months_mock = MagicMock()
-        months_mock.fetchone.return_value = (
-            date(2025, 7, 25),
-            date(2025, 7, 25),
-        )
-        mock_db.get_relation.return_value = months_mock
-
-        result = get_available_months(mock_db)
-        assert len(result) == 1
-        assert result[0] == date(2025, 7, 1)
-
 
 class TestGetAvailableTrTypes:
     """Tests for get_available_tr_types function"""
 
     def test_get_available_tr_types(self, mock_db):
         """Test basic functionality"""
-        tr_types_mock = MagicMock()
-        tr_types_mock.pl.return_value = pl.DataFrame(
-            {'TranspVeids': ['Autobuss', 'Tramvajs', 'Trolejbuss']}
+        mock_db.get_relation.return_value.pl.return_value = catalog(
+            [
+                (date(2025, 1, 1), 'Trolejbuss', 10),
+                (date(2025, 1, 1), 'Autobuss', 10),
+                (date(2025, 2, 1), 'Tramvajs', 10),
+                (date(2025, 2, 1), 'Autobuss', 10),
+            ]
         )
-        mock_db.get_relation.return_value = tr_types_mock
 
         date_range = (date(2025, 1, 1), date(2025, 12, 31))
 
@@ -232,24 +518,25 @@ class TestGetAvailableTrTypes:
         assert len(result) == 3
         assert result['TranspVeids'].to_list() == ['Autobuss', 'Tramvajs', 'Trolejbuss']
 
-    def test_single_tr_type(self, mock_db):
-        """Test with single transport type available"""
-        tr_types_mock = MagicMock()
-        tr_types_mock.pl.return_value = pl.DataFrame({'TranspVeids': ['Autobuss']})
-        mock_db.get_relation.return_value = tr_types_mock
-
-        date_range = (date(2025, 3, 1), date(2025, 6, 30))
+    def test_date_filtering(self, mock_db):
+        """Test that only the months in the date range are used"""
+        mock_db.get_relation.return_value.pl.return_value = catalog(
+            [
+                (date(2025, 1, 1), 'Trolejbuss', 10),
+                (date(2025, 2, 1), 'Autobuss', 10),
+                (date(2025, 3, 1), 'Tramvajs', 10),
+            ]
+        )
 
-        result = get_available_tr_types(mock_db, date_range)
+        result = get_available_tr_types(mock_db, (date(2025, 2, 1), date(2025, 2, 28)))
 
-        assert len(result) == 1
         assert result['TranspVeids'].to_list() == ['Autobuss']
 
     def test_empty_result(self, mock_db):
         """Test when no transport types are available"""
-        tr_types_mock = MagicMock()
-        tr_types_mock.pl.return_value = pl.DataFrame({'TranspVeids': []})
-        mock_db.get_relation.return_value = tr_types_mock
+        mock_db.get_relation.return_value.pl.return_value = catalog(
+            [(date(2025, 1, 1), 'Autobuss', 10)]
+        )
 
         date_range = (date(2024, 11, 1), date(2024, 12, 31))
 
@@ -257,30 +544,15 @@ class TestGetAvailableTrTypes:
 
         assert len(result) == 0
 
-    def test_date_filtering(self, mock_db):
-        """Test that date range is properly applied"""
-        tr_types_mock = MagicMock()
-        tr_types_mock.pl.return_value = pl.DataFrame(
-            {'TranspVeids': ['Autobuss', 'Tramvajs', 'Trolejbuss']}
-        )
-        mock_db.get_relation.return_value = tr_types_mock
-
-        date_range = (date(2024, 1, 1), date(2024, 6, 30))
-
-        _ = get_available_tr_types(mock_db, date_range)
-
-        mock_db.get_relation.assert_called_once()
-        call_args = mock_db.get_relation.call_args
-        assert '$start_date' in call_args.args[0]
-        assert '$end_date' in call_args.args[0]
-
     def test_special_characters_in_names(self, mock_db):
         """Test transport types with special characters"""
-        tr_types_mock = MagicMock()
-        tr_types_mock.pl.return_value = pl.DataFrame(
-            {'TranspVeids': ['Autobuss #3', 'Tramvajs-12', 'Trolejbuss/A']}
+        mock_db.get_relation.return_value.pl.return_value = catalog(
+            [
+                (date(2023, 1, 1), 'Autobuss #3', 10),
+                (date(2023, 1, 1), 'Tramvajs-12', 10),
+                (date(2023, 1, 1), 'Trolejbuss/A', 10),
+            ]
         )
-        mock_db.get_relation.return_value = tr_types_mock
 
         date_range = (date(2023, 1, 1), date(2023, 1, 31))
         result = get_available_tr_types(mock_db, date_range)
@@ -289,352 +561,156 @@ class TestGetAvailableTrTypes:
         assert 'Autobuss #3' in result['TranspVeids'].to_list()
 
 
+def total_rides_components(rows: list[tuple[date, int, int]]) -> pl.DataFrame:
+    """Total rides components with (month, ride_count, day_mask) rows"""
+    return pl.DataFrame(
+        rows,
+        schema={'month': pl.Date, 'ride_count': pl.Int64, 'day_mask': pl.UInt32},
+        orient='row',
+    )
+
+
 class TestGetTotalRides:
     """Test cases for get_total_rides function"""
 
     def test_get_total_rides(self, mock_db):
         """Test normal usage of function"""
-        total_rides_mock = MagicMock()
-        total_rides_mock.pl.return_value = pl.DataFrame(
-            {
-                'total_rides': [100, 150, 200],
-                'avg_rides_per_day': [5, 7, 10],
-                'moy': [date(2023, 1, 1), date(2023, 2, 1), date(2023, 3, 1)],
-            }
+        mock_db.get_relation.return_value.pl.return_value = total_rides_components(
+            [
+                (date(2023, 1, 1), 100, 0b11),
+                (date(2023, 2, 1), 150, 0b111),
+                (date(2023, 3, 1), 200, 0b1),
+            ]
         )
-        mock_db.get_relation.return_value = total_rides_mock
 
         up_to_date = date(2023, 3, 31)
-        tr_types = ['Autobuss', 'Tramvajs']
-        result = get_total_rides(mock_db, up_to_date, tr_types)
+        result = get_total_rides(mock_db, up_to_date, ['Autobuss'])
 
         assert len(result) == 3
         assert result['total_rides'].to_list() == [100, 150, 200]
-        assert result['avg_rides_per_day'].to_list() == [5, 7, 10]
+        assert result['avg_rides_per_day'].to_list() == [50, 50, 200]
         mock_db.get_relation.assert_called_once()
         call_args = mock_db.get_relation.call_args
         assert '$up_to_date' in call_args.args[0]
         assert '$tr_types' in call_args.args[0]
         assert call_args.args[1]['up_to_date'] == up_to_date
-        assert call_args.args[1]['tr_types'] == tr_types
-
-    def test_empty_result(self, mock_db):
-        """Test case for when db returns an empty dataframe"""
-        total_rides_mock = MagicMock()
-        total_rides_mock.pl.return_value = pl.DataFrame(
-            {
-                'total_rides': [],
-                'avg_rides_per_day': [],
-                'moy': [],
-            }
-        )
-        mock_db.get_relation.return_value = total_rides_mock
-
-        up_to_date = date(2025, 11, 30)
-        tr_types = ['Autobuss', 'Tramvajs', 'Trolejbuss']
-        result = get_total_rides(mock_db, up_to_date, tr_types)
-
-        assert len(result) == 0
-
-
-class TestGetRidesPerDay:
-    """Test cases for the get_rides_per_day function"""
-
-    def test_get_rides_per_day(self, mock_db):
-        """Test normal usage of function"""
-        rides_per_day_mock = MagicMock()
-        rides_per_day_mock.pl.return_value = pl.DataFrame(
-            {'total_rides': [50, 49, 51], 'dom': [1, 2, 3]}
-        )
-        mock_db.get_relation.return_value = rides_per_day_mock
-
-        date_range = (date(2025, 11, 1), date(2025, 11, 3))
-        tr_types = ['Autobuss', 'Tramvajs', 'Trolejbuss']
-        result = get_rides_per_day(mock_db, date_range, tr_types)
-
-        assert len(result) == 3
-        assert result['total_rides'].to_list() == [50, 49, 51]
-        assert result['dom'].to_list() == [1, 2, 3]
-        mock_db.get_relation.assert_called_once()
-        call_args = mock_db.get_relation.call_args
-        assert '$start_date' in call_args.args[0]
-        assert '$end_date' in call_args.args[0]
-        assert '$tr_types' in call_args.args[0]
-        assert call_args.args[1]['start_date'] == date_range[0]
-        assert call_args.args[1]['end_date'] == date_range[1]
-        assert call_args.args[1]['tr_types'] == tr_types
-
-    def test_empty_result(self, mock_db):
-        """Test case for when db returns empty dataframe"""
-        rides_per_day_mock = MagicMock()
-        rides_per_day_mock.pl.return_value = pl.DataFrame(
-            {'total_rides': [], 'dom': []}
-        )
-        mock_db.get_relation.return_value = rides_per_day_mock
-
-        date_range = (date(2025, 10, 1), date(2025, 10, 10))
-        tr_types = ['Autobuss', 'Tramvajs']
-        result = get_rides_per_day(mock_db, date_range, tr_types)
-
-        assert len(result) == 0
-
-
-class TestGetPeakHour:
-    """Test cases for get_peak_hour function"""
-
-    def test_get_peak_hour(self, mock_db):
-        """Test normal usage of function"""
-        peak_hour_mock = MagicMock()
-        peak_hour_mock.pl.return_value = pl.DataFrame(
-            {'hour': [1, 2, 3], 'avg_rides_per_hour': [13, 16, 20]}
-        )
-        mock_db.get_relation.return_value = peak_hour_mock
-
-        date_range = (date(2025, 12, 1), date(2025, 12, 31))
-        tr_types = ['Autobuss']
-        result = get_peak_hour(mock_db, date_range, tr_types)
-
-        assert len(result) == 3
-        assert result['hour'].to_list() == [1, 2, 3]
-        assert result['avg_rides_per_hour'].to_list() == [13, 16, 20]
-        mock_db.get_relation.assert_called_once()
-        call_args = mock_db.get_relation.call_args
-        assert '$start_date' in call_args.args[0]
-        assert '$end_date' in call_args.args[0]
-        assert '$tr_types' in call_args.args[0]
-        assert call_args.args[1]['start_date'] == date_range[0]
-        assert call_args.args[1]['end_date'] == date_range[1]
-        assert call_args.args[1]['tr_types'] == tr_types
-
-    def test_empty_result(self, mock_db):
-        """Test case for when db returns empty dataframe"""
-        peak_hour_mock = MagicMock()
-        peak_hour_mock.pl.return_value = pl.DataFrame(
-            {'hour': [], 'avg_rides_per_hour': []}
-        )
-        mock_db.get_relation.return_value = peak_hour_mock
-
-        date_range = (date(2025, 10, 1), date(2025, 10, 10))
-        tr_types = ['Autobuss', 'Tramvajs']
-        result = get_peak_hour(mock_db, date_range, tr_types)
-
-        assert len(result) == 0
-
-
-class TestGetPopularRoutes:
-    """Test cases for get_popular_routes function"""
-
-    def test_get_popular_routes(self, mock_db):
-        """Test normal usage of function"""
-        popular_routes_mock = MagicMock()
-        popular_routes_mock.pl.return_value = pl.DataFrame(
-            {
-                'Braucienu skaits': [500, 400, 300, 200, 100, 1],
-                'Maršruts': ['Tm 1', 'A 3', 'Tr 15', 'A 21', 'Tm 7', 'Tr 4'],
-            }
-        )
-        mock_db.get_relation.return_value = popular_routes_mock
-
-        date_range = (date(2025, 7, 1), date(2025, 7, 31))
-        tr_types = ['Autobuss', 'Tramvajs', 'Trolejbuss']
-        result = get_popular_routes(mock_db, date_range, tr_types)
-
-        assert len(result) == 6
-        assert result['Braucienu skaits'].to_list() == [500, 400, 300, 200, 100, 1]
-        assert result['Maršruts'].to_list() == [
-            'Tm 1',
-            'A 3',
-            'Tr 15',
-            'A 21',
-            'Tm 7',
-            'Tr 4',
-        ]
-        mock_db.get_relation.assert_called_once()
-        call_args = mock_db.get_relation.call_args
-        assert '$start_date' in call_args.args[0]
-        assert '$end_date' in call_args.args[0]
-        assert '$tr_types' in call_args.args[0]
-        assert call_args.args[1]['start_date'] == date_range[0]
-        assert call_args.args[1]['end_date'] == date_range[1]
-        assert call_args.args[1]['tr_types'] == tr_types
-
-    def test_empty_result(self, mock_db):
-        """Test when database returns empty result"""
-        popular_routes_mock = MagicMock()
-        popular_routes_mock.pl.return_value = pl.DataFrame(
-            {
-                'Braucienu skaits': [],
-                'Maršruts': [],
-            }
+        assert call_args.args[1]['tr_types'] == ['Autobuss']
+
+    def test_sums_transport_types(self, mock_db):
+        """Test that types are summed and their distinct days are merged"""
+        components = {
+            'Autobuss': total_rides_components([(date(2023, 1, 1), 30, 0b011)]),
+            'Tramvajs': total_rides_components([(date(2023, 1, 1), 15, 0b110)]),
+        }
+        mock_db.get_relation.side_effect = lambda query, params: MagicMock(
+            pl=MagicMock(return_value=components[params['tr_types'][0]])
         )
-        mock_db.get_relation.return_value = popular_routes_mock
 
-        date_range = (date(2025, 7, 1), date(2025, 7, 31))
-        tr_types = ['Autobuss', 'Tramvajs', 'Trolejbuss']
-        result = get_popular_routes(mock_db, date_range, tr_types)
-
-        assert len(result) == 0
+        result = get_total_rides(mock_db, date(2023, 1, 31), ['Tramvajs', 'Autobuss'])
 
+        assert result['total_rides'].to_list() == [45]
+        assert result['avg_rides_per_day'].to_list() == [15]
 
-class TestGetTrDistribution:
-    """Test cases for get_tr_distribution function"""
-
-    def test_get_tr_distribution(self, mock_db):
-        """Test normal usage of function"""
-        tr_distribution_mock = MagicMock()
-        tr_distribution_mock.pl.return_value = pl.DataFrame(
-            {
-                'Braucienu skaits': [500, 400, 300],
-                'Transporta veids': ['Autobuss', 'Tramvajs', 'Trolejbuss'],
-            }
+    def test_types_are_cached_separately(self, mock_db):
+        """Test that any selection reuses the cached per type components"""
+        mock_db.get_relation.return_value.pl.return_value = total_rides_components(
+            [(date(2023, 1, 1), 10, 0b1)]
         )
-        mock_db.get_relation.return_value = tr_distribution_mock
+        up_to_date = date(2023, 1, 31)
 
-        date_range = (date(2025, 7, 1), date(2025, 7, 31))
-        tr_types = ['Autobuss', 'Tramvajs', 'Trolejbuss']
-        result = get_tr_distribution(mock_db, date_range, tr_types)
+        get_total_rides(mock_db, up_to_date, ['Autobuss'])
+        get_total_rides(mock_db, up_to_date, ['Tramvajs'])
+        get_total_rides(mock_db, up_to_date, ['Tramvajs', 'Autobuss'])
+        get_total_rides(mock_db, up_to_date, ['Autobuss', 'Tramvajs', 'Autobuss'])
 
-        assert len(result) == 3
-        assert result['Braucienu skaits'].to_list() == [500, 400, 300]
-        assert result['Transporta veids'].to_list() == [
-            'Autobuss',
-            'Tramvajs',
-            'Trolejbuss',
-        ]
-        mock_db.get_relation.assert_called_once()
-        call_args = mock_db.get_relation.call_args
-        assert '$start_date' in call_args.args[0]
-        assert '$end_date' in call_args.args[0]
-        assert '$tr_types' in call_args.args[0]
-        assert call_args.args[1]['start_date'] == date_range[0]
-        assert call_args.args[1]['end_date'] == date_range[1]
-        assert call_args.args[1]['tr_types'] == tr_types
+        assert mock_db.get_relation.call_count == 2
 
     def test_empty_result(self, mock_db):
-        """Test when database returns empty result"""
-        tr_distribution_mock = MagicMock()
-        tr_distribution_mock.pl.return_value = pl.DataFrame(
-            {
-                'Braucienu skaits': [],
-                'Tansporta veids': [],
-            }
-        )
-        mock_db.get_relation.return_value = tr_distribution_mock
+        """Test case for when db returns an empty dataframe"""
+        mock_db.get_relation.return_value.pl.return_value = total_rides_components([])
 
-        date_range = (date(2025, 7, 1), date(2025, 7, 31))
+        up_to_date = date(2025, 11, 30)
         tr_types = ['Autobuss', 'Tramvajs', 'Trolejbuss']
-        result = get_tr_distribution(mock_db, date_range, tr_types)
+        result = get_total_rides(mock_db, up_to_date, tr_types)
 
         assert len(result) == 0
+        assert result.columns == ['total_rides', 'avg_rides_per_day', 'moy']
 
 
-class TestGetPeakDay:
-    """Test cases for get_peak_day function"""
-
-    def test_get_peak_day(self, mock_db):
-        """Test normal usage of function"""
-        peak_day_mock = MagicMock()
-        peak_day_mock.pl.return_value = pl.DataFrame(
-            {
-                'Nedēļas diena': [
-                    'Pirmdiena',
-                    'Otrdiena',
-                    'Trešdiena',
-                    'Ceturtdiena',
-                    'Piektdiena',
-                    'Sestdiena',
-                    'Svētdiena',
-                ],
-                'Braucieni vidēji dienā': [5, 3, 1, 6, 3, 8, 9],
-            }
-        )
-        mock_db.get_relation.return_value = peak_day_mock
+class TestGetMonthMetrics:
+    """Test cases for the get_month_metrics function"""
 
+    @pytest.mark.parametrize(
+        'tr_types', [None, ['Tramvajs', 'Trolejbuss'], ['Autobuss', 'Tramvajs']]
+    )
+    def test_matches_single_metric_queries(self, duck_db, tr_types):
+        """Test that the merged components match the single metric queries"""
         date_range = (date(2025, 7, 1), date(2025, 7, 31))
-        tr_types = ['Autobuss', 'Tramvajs', 'Trolejbuss']
-        result = get_peak_day(mock_db, date_range, tr_types)
-
-        assert len(result) == 7
-        assert result['Nedēļas diena'].to_list() == [
-            'Pirmdiena',
-            'Otrdiena',
-            'Trešdiena',
-            'Ceturtdiena',
-            'Piektdiena',
-            'Sestdiena',
-            'Svētdiena',
-        ]
-        assert result['Braucieni vidēji dienā'].to_list() == [5, 3, 1, 6, 3, 8, 9]
-        mock_db.get_relation.assert_called_once()
-        call_args = mock_db.get_relation.call_args
-        assert '$start_date' in call_args.args[0]
-        assert '$end_date' in call_args.args[0]
-        assert '$tr_types' in call_args.args[0]
-        assert call_args.args[1]['start_date'] == date_range[0]
-        assert call_args.args[1]['end_date'] == date_range[1]
-        assert call_args.args[1]['tr_types'] == tr_types
-
-    def test_empty_result(self, mock_db):
-        """Test when database returns empty result"""
-        peak_day_mock = MagicMock()
-        peak_day_mock.pl.return_value = pl.DataFrame(
-            {
-                'Nedēļas diena': [],
-                'Braucieni vidēji dienā': [],
-            }
-        )
-        mock_db.get_relation.return_value = peak_day_mock
 
+        result = get_month_metrics(duck_db, date_range, tr_types)
+
+        expected = {
+            MonthMetric.RIDES_PER_DAY: SQL_RIDES_PER_DAY,
+            MonthMetric.PEAK_HOUR: SQL_PEAK_HOUR,
+            MonthMetric.POPULAR_ROUTES: SQL_POPULAR_ROUTES,
+            MonthMetric.TR_DISTRIBUTION: SQL_TR_DISTRIBUTION,
+            MonthMetric.PEAK_DAY: SQL_PEAK_DAY,
+            MonthMetric.ROUTE_DENSITY: SQL_ROUTE_DENSITY,
+        }
+        assert set(result) == set(MonthMetric)
+        for metric, query in expected.items():
+            assert_frame_equal(
+                result[metric],
+                _get_data_with_filters(duck_db, query, date_range, tr_types),
+                check_dtypes=False,
+            )
+
+    def test_types_are_cached_separately(self, duck_db):
+        """Test that a selection of cached types is assembled without queries"""
         date_range = (date(2025, 7, 1), date(2025, 7, 31))
-        tr_types = ['Autobuss', 'Tramvajs', 'Trolejbuss']
-        result = get_peak_day(mock_db, date_range, tr_types)
-
-        assert len(result) == 0
-
-
-class TestGetRouteDensity:
-    """Test cases for get_route_density function"""
-
-    def test_get_route_density(self, mock_db):
-        """Test normal usage of function"""
-        route_density_mock = MagicMock()
-        route_density_mock.pl.return_value = pl.DataFrame(
-            {
-                'Maršruts': ['Tm 1', 'A 3', 'Tr 15'],
-                'Vidējais braucienu skaits': [5, 3, 1],
+        get_month_metrics(duck_db, date_range, ['Autobuss'])
+        get_month_metrics(duck_db, date_range, ['Tramvajs'])
+
+        with patch.object(
+            duck_db, 'get_relation', side_effect=AssertionError
+        ) as get_relation:
+            result = get_month_metrics(duck_db, date_range, ['Tramvajs', 'Autobuss'])
+
+        get_relation.assert_not_called()
+        for metric, query in {
+            MonthMetric.PEAK_HOUR: SQL_PEAK_HOUR,
+            MonthMetric.PEAK_DAY: SQL_PEAK_DAY,
+            MonthMetric.ROUTE_DENSITY: SQL_ROUTE_DENSITY,
+        }.items():
+            assert_frame_equal(
+                result[metric],
+                _get_data_with_filters(
+                    duck_db, query, date_range, ['Autobuss', 'Tramvajs']
+                ),
+                check_dtypes=False,
+            )
+
+    def test_one_query_per_type(self, mock_db):
+        """Test that each transport type is fetched with one query"""
+        mock_db.get_relation.return_value.pl.return_value = pl.DataFrame(
+            schema={
+                'component': pl.String,
+                'day': pl.Date,
+                'hour': pl.Int64,
+                'TranspVeids': pl.String,
+                'TMarsruts': pl.String,
+                'GarNr': pl.Int64,
+                'ride_count': pl.Int64,
             }
         )
-        mock_db.get_relation.return_value = route_density_mock
-
-        date_range = (date(2025, 7, 1), date(2025, 7, 31))
-        tr_types = ['Autobuss', 'Tramvajs', 'Trolejbuss']
-        result = get_route_density(mock_db, date_range, tr_types)
-
-        assert len(result) == 3
-        assert result['Maršruts'].to_list() == ['Tm 1', 'A 3', 'Tr 15']
-        assert result['Vidējais braucienu skaits'].to_list() == [5, 3, 1]
-        mock_db.get_relation.assert_called_once()
-        call_args = mock_db.get_relation.call_args
-        assert '$start_date' in call_args.args[0]
-        assert '$end_date' in call_args.args[0]
-        assert '$tr_types' in call_args.args[0]
-        assert call_args.args[1]['start_date'] == date_range[0]
-        assert call_args.args[1]['end_date'] == date_range[1]
-        assert call_args.args[1]['tr_types'] == tr_types
 
-    def test_empty_result(self, mock_db):
-        """Test when database returns empty result"""
-        route_density_mock = MagicMock()
-        route_density_mock.pl.return_value = pl.DataFrame(
-            {
-                'Maršruts': [],
-                'Vidējais braucienu skaits': [],
-            }
+        result = get_month_metrics(
+            mock_db, (date(2025, 7, 1), date(2025, 7, 31)), ['Autobuss', 'Tramvajs']
         )
-        mock_db.get_relation.return_value = route_density_mock
 
-        date_range = (date(2025, 7, 1), date(2025, 7, 31))
-        tr_types = ['Autobuss', 'Tramvajs', 'Trolejbuss']
-        result = get_route_density(mock_db, date_range, tr_types)
-
-        assert len(result) == 0
+        assert mock_db.get_relation.call_count == 2
+        assert [
+            call.args[1]['tr_types'] for call in mock_db.get_relation.call_args_list
+        ] == [['Autobuss'], ['Tramvajs']]
+        assert len(result[MonthMetric.PEAK_HOUR]) == 24
+        assert len(result[MonthMetric.POPULAR_ROUTES]) == 0
@@ -1,8 +1,21 @@
+import threading
+import time
+from datetime import date, datetime
 from unittest.mock import MagicMock, patch
 
+import duckdb
+import polars as pl
+import pytest
 from streamlit import cache_resource
 
-from database import DatabaseConnection
+from database import (
+    Backend,
+    ConnectionOptions,
+    CursorPool,
+    DatabaseConnection,
+    QueryScope,
+    _sql_literal,
+)
 
 
 def test_database_connection_singleton():
@@ -44,7 +57,7 @@ def test_get_relation_without_params():
                     select 1;
                     """
         db.get_relation(sql_query=sql_query)
-        db.conn.sql.assert_called_once_with(query=sql_query)  # type: ignore
+        db.conn.cursor.return_value.sql.assert_called_once_with(query=sql_query)  # type: ignore
 
     cache_resource.clear()
 
@@ -60,6 +73,442 @@ def test_get_relation_with_params():
                     """
         sql_params = {'1': 1}
         db.get_relation(sql_query=sql_query, sql_params=sql_params)
-        db.conn.sql.assert_called_once_with(query=sql_query, params=sql_params)  # type: ignore
+        db.conn.cursor.return_value.sql.assert_called_once_with(  # type: ignore
+            query=sql_query, params=sql_params
+        )
+
+    cache_resource.clear()
+
+
+def test_motherduck_backend_requires_token():
+    """Test that the MotherDuck backend refuses to connect without a token"""
+    DatabaseConnection._instance = None
+
+    db = DatabaseConnection()
+    with pytest.raises(ValueError):
+        _ = db.conn
+
+    cache_resource.clear()
+
+
+def test_duckdb_file_backend(tmp_path):
+    """Test connecting to a local DuckDB database file"""
+    DatabaseConnection._instance = None
+    db_file = tmp_path / 'validacijas.duckdb'
+    with duckdb.connect(str(db_file)) as setup_conn:
+        setup_conn.execute(
+            "create table validacijas as select 'Autobuss' as TranspVeids"
+        )
+
+    db = DatabaseConnection(backend=Backend.DUCKDB, path=str(db_file))
+    result = db.get_relation('select TranspVeids from validacijas').fetchall()
+
+    assert result == [('Autobuss',)]
+
+    db.conn.close()
+    cache_resource.clear()
+
+
+def test_parquet_backend(tmp_path):
+    """Test that every Parquet table directory is exposed as a view"""
+    DatabaseConnection._instance = None
+    table_dir = tmp_path / 'validacijas'
+    table_dir.mkdir()
+    duckdb.sql("select 'Tramvajs' as TranspVeids, 1 as GarNr").write_parquet(
+        str(table_dir / 'part-0.parquet')
+    )
+
+    db = DatabaseConnection(backend='parquet', path=str(tmp_path))
+    result = db.get_relation(
+        'select TranspVeids from validacijas where GarNr = $nr', {'nr': 1}
+    ).fetchall()
+
+    assert result == [('Tramvajs',)]
+
+    cache_resource.clear()
+
+
+def test_parquet_backend_missing_directory(tmp_path):
+    """Test that a missing Parquet directory raises a ValueError"""
+    DatabaseConnection._instance = None
+
+    db = DatabaseConnection(backend=Backend.PARQUET, path=str(tmp_path / 'missing'))
+    with pytest.raises(ValueError):
+        _ = db.conn
+
+    cache_resource.clear()
+
+
+def test_cursor_pool_reuses_thread_cursor():
+    """Test that a thread gets back the cursor it used before"""
+    conn = MagicMock()
+    conn.cursor.side_effect = MagicMock
+    pool = CursorPool(conn, size=2)
+
+    other = pool.checkout()
+    last_used = pool.checkout()
+    pool.checkin(last_used)
+    pool.checkin(other)
+
+    assert pool.checkout() is last_used
+    assert pool.stats.created == 2
+    assert pool.stats.in_use == 1
+
+
+def test_cursor_pool_is_bounded():
+    """Test that checkout waits for a free cursor and records the wait"""
+    conn = MagicMock()
+    pool = CursorPool(conn, size=1)
+    cursor = pool.checkout()
+
+    def release():
+        time.sleep(0.05)
+        pool.checkin(cursor)
+
+    thread = threading.Thread(target=release)
+    thread.start()
+    assert pool.checkout(timeout=5) is cursor
+    thread.join()
+
+    stats = pool.stats
+    assert conn.cursor.call_count == 1
+    assert stats.checkouts == 2
+    assert stats.waits == 1
+    assert stats.max_wait_s > 0
+
+
+def test_cursor_pool_checkout_timeout():
+    """Test that checkout raises TimeoutError when the pool stays exhausted"""
+    pool = CursorPool(MagicMock(), size=1)
+    pool.checkout()
+
+    with pytest.raises(TimeoutError):
+        pool.checkout(timeout=0.01)
+
+
+def test_cursor_context_is_reentrant():
+    """Test that nested cursor() calls on one thread share the cursor"""
+    DatabaseConnection._instance = None
+
+    with patch('database.duckdb.connect'):
+        db = DatabaseConnection(token='test_token')
+        with db.cursor() as outer, db.cursor() as inner:
+            assert outer is inner
+            assert db.pool.stats.in_use == 1
+        assert db.pool.stats.in_use == 0
+
+    cache_resource.clear()
+
+
+def test_cursors_are_independent_per_thread(tmp_path):
+    """Test that concurrent threads query on separate cursors"""
+    DatabaseConnection._instance = None
+    db_file = tmp_path / 'validacijas.duckdb'
+    with duckdb.connect(str(db_file)) as setup_conn:
+        setup_conn.execute('create table validacijas as select 1 as GarNr')
+
+    db = DatabaseConnection(
+        backend=Backend.DUCKDB,
+        path=str(db_file),
+        options=ConnectionOptions(pool_size=4),
+    )
+    barrier = threading.Barrier(3)
+    cursors = []
+
+    def query():
+        with db.cursor() as cursor:
+            cursors.append(cursor)
+            barrier.wait()
+            db.get_relation('select GarNr from validacijas').fetchall()
+
+    threads = [threading.Thread(target=query) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(c) for c in cursors}) == 3
+    assert db.pool.stats.created == 3
+
+    db.conn.close()
+    cache_resource.clear()
+
+
+@pytest.fixture
+def local_db(tmp_path):
+    """DatabaseConnection to a local DuckDB file with 10 000 rows"""
+    DatabaseConnection._instance = None
+    db_file = tmp_path / 'validacijas.duckdb'
+    with duckdb.connect(str(db_file)) as setup_conn:
+        setup_conn.execute(
+            'create table validacijas as select i as GarNr from range(10000) t(i)'
+        )
+    db = DatabaseConnection(backend=Backend.DUCKDB, path=str(db_file))
+    yield db
+    db.conn.close()
+    DatabaseConnection._instance = None
+    cache_resource.clear()
+
+
+def test_stream_returns_bounded_batches(local_db):
+    """Test that the stream yields record batches of at most batch_size rows"""
+    with local_db.stream(
+        'select GarNr from validacijas where GarNr < $n', {'n': 5000}, batch_size=2048
+    ) as reader:
+        rows = [batch.num_rows for batch in reader]
+        assert local_db.pool.stats.in_use == 1
 
+    assert max(rows) <= 2048
+    assert sum(rows) == 5000
+    assert local_db.pool.stats.in_use == 0
+
+
+def test_stream_does_not_block_thread_queries(local_db):
+    """Test that queries of the same thread run on another cursor during a stream"""
+    with local_db.stream('select GarNr from validacijas', batch_size=2048) as reader:
+        first = reader.read_next_batch()
+        count = local_db.get_relation('select count(*) from validacijas').fetchone()
+        rest = sum(batch.num_rows for batch in reader)
+
+    assert count == (10000,)
+    assert first.num_rows + rest == 10000
+
+
+def test_stream_reuses_thread_cursor(tmp_path):
+    """Test that a stream inside a cursor block runs on the thread's cursor"""
+    DatabaseConnection._instance = None
+    db = DatabaseConnection(
+        backend=Backend.PARQUET,
+        path=str(tmp_path),
+        options=ConnectionOptions(pool_size=1),
+    )
+
+    with db.cursor(), db.stream('select i from range(5000) t(i)', None, 2048) as reader:
+        assert sum(batch.num_rows for batch in reader) == 5000
+        assert db.pool.stats.checkouts == 1
+
+    assert db.pool.stats.in_use == 0
+    db.conn.close()
+    DatabaseConnection._instance = None
+    cache_resource.clear()
+
+
+def test_stream_checkout_timeout(tmp_path):
+    """Test that a stream waiting for a cursor longer than the timeout fails"""
+    DatabaseConnection._instance = None
+    db = DatabaseConnection(
+        backend=Backend.PARQUET,
+        path=str(tmp_path),
+        options=ConnectionOptions(pool_size=1, query_timeout_s=0.1),
+    )
+
+    with (
+        db.stream('select 1', batch_size=2048),
+        pytest.raises(TimeoutError),
+        db.stream('select 2', batch_size=2048),
+    ):
+        pass
+
+    assert db.pool.stats.in_use == 0
+    db.conn.close()
+    DatabaseConnection._instance = None
+    cache_resource.clear()
+
+
+def test_cursor_checkout_timeout(tmp_path):
+    """Test that a query waiting for a cursor longer than the timeout fails"""
+    DatabaseConnection._instance = None
+    db = DatabaseConnection(
+        backend=Backend.PARQUET,
+        path=str(tmp_path),
+        options=ConnectionOptions(pool_size=1, query_timeout_s=0.1),
+    )
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with db.cursor():
+            held.set()
+            release.wait(timeout=5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    assert held.wait(timeout=5)
+    try:
+        with pytest.raises(TimeoutError), db.cursor():
+            pass
+    finally:
+        release.set()
+        thread.join(timeout=5)
+
+    assert db.pool.stats.in_use == 0
+    db.conn.close()
+    DatabaseConnection._instance = None
     cache_resource.clear()
+
+
+def test_iter_frames(local_db):
+    """Test that the frames add up to the full result"""
+    frames = list(
+        local_db.iter_frames('select GarNr from validacijas order by GarNr', None, 4096)
+    )
+
+    assert all(len(frame) <= 4096 for frame in frames)
+    assert pl.concat(frames)['GarNr'].to_list() == list(range(10000))
+    assert local_db.pool.stats.in_use == 0
+
+
+def test_iter_frames_closed_early(local_db):
+    """Test that an abandoned iterator gives its cursor back"""
+    frames = local_db.iter_frames('select GarNr from validacijas', batch_size=2048)
+    next(frames)
+    assert local_db.pool.stats.in_use == 1
+
+    frames.close()
+    assert local_db.pool.stats.in_use == 0
+
+
+SLOW_QUERY = 'select sum(i) from range(1_000_000_000_000) t(i)'
+
+
+def test_query_timeout(tmp_path):
+    """Test that a query running longer than the timeout is interrupted"""
+    DatabaseConnection._instance = None
+    db = DatabaseConnection(
+        backend=Backend.PARQUET,
+        path=str(tmp_path),
+        options=ConnectionOptions(query_timeout_s=0.2),
+    )
+
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError), db.cursor():
+        db.get_relation(SLOW_QUERY).fetchall()
+
+    assert time.perf_counter() - start < 5
+    assert db.pool.stats.in_use == 0
+    with db.cursor():
+        assert db.get_relation('select 1').fetchall() == [(1,)]
+
+    db.conn.close()
+    DatabaseConnection._instance = None
+    cache_resource.clear()
+
+
+def test_cancel_scope_interrupts_running_query(local_db):
+    """Test that cancelling a scope interrupts the queries of its cursors"""
+    scope = QueryScope()
+    errors = []
+    started = threading.Event()
+
+    def query():
+        with local_db.scope(scope), local_db.cursor():
+            started.set()
+            try:
+                local_db.get_relation(SLOW_QUERY).fetchall()
+            except duckdb.InterruptException as error:
+                errors.append(error)
+
+    thread = threading.Thread(target=query)
+    thread.start()
+    assert started.wait(timeout=5)
+    time.sleep(0.1)
+    scope.cancel()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert len(errors) == 1
+    assert local_db.pool.stats.in_use == 0
+
+
+def test_cancel_scope_interrupts_under_lock():
+    """Test that a cursor cannot leave the scope while it is being interrupted"""
+    scope = QueryScope()
+    cursor = MagicMock()
+    cursor.interrupt.side_effect = lambda: locked.append(scope._lock.locked())
+    locked = []
+    scope.add(cursor)
+
+    scope.cancel()
+
+    assert locked == [True]
+
+
+def test_cancelled_scope_refuses_queries(local_db):
+    """Test that no new query starts in a cancelled scope"""
+    scope = QueryScope()
+    scope.cancel()
+
+    with (
+        pytest.raises(duckdb.InterruptException),
+        local_db.scope(scope),
+        local_db.cursor(),
+    ):
+        pass
+
+    assert local_db.pool.stats.in_use == 0
+    with local_db.cursor():
+        assert local_db.get_relation('select 1').fetchall() == [(1,)]
+
+
+def test_prepared_statements(tmp_path):
+    """Test that parametrized queries are prepared once per cursor"""
+    DatabaseConnection._instance = None
+    db_file = tmp_path / 'validacijas.duckdb'
+    with duckdb.connect(str(db_file)) as setup_conn:
+        setup_conn.execute(
+            """
+            create table validacijas as
+            select
+                date '2025-07-01' + (i % 31)::INT as Laiks,
+                ['Autobuss', 'Tramvajs', 'O''Bus'][1 + i % 3] as TranspVeids
+            from range(300) t(i)
+            """
+        )
+    db = DatabaseConnection(
+        backend=Backend.DUCKDB,
+        path=str(db_file),
+        options=ConnectionOptions(prepare_statements=True),
+    )
+    query = """--sql
+        select count(*) from validacijas
+        where Laiks >= $start_date and TranspVeids in $tr_types
+        """
+
+    params = [
+        {'start_date': date(2025, 7, 1), 'tr_types': ["O'Bus"]},
+        {'start_date': date(2025, 7, 16), 'tr_types': ['Autobuss', "O'Bus"]},
+    ]
+
+    with db.cursor() as cursor:
+        results = [db.get_relation(query, p).fetchall() for p in params]
+        expected = [cursor.sql(query, params=p).fetchall() for p in params]
+        prepared = db._prepared[id(cursor)]
+
+    assert results == expected
+    assert results[0] == [(100,)]
+    assert len(prepared) == 1
+
+    db.conn.close()
+    DatabaseConnection._instance = None
+    cache_resource.clear()
+
+
+@pytest.mark.parametrize(
+    ('value', 'literal'),
+    [
+        (date(2025, 7, 1), "DATE '2025-07-01'"),
+        (datetime(2025, 7, 1, 8, 30), "TIMESTAMP '2025-07-01 08:30:00'"),
+        ("O'Bus", "'O''Bus'"),
+        (['Autobuss', 'Tramvajs'], "['Autobuss', 'Tramvajs']"),
+        (3, '3'),
+    ],
+)
+def test_sql_literal(value, literal):
+    """Test the literals of prepared statement parameters"""
+    assert _sql_literal(value) == literal
+
+
+def test_sql_literal_unsupported_type():
+    """Test that unknown parameter types are rejected"""
+    with pytest.raises(TypeError):
+        _sql_literal({'a': 1})
@@ -0,0 +1,123 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import polars as pl
+import pytest
+
+from diagnostics import (
+    is_diagnostics_request,
+    latency_percentiles,
+    metrics_size,
+    route_shares,
+    session_sizes,
+)
+from instrumentation import CacheOutcome, QueryRecord
+from query_router import Source
+from state_manager import MetricsKeys, StateKeys
+
+
+def record(name, wall_s, cache=CacheOutcome.MISS):
+    """Query record of a given wall time"""
+    return QueryRecord(
+        name=name, wall_s=wall_s, rows=1, bytes=8, params={}, cache=cache
+    )
+
+
+class TestIsDiagnosticsRequest:
+    """Test cases for the is_diagnostics_request function"""
+
+    @pytest.fixture(autouse=True)
+    def token(self):
+        """Configured diagnostics token"""
+        with patch('diagnostics.DIAGNOSTICS_TOKEN', 'secret'):
+            yield
+
+    def test_matching_token(self):
+        """Test that the configured token opens the page"""
+        assert is_diagnostics_request({'diagnostics': 'secret'})
+
+    @pytest.mark.parametrize('query_params', [{}, {'diagnostics': 'guess'}])
+    def test_missing_or_wrong_token(self, query_params):
+        """Test that the page stays hidden without the token"""
+        assert not is_diagnostics_request(query_params)
+
+    def test_disabled_without_token(self):
+        """Test that the page is disabled when no token is configured"""
+        with patch('diagnostics.DIAGNOSTICS_TOKEN', None):
+            assert not is_diagnostics_request({'diagnostics': ''})
+
+
+def test_latency_percentiles():
+    """Test the percentiles per query name and cache outcome"""
+    records = [record('peak_day', i / 1000) for i in range(1, 101)]
+    records.append(record('peak_day', 0.002, CacheOutcome.HIT))
+
+    result = latency_percentiles(records)
+
+    assert result.select('name', 'cache', 'count').rows() == [
+        ('peak_day', 'miss', 100),
+        ('peak_day', 'hit', 1),
+    ]
+    assert result.row(0, named=True)['p50_ms'] == pytest.approx(50, abs=1)
+    assert result.row(0, named=True)['p95_ms'] == pytest.approx(95, abs=1)
+    assert result.row(0, named=True)['p99_ms'] == pytest.approx(99, abs=1)
+
+
+def test_latency_percentiles_without_records():
+    """Test that no records give an empty table"""
+    assert latency_percentiles([]).is_empty()
+
+
+def test_route_shares():
+    """Test the count and share of every source per query"""
+    result = route_shares(
+        {
+            ('peak_hour', Source.HOURLY): 3,
+            ('peak_hour', Source.RAW): 1,
+            ('peak_day', Source.DAILY): 2,
+        }
+    )
+
+    assert result.rows() == [
+        ('peak_day', 'validacijas_daily', 2, 1.0),
+        ('peak_hour', 'validacijas_hourly', 3, 0.75),
+        ('peak_hour', 'validacijas', 1, 0.25),
+    ]
+
+
+def test_route_shares_without_counts():
+    """Test that no routed queries give an empty table"""
+    assert route_shares({}).is_empty()
+
+
+def test_metrics_size():
+    """Test that DataFrames are counted by their estimated size"""
+    df = pl.DataFrame({'total_rides': range(100)})
+
+    size = metrics_size({MetricsKeys.TOTAL_RIDES: df, MetricsKeys.PEAK_DAY: df})
+
+    assert size == 2 * df.estimated_size()
+
+
+def test_session_sizes():
+    """Test that sessions without metrics are listed with zero bytes"""
+    df = pl.DataFrame({'total_rides': range(100)})
+    sessions = [
+        SimpleNamespace(
+            session=SimpleNamespace(id='a', session_state={StateKeys.METRICS: {}})
+        ),
+        SimpleNamespace(
+            session=SimpleNamespace(
+                id='b',
+                session_state={StateKeys.METRICS: {MetricsKeys.TOTAL_RIDES: df}},
+            )
+        ),
+        SimpleNamespace(session=SimpleNamespace(id='c', session_state={})),
+    ]
+
+    with patch('diagnostics.runtime') as mock_runtime:
+        session_mgr = mock_runtime.get_instance.return_value._session_mgr
+        session_mgr.list_active_sessions.return_value = sessions
+        result = session_sizes()
+
+    assert result.rows() == [('b', df.estimated_size()), ('a', 0), ('c', 0)]
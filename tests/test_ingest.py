@@ -0,0 +1,441 @@
+import threading
+import zipfile
+from datetime import date, datetime, timedelta
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.request import urlopen
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from database import Backend, DatabaseConnection
+from ingest import (
+    CATEGORY,
+    HTTP_TIMEOUT_S,
+    STAGING_DIR,
+    backfill_duckdb,
+    block_size_for,
+    ingest_duckdb,
+    ingest_parquet,
+    list_archives,
+    read_member,
+    sniff_header,
+)
+from manifest import MANIFEST_FILE, MANIFEST_TABLE, read_manifest, read_manifest_file
+from rollups import INGEST_LOG_TABLE, MONTHLY_TABLE
+
+
+def validations_csv(start: datetime, rows: int, delimiter: str = ';') -> str:
+    """CSV text of validations every 7 minutes in the data.gov.lv layout"""
+    header = [
+        'Ier_ID',
+        'Parks',
+        'TranspVeids',
+        'GarNr',
+        'MarsrNos',
+        'TMarsruts',
+        'Virziens',
+        'ValidTalonaId',
+        'Laiks',
+    ]
+    lines = [delimiter.join(header)]
+    for i in range(rows):
+        laiks = start + timedelta(minutes=7 * i)
+        lines.append(
+            delimiter.join(
+                [
+                    str(i % 13),
+                    'P1',
+                    ['Autobuss', 'Tramvajs', 'Trolejbuss'][i % 3],
+                    str(i % 41),
+                    'Centrs - Imanta',
+                    f'R{i % 7}',
+                    'Forth',
+                    str(1000 + i),
+                    laiks.strftime('%d.%m.%Y %H:%M:%S'),
+                ]
+            )
+        )
+    return '\ufeff' + '\n'.join(lines) + '\n'
+
+
+def write_month(directory, month: date, rows: int) -> None:
+    """Write the archive of a month with one member and a readme"""
+    start = datetime(month.year, month.month, 1)
+    with zipfile.ZipFile(
+        directory / f'ValidDati{month:%m_%y}.zip', 'w', zipfile.ZIP_DEFLATED
+    ) as archive:
+        archive.writestr(f'ValidDati{month:%m_%y}.txt', validations_csv(start, rows))
+        archive.writestr('readme.md', 'not validations')
+
+
+@pytest.fixture
+def archives(tmp_path):
+    """Directory with two monthly archives of 3000 and 2000 rows"""
+    directory = tmp_path / 'zips'
+    directory.mkdir()
+    write_month(directory, date(2025, 5, 1), 3000)
+    write_month(directory, date(2025, 6, 1), 2000)
+    return directory
+
+
+@pytest.fixture
+def server(archives):
+    """URL of the May archive on a local HTTP server and its request methods"""
+    methods = []
+
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(archives), **kwargs)
+
+        def send_head(self):
+            methods.append(self.command)
+            return super().send_head()
+
+        def log_message(self, *args):
+            pass
+
+    with ThreadingHTTPServer(('127.0.0.1', 0), Handler) as httpd:
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        yield f'http://127.0.0.1:{httpd.server_port}/ValidDati05_25.zip', methods
+        httpd.shutdown()
+
+
+class TestListArchives:
+    def test_directory(self, archives):
+        assert [p.rsplit('/', 1)[-1] for p in list_archives(str(archives))] == [
+            'ValidDati05_25.zip',
+            'ValidDati06_25.zip',
+        ]
+
+    def test_file_url(self, archives):
+        path = archives / 'ValidDati05_25.zip'
+        assert list_archives(path.as_uri()) == [str(path)]
+
+    def test_missing(self, tmp_path):
+        with pytest.raises(ValueError, match='nav atrasts'):
+            list_archives(str(tmp_path / 'missing.zip'))
+
+
+class TestReadMember:
+    def test_sniffs_delimiter_and_bom(self, tmp_path):
+        path = tmp_path / 'a.zip'
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('a.csv', validations_csv(datetime(2025, 5, 1), 3, ','))
+        with zipfile.ZipFile(path) as archive, archive.open('a.csv') as member:
+            delimiter, columns = sniff_header(member)
+        assert delimiter == ','
+        assert columns[0] == 'Ier_ID'
+        assert columns[-1] == 'Laiks'
+
+    def test_types_and_blocks(self, archives):
+        with zipfile.ZipFile(archives / 'ValidDati05_25.zip') as archive:
+            reader = read_member(archive, 'ValidDati05_25.txt', block_size=2**14)
+            batches = list(reader)
+        assert len(batches) > 1
+        assert reader.schema.field('Laiks').type == pa.timestamp('us')
+        assert reader.schema.field('GarNr').type == pa.int32()
+        assert reader.schema.field('TranspVeids').type == CATEGORY
+        assert reader.schema.field('TMarsruts').type == CATEGORY
+        assert reader.schema.field('Ier_ID').type == pa.string()
+        assert sum(b.num_rows for b in batches) == 3000
+        assert batches[0].column('Laiks')[0].as_py() == datetime(2025, 5, 1)
+
+
+class TestIngestDuckdb:
+    def test_loads_and_refreshes_rollups(self, archives, tmp_path):
+        with duckdb.connect(str(tmp_path / 'v.duckdb')) as conn:
+            result = ingest_duckdb(conn, str(archives), block_size=2**14)
+
+            assert result.archives == 2
+            assert result.members == 2
+            assert result.rows == 5000
+            assert result.months == {date(2025, 5, 1), date(2025, 6, 1)}
+            assert conn.sql('select count(*) from validacijas').fetchone()[0] == 5000
+            assert (
+                conn.sql(f'select sum(ride_count) from {MONTHLY_TABLE}').fetchone()[0]
+                == 5000
+            )
+            assert (
+                conn.sql(f'select count(*) from {INGEST_LOG_TABLE}').fetchone()[0] == 2
+            )
+
+    def test_compact_types(self, archives, tmp_path):
+        with duckdb.connect(str(tmp_path / 'v.duckdb')) as conn:
+            ingest_duckdb(conn, str(archives), refresh=False)
+
+            types = {
+                row[0]: row[1] for row in conn.sql('describe validacijas').fetchall()
+            }
+            assert types['Laiks'] == 'TIMESTAMP'
+            assert types['GarNr'] == 'INTEGER'
+            assert types['TranspVeids'] == 'VARCHAR'
+
+    def test_appends_by_name(self, archives, tmp_path):
+        with duckdb.connect(str(tmp_path / 'v.duckdb')) as conn:
+            ingest_duckdb(conn, str(archives / 'ValidDati05_25.zip'), refresh=False)
+            ingest_duckdb(
+                conn, (archives / 'ValidDati06_25.zip').as_uri(), refresh=False
+            )
+
+            assert conn.sql('select count(*) from validacijas').fetchone()[0] == 5000
+            assert conn.sql(
+                'select distinct source_archive from validacijas order by 1'
+            ).fetchall() == [('ValidDati05_25',), ('ValidDati06_25',)]
+
+    def test_unchanged_archives_skipped(self, archives, tmp_path):
+        with duckdb.connect(str(tmp_path / 'v.duckdb')) as conn:
+            ingest_duckdb(conn, str(archives))
+            result = ingest_duckdb(conn, str(archives))
+
+            assert result.skipped == 2
+            assert result.archives == 0
+            assert result.months == set()
+            assert conn.sql('select count(*) from validacijas').fetchone()[0] == 5000
+            log = conn.sql(f'select count(*) from {INGEST_LOG_TABLE}').fetchone()[0]
+            assert log == 2
+
+    def test_republished_archive_replaced(self, archives, tmp_path):
+        with duckdb.connect(str(tmp_path / 'v.duckdb')) as conn:
+            ingest_duckdb(conn, str(archives))
+            write_month(archives, date(2025, 5, 1), 2500)
+            result = ingest_duckdb(conn, str(archives))
+
+            assert result.archives == 1
+            assert result.skipped == 1
+            assert result.months == {date(2025, 5, 1)}
+            assert conn.sql('select count(*) from validacijas').fetchone()[0] == 4500
+            assert (
+                conn.sql(
+                    f"""
+                select ride_count from {MONTHLY_TABLE}
+                where month = '2025-05-01' and TranspVeids = 'Tramvajs'
+                """
+                ).fetchone()[0]
+                == 2500 // 3
+            )
+            assert read_manifest(conn)['ValidDati05_25'].row_count == 2500
+
+    def test_untracked_rows_replaced(self, archives, tmp_path):
+        with duckdb.connect(str(tmp_path / 'v.duckdb')) as conn:
+            ingest_duckdb(conn, str(archives / 'ValidDati05_25.zip'), refresh=False)
+            conn.execute(f'drop table {MANIFEST_TABLE}')
+            conn.execute('alter table validacijas drop column source_archive')
+            conn.execute(
+                """
+                insert into validacijas
+                select * replace (t.Laiks as Laiks)
+                from
+                    (from validacijas limit 1),
+                    (values (timestamp '2025-04-30'), (timestamp '2025-05-31 23:00'))
+                        t(Laiks)
+                """
+            )
+            ingest_duckdb(conn, str(archives), refresh=False)
+
+            assert conn.sql('select count(*) from validacijas').fetchone()[0] == 5002
+            assert conn.sql(
+                'select Laiks from validacijas where source_archive is null order by 1'
+            ).fetchall() == [(datetime(2025, 4, 30),), (datetime(2025, 5, 31, 23),)]
+
+    def test_unchanged_remote_archive_not_downloaded(self, archives, server):
+        url, methods = server
+        with duckdb.connect() as conn:
+            ingest_duckdb(conn, url, refresh=False)
+            result = ingest_duckdb(conn, url, refresh=False)
+
+            assert result.skipped == 1
+            assert methods == ['GET', 'HEAD']
+            assert read_manifest(conn)['ValidDati05_25'].remote.content_length == (
+                (archives / 'ValidDati05_25.zip').stat().st_size
+            )
+
+            write_month(archives, date(2025, 5, 1), 2500)
+            result = ingest_duckdb(conn, url, refresh=False)
+
+            assert result.archives == 1
+            assert methods == ['GET', 'HEAD', 'HEAD', 'GET']
+            assert read_manifest(conn)['ValidDati05_25'].row_count == 2500
+
+    def test_head_timeout_downloads_archive(self, server):
+        url, methods = server
+
+        def timed_out_head(request, timeout):
+            assert timeout == HTTP_TIMEOUT_S
+            if getattr(request, 'method', None) == 'HEAD':
+                raise TimeoutError('timed out')
+            return urlopen(request, timeout=timeout)
+
+        with duckdb.connect() as conn:
+            ingest_duckdb(conn, url, refresh=False)
+            with patch('ingest.urlopen', side_effect=timed_out_head):
+                result = ingest_duckdb(conn, url, refresh=False)
+
+            assert result.skipped == 1
+            assert methods == ['GET', 'GET']
+
+    def test_failed_load_keeps_previous_rows(self, archives, tmp_path):
+        with duckdb.connect(str(tmp_path / 'v.duckdb')) as conn:
+            ingest_duckdb(conn, str(archives), refresh=False)
+            with zipfile.ZipFile(archives / 'ValidDati05_25.zip', 'a') as archive:
+                archive.writestr('broken.txt', 'Laiks;GarNr\nvakar;1\n')
+            with pytest.raises(pa.ArrowInvalid):
+                ingest_duckdb(conn, str(archives), refresh=False)
+
+            assert conn.sql('select count(*) from validacijas').fetchone()[0] == 5000
+            assert read_manifest(conn)['ValidDati05_25'].row_count == 3000
+
+
+class TestIngestParquet:
+    def test_readable_by_parquet_backend(self, archives, tmp_path):
+        result = ingest_parquet(tmp_path / 'data', str(archives), block_size=2**14)
+
+        assert result.archives == 2
+        assert result.rows == 5000
+        assert sorted(
+            p.relative_to(tmp_path / 'data/validacijas').as_posix()
+            for p in (tmp_path / 'data/validacijas').rglob('*.parquet')
+        ) == [
+            'year=2025/month=5/ValidDati05_25.parquet',
+            'year=2025/month=6/ValidDati06_25.parquet',
+        ]
+        assert not (tmp_path / 'data' / STAGING_DIR).exists()
+        DatabaseConnection._instance = None
+        db = DatabaseConnection(backend=Backend.PARQUET, path=str(tmp_path / 'data'))
+        assert (
+            db.conn.sql(
+                "select count(*) from validacijas where TranspVeids = 'Tramvajs'"
+            ).fetchone()[0]
+            == 1000 + 667
+        )
+        DatabaseConnection._instance = None
+
+    def test_process_pool(self, archives, tmp_path):
+        result = ingest_parquet(tmp_path / 'data', str(archives), workers=2)
+
+        assert result.archives == 2
+        assert result.rows == 5000
+        assert result.months == {date(2025, 5, 1), date(2025, 6, 1)}
+        assert len(list((tmp_path / 'data/validacijas').rglob('*.parquet'))) == 2
+
+    def test_sorted_row_groups(self, tmp_path):
+        start = datetime(2025, 5, 1)
+        lines = validations_csv(start, 3000).splitlines()
+        shuffled = '\n'.join(lines[:1] + lines[:0:-1])
+        path = tmp_path / 'ValidDati05_25.zip'
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('a.txt', shuffled)
+
+        ingest_parquet(tmp_path / 'data', str(path), row_group_size=2048)
+
+        file = tmp_path / 'data/validacijas/year=2025/month=5/ValidDati05_25.parquet'
+        metadata = pq.ParquetFile(file).metadata
+        laiks = metadata.schema.names.index('Laiks')
+        bounds = [
+            (rg.column(laiks).statistics.min, rg.column(laiks).statistics.max)
+            for rg in (metadata.row_group(i) for i in range(metadata.num_row_groups))
+        ]
+        assert metadata.num_row_groups == 2
+        assert bounds[0][0] == start
+        assert all(bounds[i][1] <= bounds[i + 1][0] for i in range(len(bounds) - 1))
+
+    def test_archive_across_months(self, tmp_path):
+        path = tmp_path / 'ValidDati05_25.zip'
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('a.txt', validations_csv(datetime(2025, 5, 31), 300))
+
+        result = ingest_parquet(tmp_path / 'data', str(path))
+
+        assert result.months == {date(2025, 5, 1), date(2025, 6, 1)}
+        assert sorted(
+            p.parent.name for p in (tmp_path / 'data/validacijas').rglob('*.parquet')
+        ) == ['month=5', 'month=6']
+
+    def test_unchanged_archives_skipped(self, archives, tmp_path):
+        ingest_parquet(tmp_path / 'data', str(archives))
+        files = sorted((tmp_path / 'data/validacijas').rglob('*.parquet'))
+        written = [f.stat().st_mtime_ns for f in files]
+        result = ingest_parquet(tmp_path / 'data', str(archives), workers=2)
+
+        assert result.skipped == 2
+        assert result.archives == 0
+        assert [f.stat().st_mtime_ns for f in files] == written
+
+    def test_republished_archive_replaces_files(self, archives, tmp_path):
+        with zipfile.ZipFile(archives / 'ValidDati05_25.zip', 'w') as archive:
+            archive.writestr('a.txt', validations_csv(datetime(2025, 5, 31), 300))
+        ingest_parquet(tmp_path / 'data', str(archives))
+        write_month(archives, date(2025, 5, 1), 2500)
+        result = ingest_parquet(tmp_path / 'data', str(archives))
+
+        assert result.archives == 1
+        assert result.skipped == 1
+        assert sorted(
+            p.relative_to(tmp_path / 'data/validacijas').as_posix()
+            for p in (tmp_path / 'data/validacijas').rglob('*.parquet')
+        ) == [
+            'year=2025/month=5/ValidDati05_25.parquet',
+            'year=2025/month=6/ValidDati06_25.parquet',
+        ]
+        with duckdb.connect() as conn:
+            files = (tmp_path / 'data/validacijas/**/*.parquet').as_posix()
+            assert conn.sql(f"select count(*) from '{files}'").fetchone()[0] == 4500
+        manifest = read_manifest_file(tmp_path / 'data' / MANIFEST_FILE)
+        assert manifest['ValidDati05_25'].row_count == 2500
+        assert manifest['ValidDati05_25'].files == [
+            'year=2025/month=5/ValidDati05_25.parquet'
+        ]
+        assert manifest['ValidDati06_25'].row_count == 2000
+
+    def test_republished_archive_keeps_similar_names(self, archives, tmp_path):
+        corrected = tmp_path / 'corrected'
+        corrected.mkdir()
+        with zipfile.ZipFile(corrected / 'ValidDati05_25_labots.zip', 'w') as archive:
+            archive.writestr('a.txt', validations_csv(datetime(2025, 5, 1), 100))
+        ingest_parquet(tmp_path / 'data', str(archives))
+        ingest_parquet(tmp_path / 'data', str(corrected))
+        write_month(archives, date(2025, 5, 1), 2500)
+        ingest_parquet(tmp_path / 'data', str(archives))
+
+        assert sorted(
+            p.name for p in (tmp_path / 'data/validacijas/year=2025/month=5').iterdir()
+        ) == ['ValidDati05_25.parquet', 'ValidDati05_25_labots.parquet']
+
+
+class TestBackfillDuckdb:
+    def test_process_pool(self, archives, tmp_path):
+        with duckdb.connect(str(tmp_path / 'v.duckdb')) as conn:
+            result = backfill_duckdb(conn, str(archives), workers=2)
+
+            assert result.archives == 2
+            assert result.rows == 5000
+            assert conn.sql('select count(*) from validacijas').fetchone()[0] == 5000
+            assert (
+                conn.sql(f'select sum(ride_count) from {MONTHLY_TABLE}').fetchone()[0]
+                == 5000
+            )
+
+    def test_skips_and_replaces(self, archives, tmp_path):
+        with duckdb.connect(str(tmp_path / 'v.duckdb')) as conn:
+            backfill_duckdb(conn, str(archives), workers=2)
+            write_month(archives, date(2025, 6, 1), 1000)
+            result = backfill_duckdb(conn, str(archives), workers=2)
+
+            assert result.archives == 1
+            assert result.skipped == 1
+            assert result.months == {date(2025, 6, 1)}
+            assert conn.sql('select count(*) from validacijas').fetchone()[0] == 4000
+
+    def test_failed_partition_is_rolled_back(self, archives, tmp_path):
+        with duckdb.connect(str(tmp_path / 'v.duckdb')) as conn:
+            conn.execute('create table validacijas (Laiks timestamp)')
+            with pytest.raises(duckdb.BinderException):
+                backfill_duckdb(conn, str(archives), refresh=False, workers=1)
+
+            assert conn.sql('select count(*) from validacijas').fetchone()[0] == 0
+
+
+def test_block_size_for():
+    assert block_size_for(64) == 16 * 2**20
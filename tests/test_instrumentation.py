@@ -0,0 +1,176 @@
+import json
+import threading
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+import streamlit as st
+
+from instrumentation import (
+    CacheOutcome,
+    CacheStats,
+    QueryLog,
+    QueryRecord,
+    param_shape,
+    tracked,
+)
+
+
+def record(name='peak_day', wall_s=0.01):
+    """Query record with fixed measurements"""
+    return QueryRecord(
+        name=name,
+        wall_s=wall_s,
+        rows=7,
+        bytes=112,
+        params={'start_date': 'date'},
+        cache=CacheOutcome.MISS,
+    )
+
+
+def test_param_shape():
+    """Test that parameter values are replaced by their types"""
+    params = {'start_date': date(2025, 7, 1), 'tr_types': ['Autobuss', 'Tramvajs']}
+
+    assert param_shape(params) == {'start_date': 'date', 'tr_types': 'list[2]'}
+
+
+def test_records_written_as_json_lines(tmp_path):
+    """Test that every record is one JSON object per line"""
+    path = tmp_path / 'logs' / 'queries.jsonl'
+    query_log = QueryLog(str(path))
+
+    query_log.log(record('peak_day'))
+    query_log.log(record('peak_hour'))
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line['name'] for line in lines] == ['peak_day', 'peak_hour']
+    assert lines[0]['cache'] == 'miss'
+    assert lines[0]['params'] == {'start_date': 'date'}
+    assert lines[0]['explain'] is None
+    assert [r.name for r in query_log.recent] == ['peak_day', 'peak_hour']
+
+
+def test_log_rotates(tmp_path):
+    """Test that the log is rotated at the size limit"""
+    path = tmp_path / 'queries.jsonl'
+    query_log = QueryLog(str(path), max_bytes=500, backups=2)
+
+    for _ in range(20):
+        query_log.log(record())
+
+    assert path.with_name('queries.jsonl.1').exists()
+    assert path.with_name('queries.jsonl.2').exists()
+    assert not path.with_name('queries.jsonl.3').exists()
+
+
+def test_without_path_keeps_recent_only(tmp_path):
+    """Test that no file is written without a path"""
+    query_log = QueryLog()
+
+    query_log.log(record())
+
+    assert len(query_log.recent) == 1
+    assert not list(tmp_path.iterdir())
+
+
+def test_snapshot_while_logging():
+    """Test that a snapshot can be taken while other threads log records"""
+    query_log = QueryLog()
+    stop = threading.Event()
+
+    def log_records():
+        while not stop.is_set():
+            query_log.log(record())
+
+    writer = threading.Thread(target=log_records)
+    writer.start()
+    try:
+        for _ in range(200):
+            snapshot = query_log.snapshot()
+            assert all(isinstance(r, QueryRecord) for r in snapshot)
+    finally:
+        stop.set()
+        writer.join()
+
+    assert isinstance(query_log.snapshot(), list)
+
+
+def test_slow_queries_are_explained():
+    """Test that queries above the threshold are logged with their profile"""
+    query_log = QueryLog(explain_threshold_s=0.5)
+
+    query_log.log(record(wall_s=0.1), explain=lambda: 'fast plan')
+    query_log.log(record(wall_s=1.0), explain=lambda: 'slow plan')
+    query_log._explainer.shutdown(wait=True)  # ty:ignore[possibly-missing-attribute]
+
+    assert [r.explain for r in query_log.recent] == [None, 'slow plan']
+
+
+def test_failing_explain_keeps_record():
+    """Test that a failing profile does not lose the record"""
+    query_log = QueryLog(explain_threshold_s=0)
+
+    def explain():
+        raise RuntimeError('lost')
+
+    query_log.log(record(), explain=explain)
+    query_log._explainer.shutdown(wait=True)  # ty:ignore[possibly-missing-attribute]
+
+    assert len(query_log.recent) == 1
+    assert query_log.recent[0].explain is None
+
+
+class TestTracked:
+    """Test cases for the hit and miss counting of cached getters"""
+
+    @pytest.fixture
+    def cache_stats(self):
+        """Empty cache statistics"""
+        cache_stats = CacheStats()
+        with patch('instrumentation.cache_stats', cache_stats):
+            yield cache_stats
+
+    def test_counts_hits_and_misses(self, cache_stats):
+        """Test that only calls that run the getter are misses"""
+
+        @tracked(st.cache_data(show_spinner=False))
+        def get_square(x: int) -> int:
+            """Square of x"""
+            return x * x
+
+        get_square.clear()
+        assert [get_square(2), get_square(2), get_square(3)] == [4, 4, 9]
+
+        assert cache_stats.frame().row(0, named=True) == {
+            'name': 'get_square',
+            'calls': 3,
+            'misses': 2,
+            'hits': 1,
+            'hit_ratio': pytest.approx(1 / 3),
+        }
+        assert get_square.__doc__ == 'Square of x'
+
+    def test_clear(self, cache_stats):
+        """Test that clearing the cache makes the next call a miss"""
+
+        @tracked(st.cache_data(show_spinner=False))
+        def get_one() -> int:
+            return 1
+
+        get_one.clear()
+        get_one()
+        get_one.clear()
+        get_one()
+
+        assert cache_stats.misses['get_one'] == 2
+
+    def test_empty_frame(self, cache_stats):
+        """Test the statistics before any call"""
+        assert cache_stats.frame().columns == [
+            'name',
+            'calls',
+            'misses',
+            'hits',
+            'hit_ratio',
+        ]
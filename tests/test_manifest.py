@@ -0,0 +1,103 @@
+from dataclasses import replace
+from datetime import date, datetime
+
+import duckdb
+import pytest
+
+from manifest import (
+    MANIFEST_TABLE,
+    ManifestEntry,
+    RemoteVersion,
+    clear_manifest,
+    read_manifest,
+    read_manifest_file,
+    record_archive,
+    write_manifest_file,
+)
+
+ENTRY = ManifestEntry(
+    archive='ValidDati05_25',
+    sha256='ab' * 32,
+    row_count=3000,
+    months=[date(2025, 5, 1), date(2025, 6, 1)],
+    loaded_at=datetime(2025, 6, 2, 3, 4, 5),
+)
+REMOTE = RemoteVersion(
+    etag=None, last_modified='Mon, 02 Jun 2025 03:04:05 GMT', content_length=1234
+)
+
+
+@pytest.fixture
+def conn():
+    """In-memory DuckDB connection"""
+    with duckdb.connect() as conn:
+        yield conn
+
+
+class TestDuckdbManifest:
+    def test_empty(self, conn):
+        assert read_manifest(conn) == {}
+
+    def test_record_and_replace(self, conn):
+        record_archive(conn, ENTRY)
+        assert read_manifest(conn) == {ENTRY.archive: ENTRY}
+
+        republished = ManifestEntry(
+            ENTRY.archive, 'cd' * 32, 2500, [date(2025, 5, 1)], datetime(2025, 7, 1)
+        )
+        record_archive(conn, republished)
+        assert read_manifest(conn) == {ENTRY.archive: republished}
+
+    def test_remote_version(self, conn):
+        entry = replace(ENTRY, remote=REMOTE)
+        record_archive(conn, entry)
+        assert read_manifest(conn) == {ENTRY.archive: entry}
+
+    def test_adds_remote_columns(self, conn):
+        conn.execute(
+            f"""
+            create table {MANIFEST_TABLE} (
+                archive VARCHAR primary key,
+                sha256 VARCHAR not null,
+                row_count BIGINT not null,
+                months DATE[] not null,
+                loaded_at TIMESTAMP not null
+            )
+            """
+        )
+        record_archive(conn, ENTRY)
+        assert read_manifest(conn) == {ENTRY.archive: ENTRY}
+
+    def test_clear(self, conn):
+        record_archive(conn, ENTRY)
+        clear_manifest(conn)
+        assert read_manifest(conn) == {}
+
+
+class TestManifestFile:
+    def test_missing(self, tmp_path):
+        assert read_manifest_file(tmp_path / 'manifest.json') == {}
+
+    def test_round_trip(self, tmp_path):
+        path = tmp_path / 'manifest.json'
+        entry = replace(
+            ENTRY, remote=REMOTE, files=['year=2025/month=5/ValidDati05_25.parquet']
+        )
+        write_manifest_file(path, {ENTRY.archive: entry})
+
+        assert read_manifest_file(path) == {ENTRY.archive: entry}
+        assert [p.name for p in tmp_path.iterdir()] == ['manifest.json']
+
+
+class TestRemoteVersion:
+    def test_etag(self):
+        assert RemoteVersion(etag='"a"').matches(
+            RemoteVersion(etag='"a"', content_length=1)
+        )
+        assert not RemoteVersion(etag='"a"').matches(RemoteVersion(etag='"b"'))
+        assert not RemoteVersion(etag='"a"').matches(REMOTE)
+
+    def test_last_modified_and_length(self):
+        assert REMOTE.matches(replace(REMOTE))
+        assert not REMOTE.matches(replace(REMOTE, content_length=1235))
+        assert not RemoteVersion().matches(RemoteVersion())
@@ -0,0 +1,206 @@
+import threading
+import time
+from contextlib import nullcontext
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import duckdb
+import pytest
+from streamlit import cache_resource
+
+from prefetch import Prefetcher, PrefetchRequest, prefetch_adjacent_months
+from state_manager import StateKeys
+
+JULY = (date(2025, 7, 1), date(2025, 7, 31))
+AUGUST = (date(2025, 8, 1), date(2025, 8, 31))
+
+
+@pytest.fixture
+def mock_db():
+    """Mock DatabaseConnection with an idle cursor pool"""
+    db = MagicMock()
+    db.pool.stats = SimpleNamespace(in_use=0)
+    return db
+
+
+@pytest.fixture
+def mock_queries():
+    """Patch the metric getters run by the prefetcher"""
+    with (
+        patch('prefetch.get_month_metrics') as mock_month_metrics,
+        patch('prefetch.get_total_rides') as mock_total_rides,
+    ):
+        yield mock_month_metrics, mock_total_rides
+
+
+def test_prefetch_runs_requests(mock_db, mock_queries):
+    """Test that submitted requests fill the metric caches"""
+    mock_month_metrics, mock_total_rides = mock_queries
+    prefetcher = Prefetcher(mock_db)
+
+    prefetcher.submit('a', [PrefetchRequest(JULY, ('Autobuss',), 3)])
+
+    assert prefetcher.wait(timeout=5)
+    mock_month_metrics.assert_called_once_with(mock_db, JULY, ['Autobuss'], watermark=3)
+    mock_total_rides.assert_called_once_with(
+        mock_db, JULY[1], ['Autobuss'], watermark=3
+    )
+    assert prefetcher.completed == 1
+
+
+def test_prefetch_waits_for_idle_pool(mock_db, mock_queries):
+    """Test that the prefetch does not start while interactive queries run"""
+    mock_month_metrics, _ = mock_queries
+    mock_db.pool.stats = SimpleNamespace(in_use=1)
+    prefetcher = Prefetcher(mock_db, idle_poll_s=0.01)
+
+    prefetcher.submit('a', [PrefetchRequest(JULY, ('Autobuss',), 1)])
+
+    assert not prefetcher.wait(timeout=0.1)
+    mock_month_metrics.assert_not_called()
+
+    mock_db.pool.stats = SimpleNamespace(in_use=0)
+    assert prefetcher.wait(timeout=5)
+    mock_month_metrics.assert_called_once()
+
+
+def test_submit_replaces_waiting_requests(mock_db, mock_queries):
+    """Test that requests of a left selection are dropped"""
+    mock_month_metrics, _ = mock_queries
+    started = threading.Event()
+    release = threading.Event()
+
+    def month_metrics(db, date_range, *args, **kwargs):
+        started.set()
+        release.wait(timeout=5)
+
+    mock_month_metrics.side_effect = month_metrics
+    prefetcher = Prefetcher(mock_db)
+
+    prefetcher.submit('a', [PrefetchRequest(JULY, ('Autobuss',), 1)])
+    assert started.wait(timeout=5)
+    prefetcher.submit('a', [PrefetchRequest(JULY, ('Tramvajs',), 1)])
+    prefetcher.submit('a', [PrefetchRequest(AUGUST, ('Tramvajs',), 1)])
+    release.set()
+
+    assert prefetcher.wait(timeout=5)
+    assert [call.args[1] for call in mock_month_metrics.call_args_list] == [
+        JULY,
+        AUGUST,
+    ]
+
+
+def test_sessions_keep_their_requests(mock_db, mock_queries):
+    """Test that a submit replaces only the waiting requests of its session"""
+    mock_month_metrics, _ = mock_queries
+    mock_db.pool.stats = SimpleNamespace(in_use=1)
+    prefetcher = Prefetcher(mock_db, idle_poll_s=0.01)
+
+    prefetcher.submit('a', [PrefetchRequest(JULY, ('Autobuss',), 1)])
+    prefetcher.submit('b', [PrefetchRequest(AUGUST, ('Autobuss',), 1)])
+    prefetcher.submit('c', [PrefetchRequest(JULY, ('Autobuss',), 1)])
+    mock_db.pool.stats = SimpleNamespace(in_use=0)
+
+    assert prefetcher.wait(timeout=5)
+    assert [call.args[1] for call in mock_month_metrics.call_args_list] == [
+        JULY,
+        AUGUST,
+    ]
+
+
+def test_interactive_query_interrupts_prefetch(mock_db, mock_queries):
+    """Test that a running prefetch yields when another cursor is checked out"""
+    mock_month_metrics, mock_total_rides = mock_queries
+    scopes = []
+    mock_db.scope.side_effect = lambda scope: scopes.append(scope) or nullcontext()
+
+    def month_metrics(db, date_range, *args, **kwargs):
+        mock_db.pool.stats = SimpleNamespace(in_use=2)
+        while not scopes[-1].cancelled:
+            time.sleep(0.01)
+        raise duckdb.InterruptException('interrupted')
+
+    mock_month_metrics.side_effect = month_metrics
+    prefetcher = Prefetcher(mock_db, idle_poll_s=0.01)
+
+    prefetcher.submit('a', [PrefetchRequest(JULY, ('Autobuss',), 1)])
+    mock_db.pool.stats = SimpleNamespace(in_use=0)
+
+    assert prefetcher.wait(timeout=5)
+    mock_total_rides.assert_not_called()
+    assert (prefetcher.completed, prefetcher.interrupted) == (0, 1)
+
+
+def test_prefetch_survives_errors(mock_db, mock_queries):
+    """Test that a failing request does not stop the worker"""
+    mock_month_metrics, _ = mock_queries
+    mock_month_metrics.side_effect = [RuntimeError('lost'), None]
+    prefetcher = Prefetcher(mock_db)
+
+    prefetcher.submit('a', [PrefetchRequest(JULY, ('Autobuss',), 1)])
+    assert prefetcher.wait(timeout=5)
+    prefetcher.submit('a', [PrefetchRequest(AUGUST, ('Autobuss',), 1)])
+    assert prefetcher.wait(timeout=5)
+
+    assert prefetcher.completed == 2
+
+
+class TestPrefetchAdjacentMonths:
+    """Test cases for the prefetch_adjacent_months function"""
+
+    @pytest.fixture
+    def session_state(self):
+        """Session state with a selection in the middle of the available months"""
+        return {
+            StateKeys.AVAILABLE_MONTHS: [
+                date(2025, 6, 1),
+                date(2025, 7, 1),
+                date(2025, 8, 1),
+            ],
+            StateKeys.SELECTED_MONTH: date(2025, 7, 1),
+            StateKeys.SELECTED_TR_TYPES: ['Tramvajs', 'Autobuss'],
+            StateKeys.DATA_VERSION: 4,
+        }
+
+    @pytest.fixture
+    def mock_prefetcher(self):
+        """Patch the prefetcher of the process"""
+        with patch('prefetch.get_prefetcher') as mock_get_prefetcher:
+            yield mock_get_prefetcher.return_value
+        cache_resource.clear()
+
+    def test_submits_next_and_previous_month(
+        self, mock_db, session_state, mock_prefetcher
+    ):
+        """Test that both neighbours are requested, the next month first"""
+        prefetch_adjacent_months(mock_db, session_state)  # ty:ignore[invalid-argument-type]
+
+        mock_prefetcher.submit.assert_called_once_with(
+            '',
+            [
+                PrefetchRequest(AUGUST, ('Tramvajs', 'Autobuss'), 4),
+                PrefetchRequest(
+                    (date(2025, 6, 1), date(2025, 6, 30)), ('Tramvajs', 'Autobuss'), 4
+                ),
+            ],
+        )
+
+    def test_latest_month_has_one_neighbour(
+        self, mock_db, session_state, mock_prefetcher
+    ):
+        """Test that months outside of the data are not requested"""
+        session_state[StateKeys.SELECTED_MONTH] = date(2025, 8, 1)
+
+        prefetch_adjacent_months(mock_db, session_state)  # ty:ignore[invalid-argument-type]
+
+        requests = mock_prefetcher.submit.call_args.args[1]
+        assert [r.date_range for r in requests] == [JULY]
+
+    def test_no_transport_types(self, mock_db, session_state, mock_prefetcher):
+        """Test that an empty selection is not prefetched"""
+        session_state[StateKeys.SELECTED_TR_TYPES] = []
+
+        prefetch_adjacent_months(mock_db, session_state)  # ty:ignore[invalid-argument-type]
+
+        mock_prefetcher.submit.assert_not_called()
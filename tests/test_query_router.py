@@ -0,0 +1,216 @@
+import logging
+from datetime import date
+
+import duckdb
+import pytest
+from polars.testing import assert_frame_equal
+from streamlit import cache_resource
+
+from data_manager import (
+    MonthMetric,
+    get_month_components,
+    get_month_metrics,
+    get_total_rides,
+    get_total_rides_components,
+)
+from database import Backend, DatabaseConnection
+from query_router import (
+    Grain,
+    RoutedQuery,
+    Source,
+    get_rollup_coverage,
+    render,
+    route,
+    route_count_snapshot,
+    route_counts,
+)
+from rollups import refresh_rollups
+
+FULL_COVERAGE = {
+    Source.MONTHLY: (date(2025, 6, 1), date(2025, 8, 31)),
+    Source.DAILY: (date(2025, 6, 1), date(2025, 8, 31)),
+    Source.VEHICLES: (date(2025, 6, 1), date(2025, 8, 31)),
+    Source.HOURLY: (date(2025, 6, 1), date(2025, 8, 31)),
+}
+
+
+def where_clause(date_column: str) -> str:
+    return f'where {date_column} >= $start_date'
+
+
+class TestRoute:
+    """Test cases for the route function"""
+
+    @pytest.mark.parametrize(
+        ('grain', 'expected'),
+        [
+            (Grain.DAY, Source.DAILY),
+            (Grain.VEHICLE, Source.VEHICLES),
+            (Grain.HOUR, Source.HOURLY),
+        ],
+    )
+    def test_cheapest_source_with_grain(self, grain, expected):
+        """Test that the cheapest rollup with the needed grain is chosen"""
+        date_range = (date(2025, 8, 1), date(2025, 8, 31))
+        assert route(grain, FULL_COVERAGE, date_range=date_range) is expected
+
+    def test_whole_months_use_monthly_summary(self):
+        """Test that month grain queries over whole months read the summary"""
+        assert route(Grain.MONTH, FULL_COVERAGE, up_to_date=date(2025, 8, 31)) is (
+            Source.MONTHLY
+        )
+        date_range = (date(2025, 7, 1), date(2025, 8, 31))
+        assert route(Grain.MONTH, FULL_COVERAGE, date_range=date_range) is (
+            Source.MONTHLY
+        )
+
+    def test_partial_months_skip_monthly_summary(self):
+        """Test that partial months are answered from the daily rollup"""
+        assert route(Grain.MONTH, FULL_COVERAGE, up_to_date=date(2025, 8, 15)) is (
+            Source.DAILY
+        )
+        date_range = (date(2025, 8, 2), date(2025, 8, 31))
+        assert route(Grain.MONTH, FULL_COVERAGE, date_range=date_range) is (
+            Source.DAILY
+        )
+
+    def test_skips_missing_rollup(self):
+        """Test that a missing daily rollup falls through to the next source"""
+        coverage = {Source.HOURLY: (date(2025, 6, 1), date(2025, 8, 31))}
+        assert route(Grain.DAY, coverage, up_to_date=date(2025, 8, 31)) is (
+            Source.HOURLY
+        )
+
+    def test_dates_beyond_coverage_use_raw(self):
+        """Test that dates newer than the rollups are answered from raw data"""
+        date_range = (date(2025, 9, 1), date(2025, 9, 30))
+        assert route(Grain.DAY, FULL_COVERAGE, date_range=date_range) is Source.RAW
+        assert route(Grain.HOUR, FULL_COVERAGE, up_to_date=date(2025, 9, 30)) is (
+            Source.RAW
+        )
+
+    def test_dates_before_coverage_use_raw(self):
+        """Test that ranges starting before the rollups are answered from raw data"""
+        date_range = (date(2025, 5, 1), date(2025, 6, 30))
+        assert route(Grain.DAY, FULL_COVERAGE, date_range=date_range) is Source.RAW
+        assert route(Grain.MONTH, FULL_COVERAGE, date_range=date_range) is (Source.RAW)
+
+    def test_no_rollups_use_raw(self):
+        """Test that everything is answered from raw data without rollups"""
+        assert route(Grain.DAY, {}) is Source.RAW
+
+    def test_no_date_filter(self):
+        """Test that unfiltered queries use any existing rollup"""
+        assert route(Grain.DAY, FULL_COVERAGE) is Source.DAILY
+
+
+class TestRender:
+    """Test cases for the render function"""
+
+    query = RoutedQuery(
+        name='test_query',
+        sql='select * from {source}',
+        grains={'source': Grain.DAY},
+    )
+
+    def test_rollup_filters_on_day(self):
+        """Test that rollup subqueries filter on the day column"""
+        sql = render(self.query, FULL_COVERAGE, where_clause)
+        assert 'validacijas_daily' in sql
+        assert 'where day >= $start_date' in sql
+
+    def test_raw_filters_on_laiks(self):
+        """Test that raw subqueries filter on Laiks so the scan can be pruned"""
+        sql = render(self.query, {}, where_clause)
+        assert 'from\n            validacijas\n' in sql
+        assert 'where Laiks >= $start_date' in sql
+
+    def test_logs_and_counts_source(self, caplog):
+        """Test that the chosen source is logged and counted"""
+        before = route_counts['test_query', Source.RAW]
+        with caplog.at_level(logging.INFO, logger='query_router'):
+            render(self.query, {}, where_clause)
+        assert route_counts['test_query', Source.RAW] == before + 1
+        assert route_count_snapshot()['test_query', Source.RAW] == before + 1
+        assert 'served from validacijas' in caplog.text
+
+
+class TestRoutedResults:
+    """Test that routed queries return the same data from every source"""
+
+    @pytest.fixture
+    def db(self, tmp_path):
+        """Local database with raw data and rollups"""
+        DatabaseConnection._instance = None
+        get_rollup_coverage.clear()
+        get_month_components.clear()
+        get_total_rides_components.clear()
+        db_file = tmp_path / 'validacijas.duckdb'
+        with duckdb.connect(str(db_file)) as conn:
+            conn.execute(
+                """
+                create table validacijas as
+                select
+                    timestamp '2025-06-20' + to_minutes(i * 9) as Laiks,
+                    ['Autobuss', 'Tramvajs'][1 + i % 2] as TranspVeids,
+                    'R' || floor(sqrt(i % 200))::INT as TMarsruts,
+                    i % 23 as GarNr
+                from range(12000) t(i)
+                """
+            )
+            refresh_rollups(conn)
+        db = DatabaseConnection(backend=Backend.DUCKDB, path=str(db_file))
+        yield db
+        db.conn.close()
+        DatabaseConnection._instance = None
+        get_rollup_coverage.clear()
+        cache_resource.clear()
+
+    def test_coverage_is_read_from_database(self, db):
+        """Test that coverage lists every rollup up to the end of the last month"""
+        coverage = get_rollup_coverage(db)
+        assert set(coverage) == set(Source) - {Source.RAW}
+        assert {until for _, until in coverage.values()} == {date(2025, 9, 30)}
+
+    def test_rollups_and_raw_agree(self, db, monkeypatch):
+        """Test month metrics and totals from rollups against raw data"""
+        date_range = (date(2025, 7, 1), date(2025, 7, 31))
+        from_rollups = get_month_metrics(db, date_range, ['Tramvajs'])
+        totals_from_rollups = get_total_rides(db, date(2025, 7, 31))
+
+        get_month_components.clear()
+        get_total_rides_components.clear()
+        monkeypatch.setattr('data_manager.get_rollup_coverage', lambda _db: {})
+        from_raw = get_month_metrics(db, date_range, ['Tramvajs'])
+        totals_from_raw = get_total_rides(db, date(2025, 7, 31))
+
+        for metric in MonthMetric:
+            assert_frame_equal(from_rollups[metric], from_raw[metric])
+        assert_frame_equal(totals_from_rollups, totals_from_raw)
+
+    @pytest.mark.parametrize('up_to_date', [date(2025, 8, 31), date(2025, 8, 17)])
+    @pytest.mark.parametrize('tr_types', [None, ['Autobuss']])
+    def test_total_rides_sources_agree(self, db, monkeypatch, up_to_date, tr_types):
+        """Test monthly summary and day level totals against raw data"""
+        routed = get_total_rides(db, up_to_date, tr_types)
+
+        get_total_rides_components.clear()
+        monkeypatch.setattr('data_manager.get_rollup_coverage', lambda _db: {})
+        assert_frame_equal(routed, get_total_rides(db, up_to_date, tr_types))
+
+
+def test_coverage_without_rollups(tmp_path):
+    """Test that a database without rollups routes everything to raw data"""
+    DatabaseConnection._instance = None
+    get_rollup_coverage.clear()
+    db_file = tmp_path / 'raw.duckdb'
+    with duckdb.connect(str(db_file)) as conn:
+        conn.execute('create table validacijas as select 1 as GarNr')
+
+    db = DatabaseConnection(backend=Backend.DUCKDB, path=str(db_file))
+    assert get_rollup_coverage(db) == {}
+
+    db.conn.close()
+    DatabaseConnection._instance = None
+    get_rollup_coverage.clear()
+    cache_resource.clear()
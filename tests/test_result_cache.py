@@ -0,0 +1,118 @@
+import os
+from datetime import date
+from unittest.mock import patch
+
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from result_cache import ResultCache
+
+
+def frame(rows: int) -> pl.DataFrame:
+    """DataFrame with the given number of rows"""
+    return pl.DataFrame({'day': [date(2025, 1, 1)] * rows, 'ride_count': range(rows)})
+
+
+def test_put_and_get(tmp_path):
+    """Test that a stored result is read back unchanged"""
+    cache = ResultCache(str(tmp_path))
+    df = frame(3)
+
+    cache.put('key', df)
+
+    assert_frame_equal(cache.get('key'), df)
+    assert list(tmp_path.iterdir()) == [tmp_path / 'key.arrow']
+    assert cache.hits == 1
+
+
+def test_shared_between_instances(tmp_path):
+    """Test that another process' cache instance reads the stored result"""
+    ResultCache(str(tmp_path)).put('key', frame(3))
+
+    assert_frame_equal(ResultCache(str(tmp_path)).get('key'), frame(3))
+
+
+def test_missing_and_corrupt_results(tmp_path):
+    """Test that missing and unreadable files are cache misses"""
+    cache = ResultCache(str(tmp_path))
+    (tmp_path / 'corrupt.arrow').write_bytes(b'not arrow')
+
+    assert cache.get('missing') is None
+    assert cache.get('corrupt') is None
+    assert cache.misses == 2
+
+
+def test_hit_when_mtime_not_updated(tmp_path):
+    """Test that a result read before a failed mtime update is still returned"""
+    cache = ResultCache(str(tmp_path))
+    cache.put('key', frame(3))
+
+    with patch('result_cache.os.utime', side_effect=PermissionError):
+        assert_frame_equal(cache.get('key'), frame(3))
+    assert cache.hits == 1
+
+
+def test_failed_write_is_skipped(tmp_path):
+    """Test that a result Polars cannot write is logged and not stored"""
+    cache = ResultCache(str(tmp_path))
+    df = pl.DataFrame({'value': [object()]}, schema={'value': pl.Object})
+
+    cache.put('key', df)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_disabled_without_path():
+    """Test that a cache without a path stores nothing"""
+    cache = ResultCache()
+    cache.put('key', frame(1))
+
+    assert not cache.enabled
+    assert cache.get('key') is None
+
+
+def test_key_normalizes_query_whitespace():
+    """Test that the key ignores query formatting but not parameters or version"""
+    key = ResultCache.key('select  1\n from t', {'day': date(2025, 1, 1)}, '1')
+
+    assert key == ResultCache.key('select 1 from t', {'day': date(2025, 1, 1)}, '1')
+    assert key != ResultCache.key('select 1 from t', {'day': date(2025, 1, 2)}, '1')
+    assert key != ResultCache.key('select 1 from t', {'day': date(2025, 1, 1)}, '2')
+
+
+def test_evicts_least_recently_used(tmp_path):
+    """Test that writes beyond max_bytes remove the least recently used results"""
+    cache = ResultCache(str(tmp_path))
+    cache.put('old', frame(100))
+    cache.put('used', frame(100))
+    size = (tmp_path / 'old.arrow').stat().st_size
+    os.utime(tmp_path / 'old.arrow', (1, 1))
+    os.utime(tmp_path / 'used.arrow', (2, 2))
+    cache.get('used')
+
+    cache._max_bytes = 2 * size
+    cache.put('new', frame(100))
+
+    assert cache.get('old') is None
+    assert cache.get('used') is not None
+    assert cache.get('new') is not None
+
+
+def test_removes_stale_temporary_files(tmp_path):
+    """Test that writes and clear remove temporary files left by killed writers"""
+    cache = ResultCache(str(tmp_path))
+    stale = tmp_path / 'old.1.2.tmp'
+    fresh = tmp_path / 'new.1.3.tmp'
+    stale.write_bytes(b'partial')
+    fresh.write_bytes(b'partial')
+    os.utime(stale, (1, 1))
+
+    cache.put('result', frame(3))
+
+    assert not stale.exists()
+    assert fresh.exists()
+
+    os.utime(fresh, (1, 1))
+    cache.clear()
+
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,302 @@
+from datetime import date
+
+import duckdb
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+from streamlit import cache_resource
+
+from data_manager import (
+    SQL_PEAK_DAY,
+    SQL_PEAK_HOUR,
+    SQL_ROUTE_DENSITY,
+    _get_data_with_filters,
+    get_available_months,
+    get_catalog,
+    get_total_rides,
+    get_total_rides_components,
+)
+from database import Backend, DatabaseConnection
+from query_router import get_rollup_coverage
+from rollups import (
+    COVERAGE_TABLE,
+    DAILY_TABLE,
+    HOURLY_TABLE,
+    INGEST_LOG_TABLE,
+    MONTHLY_TABLE,
+    VEHICLES_TABLE,
+    refresh_month,
+    refresh_rollups,
+)
+
+ROLLUP_TABLES = (DAILY_TABLE, HOURLY_TABLE, VEHICLES_TABLE, MONTHLY_TABLE)
+
+SQL_CREATE_VALIDACIJAS = """
+    create or replace table validacijas as
+    select
+        timestamp '2025-05-20' + to_minutes(i * 11) as Laiks,
+        ['Autobuss', 'Tramvajs', 'Trolejbuss'][1 + i % 3] as TranspVeids,
+        'R' || floor(sqrt(i % 300))::INT as TMarsruts,
+        i % 41 as GarNr
+    from range(15000) t(i)
+    """
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    """DuckDB database file with raw validations and their rollups"""
+    path = tmp_path / 'validacijas.duckdb'
+    with duckdb.connect(str(path)) as conn:
+        conn.execute(SQL_CREATE_VALIDACIJAS)
+        refresh_rollups(conn)
+    return path
+
+
+@pytest.fixture
+def db(db_file):
+    """DatabaseConnection to the local database file"""
+    DatabaseConnection._instance = None
+    get_catalog.clear()
+    get_total_rides_components.clear()
+    get_rollup_coverage.clear()
+    db = DatabaseConnection(backend=Backend.DUCKDB, path=str(db_file))
+    yield db
+    db.conn.close()
+    DatabaseConnection._instance = None
+    cache_resource.clear()
+
+
+def raw(db: DatabaseConnection, sql: str, params: dict) -> pl.DataFrame:
+    """Run a query against the raw validacijas table"""
+    with db.cursor():
+        return db.get_relation(sql, params).pl()
+
+
+def test_rollups_keep_all_rides(db_file):
+    """Test that the rollups add up to the raw ride count"""
+    with duckdb.connect(str(db_file), read_only=True) as conn:
+        (raw_count,) = conn.sql('select count(*) from validacijas').fetchone()
+        for table in ROLLUP_TABLES:
+            (rollup_count,) = conn.sql(
+                f'select sum(ride_count) from {table}'
+            ).fetchone()
+            assert rollup_count == raw_count
+
+
+def test_refresh_rollups_replaces_tables(db_file):
+    """Test that refreshing after new data rebuilds the rollups"""
+    with duckdb.connect(str(db_file)) as conn:
+        conn.execute(
+            'insert into validacijas values '
+            "(timestamp '2025-12-01 10:00', 'Autobuss', 'R1', 1)"
+        )
+        refresh_rollups(conn)
+        (rides,) = conn.sql(
+            f"select sum(ride_count) from {HOURLY_TABLE} where day = '2025-12-01'"
+        ).fetchone()
+    assert rides == 1
+
+
+def test_available_months(db):
+    """Test that the available months come from the rollups"""
+    months = get_available_months(db)
+    assert months == [date(2025, m, 1) for m in range(5, 10)]
+
+
+def test_total_rides_matches_raw(db):
+    """Test month totals and daily averages against the raw table"""
+    expected = raw(
+        db,
+        """
+        select
+            count(*) as total_rides,
+            round(count(*) / count(distinct date(Laiks)), 0) as avg_rides_per_day,
+            date_trunc('month', Laiks) as moy
+        from validacijas
+        where Laiks < $up_to_date::DATE + 1 and TranspVeids in $tr_types
+        group by moy
+        order by moy
+        """,
+        {'up_to_date': date(2025, 6, 30), 'tr_types': ['Tramvajs']},
+    )
+
+    result = get_total_rides(db, date(2025, 6, 30), ['Tramvajs'])
+
+    assert_frame_equal(result, expected, check_dtypes=False)
+
+
+def test_peak_hour_and_day_match_raw(db):
+    """Test per-hour and per-weekday averages against the raw table"""
+    params = {'start_date': date(2025, 6, 1), 'end_date': date(2025, 6, 30)}
+    where = 'where Laiks >= $start_date and Laiks < $end_date::DATE + 1'
+    expected_hours = raw(
+        db,
+        f"""
+        select
+            hour(Laiks) as hour,
+            round(count(*) / count(distinct date(Laiks)), 0) as avg_rides_per_hour
+        from validacijas
+        {where}
+        group by hour
+        order by hour
+        """,
+        params,
+    )
+    expected_days = raw(
+        db,
+        f"""
+        select round(count(*) / count(distinct date(Laiks)), 0) as avg
+        from validacijas
+        {where}
+        group by isodow(Laiks)
+        order by isodow(Laiks)
+        """,
+        params,
+    )
+
+    hours = _get_data_with_filters(
+        db, SQL_PEAK_HOUR, (params['start_date'], params['end_date'])
+    )
+    days = _get_data_with_filters(
+        db, SQL_PEAK_DAY, (params['start_date'], params['end_date'])
+    )
+
+    assert_frame_equal(
+        hours.filter(pl.col('avg_rides_per_hour') > 0),
+        expected_hours,
+        check_dtypes=False,
+    )
+    assert (
+        days.get_column('Braucieni vidēji dienā').to_list()
+        == expected_days.get_column('avg').to_list()
+    )
+
+
+def test_route_density_matches_raw(db):
+    """Test that distinct vehicles per route are exact with the vehicles rollup"""
+    expected = raw(
+        db,
+        """
+        select
+            TMarsruts as 'Maršruts',
+            round(count(*) / count(distinct GarNr), 0) as 'Vidējais braucienu skaits'
+        from validacijas
+        where Laiks >= $start_date and Laiks < $end_date::DATE + 1
+        group by TMarsruts
+        order by count(*) desc
+        limit 15
+        """,
+        {'start_date': date(2025, 6, 1), 'end_date': date(2025, 6, 30)},
+    )
+
+    result = _get_data_with_filters(
+        db, SQL_ROUTE_DENSITY, (date(2025, 6, 1), date(2025, 6, 30))
+    )
+
+    assert_frame_equal(result, expected, check_dtypes=False)
+
+
+class FailingConnection:
+    """Connection wrapper that fails when the vehicles rollup is written"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def execute(self, query, params=None):
+        if query.strip().startswith(f'insert into {VEHICLES_TABLE}'):
+            raise duckdb.IOException('connection lost')
+        return self._conn.execute(query, params)
+
+
+def rollup_rows(conn, table):
+    """All rows of a rollup table in a stable order"""
+    return conn.sql(f'select * from {table} order by all').fetchall()
+
+
+def test_refresh_month_matches_full_rebuild(db_file):
+    """Test that merging a new month gives the same rollups as a full rebuild"""
+    with duckdb.connect(str(db_file)) as conn:
+        conn.execute(
+            """
+            insert into validacijas
+            select
+                timestamp '2025-10-01' + to_minutes(i * 13),
+                ['Autobuss', 'Tramvajs'][1 + i % 2],
+                'R' || i % 7,
+                i % 5
+            from range(3000) t(i)
+            where timestamp '2025-10-01' + to_minutes(i * 13) < '2025-11-01'
+            """
+        )
+        refresh_month(conn, date(2025, 10, 1))
+        incremental = {t: rollup_rows(conn, t) for t in ROLLUP_TABLES}
+        (covered_until,) = conn.sql(
+            f'select distinct covered_until from {COVERAGE_TABLE}'
+        ).fetchone()
+
+        refresh_rollups(conn)
+        for table in ROLLUP_TABLES:
+            assert incremental[table] == rollup_rows(conn, table)
+    assert covered_until == date(2025, 10, 31)
+
+
+def test_refresh_month_only_touches_that_month(db_file):
+    """Test that other months are not re-aggregated"""
+    daily_rides = f"""
+        select day, sum(ride_count)::BIGINT from {DAILY_TABLE}
+        where day in ('2025-06-10', '2025-07-10')
+        group by day
+        """
+    with duckdb.connect(str(db_file)) as conn:
+        before = dict(conn.sql(daily_rides).fetchall())
+        conn.execute(
+            'insert into validacijas values '
+            "(timestamp '2025-06-10 08:00', 'Autobuss', 'R1', 1), "
+            "(timestamp '2025-07-10 08:00', 'Autobuss', 'R1', 1)"
+        )
+        refresh_month(conn, date(2025, 7, 15))
+        after = dict(conn.sql(daily_rides).fetchall())
+
+    assert after[date(2025, 6, 10)] == before[date(2025, 6, 10)]
+    assert after[date(2025, 7, 10)] == before[date(2025, 7, 10)] + 1
+
+
+def test_refreshes_are_logged(db_file):
+    """Test that rebuilds and month refreshes are numbered in the ingest log"""
+    with duckdb.connect(str(db_file)) as conn:
+        refresh_month(conn, date(2025, 7, 15))
+        refresh_rollups(conn)
+        log = conn.sql(
+            f'select seq, loaded_from, loaded_until from {INGEST_LOG_TABLE} '
+            'order by seq'
+        ).fetchall()
+
+    assert log == [
+        (1, None, None),
+        (2, date(2025, 7, 1), date(2025, 7, 31)),
+        (3, None, None),
+    ]
+
+
+def test_refresh_month_is_atomic(db_file):
+    """Test that a failed merge leaves the previous rollups in place"""
+    with duckdb.connect(str(db_file)) as conn:
+        before = {t: rollup_rows(conn, t) for t in ROLLUP_TABLES}
+        conn.execute("delete from validacijas where Laiks >= '2025-07-01'")
+
+        with pytest.raises(duckdb.IOException):
+            refresh_month(FailingConnection(conn), date(2025, 7, 1))
+
+        for table in ROLLUP_TABLES:
+            assert before[table] == rollup_rows(conn, table)
+
+
+def test_refresh_month_builds_missing_rollups(tmp_path):
+    """Test that the first refresh builds the rollups from scratch"""
+    with duckdb.connect(str(tmp_path / 'new.duckdb')) as conn:
+        conn.execute(SQL_CREATE_VALIDACIJAS)
+        refresh_month(conn, date(2025, 6, 1))
+        (rollup_count,) = conn.sql(
+            f'select sum(ride_count) from {HOURLY_TABLE}'
+        ).fetchone()
+    assert rollup_count == 15000
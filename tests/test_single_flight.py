@@ -0,0 +1,148 @@
+import threading
+
+import duckdb
+import pytest
+
+from database import QueryScope
+from single_flight import SingleFlight
+
+
+def run_concurrently(flight, key, call, n):
+    """Call flight.do from n threads once all of them are waiting"""
+    results = [None] * n
+
+    def run(i):
+        try:
+            results[i] = flight.do(key, call)
+        except Exception as error:
+            results[i] = error
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_calls_share_one_execution():
+    """Test that callers arriving during an execution get its result"""
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        release.wait(timeout=5)
+        return 'result'
+
+    threads, results = run_concurrently(flight, 'key', call, 5)
+    while flight.executions + flight.shared < 5:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert len(calls) == 1
+    assert (
+        sorted(results, key=lambda r: r[1])
+        == [('result', False)] + [('result', True)] * 4
+    )
+    assert (flight.executions, flight.shared) == (1, 4)
+
+
+def test_sequential_calls_execute_again():
+    """Test that a finished call is not reused"""
+    flight = SingleFlight()
+
+    assert flight.do('key', lambda: 1) == (1, False)
+    assert flight.do('key', lambda: 2) == (2, False)
+    assert flight.executions == 2
+
+
+def test_different_keys_run_separately():
+    """Test that only identical keys are coalesced"""
+    flight = SingleFlight()
+
+    assert flight.do('a', lambda: 'a') == ('a', False)
+    assert flight.do('b', lambda: 'b') == ('b', False)
+
+
+def test_exception_is_shared():
+    """Test that waiting callers get the exception of the execution"""
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def call():
+        release.wait(timeout=5)
+        raise duckdb.IOException('lost')
+
+    threads, results = run_concurrently(flight, 'key', call, 3)
+    while flight.executions + flight.shared < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert all(isinstance(r, duckdb.IOException) for r in results)
+    assert flight.executions == 1
+
+    assert flight.do('key', lambda: 'retry') == ('retry', False)
+
+
+def test_retried_exception_is_not_shared():
+    """Test that waiting callers run the call again after an interrupt"""
+    flight = SingleFlight(retry_on=(duckdb.InterruptException,))
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(timeout=5)
+            raise duckdb.InterruptException('Interrupted!')
+        return 'result'
+
+    threads, results = run_concurrently(flight, 'key', call, 3)
+    while flight.executions + flight.shared < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert sum(isinstance(r, duckdb.InterruptException) for r in results) == 1
+    assert [r[0] for r in results if isinstance(r, tuple)] == ['result', 'result']
+    assert len(calls) in {2, 3}
+
+
+def test_waiter_times_out():
+    """Test that a waiting caller stops after its timeout"""
+    flight = SingleFlight()
+    release = threading.Event()
+    threads, _ = run_concurrently(flight, 'key', lambda: release.wait(timeout=5), 1)
+    while flight.executions < 1:
+        threading.Event().wait(0.01)
+
+    with pytest.raises(TimeoutError):
+        flight.do('key', lambda: 'unused', timeout=0.1)
+
+    release.set()
+    threads[0].join(timeout=5)
+
+
+def test_waiter_stops_when_scope_cancelled():
+    """Test that a waiting caller is interrupted with its own query scope"""
+    flight = SingleFlight()
+    release = threading.Event()
+    threads, results = run_concurrently(
+        flight, 'key', lambda: release.wait(timeout=5), 1
+    )
+    while flight.executions < 1:
+        threading.Event().wait(0.01)
+    scope = QueryScope()
+    threading.Timer(0.1, scope.cancel).start()
+
+    with pytest.raises(duckdb.InterruptException):
+        flight.do('key', lambda: 'unused', scope=scope)
+
+    release.set()
+    threads[0].join(timeout=5)
+    assert results == [(True, False)]
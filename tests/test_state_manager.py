@@ -1,9 +1,16 @@
+import threading
+import time
 from datetime import date
 from unittest.mock import MagicMock, patch
 
+import duckdb
 import polars as pl
 import pytest
+from streamlit.runtime.scriptrunner_utils.exceptions import RerunException
+from streamlit.runtime.scriptrunner_utils.script_requests import RerunData
 
+from data_manager import MonthMetric
+from database import QueryScope
 from state_manager import (
     MetricsKeys,
     StateKeys,
@@ -22,6 +29,13 @@ def setup_mocks():
     return mock_db, mock_session_state
 
 
+@pytest.fixture(autouse=True)
+def mock_watermark():
+    """Setup for the ingest watermark of the database"""
+    with patch('state_manager.get_watermark', return_value=1) as mock_get_watermark:
+        yield mock_get_watermark
+
+
 @pytest.fixture
 def mock_tr_types():
     """Setup for transport types available in database"""
@@ -62,7 +76,7 @@ class TestInitState:
 
             init_state(mock_db, mock_session_state)
 
-            mock_get_months.assert_called_once_with(mock_db)
+            mock_get_months.assert_called_once_with(mock_db, watermark=1)
             assert StateKeys.AVAILABLE_MONTHS in mock_session_state
             assert (
                 mock_session_state[StateKeys.AVAILABLE_MONTHS] == mock_available_months
@@ -125,10 +139,23 @@ class TestInitState:
         ):
             init_state(mock_db, mock_session_state)
 
-            assert StateKeys.METRICS in mock_session_state
-            assert isinstance(mock_session_state[StateKeys.METRICS], dict)
             mock_get_metrics.assert_called_once()
 
+    def test_init_state_timeout_leaves_metrics_unset(self, setup_mocks):
+        """Test that a timed out initial load is reported and retried next rerun"""
+        mock_db, mock_session_state = setup_mocks
+
+        with (
+            patch('state_manager.get_available_months'),
+            patch('state_manager.get_available_tr_types'),
+            patch('state_manager.update_metrics', side_effect=TimeoutError('Timeout')),
+            patch('state_manager.st.toast') as mock_toast,
+        ):
+            init_state(mock_db, mock_session_state)
+
+        mock_toast.assert_called_once_with(body='Timeout', icon=':material/timer_off:')
+        assert StateKeys.METRICS not in mock_session_state
+
     def test_init_state_skips_initialized_values(self, setup_mocks):
         """
         Test that functions are not called if values are already stored in session state
@@ -141,6 +168,7 @@ class TestInitState:
                 StateKeys.AVAILABLE_TR_TYPES: ['Autobuss', 'Tramvajs', 'Trolejbuss'],
                 StateKeys.SELECTED_TR_TYPES: ['Tramvajs', 'Trolejbuss'],
                 StateKeys.METRICS: {},
+                StateKeys.DATA_VERSION: 1,
             }
         )
 
@@ -155,6 +183,85 @@ class TestInitState:
             mock_get_tr_types.assert_not_called()
             mock_get_metrics.assert_not_called()
 
+    def test_init_state_reloads_after_ingest(self, setup_mocks, mock_watermark):
+        """Test that a new watermark reloads the data of the current selection"""
+        mock_db, mock_session_state = setup_mocks
+        mock_session_state.update(
+            {
+                StateKeys.AVAILABLE_MONTHS: [date(2025, 1, 1), date(2025, 2, 1)],
+                StateKeys.SELECTED_MONTH: date(2025, 1, 1),
+                StateKeys.AVAILABLE_TR_TYPES: ['Autobuss', 'Tramvajs'],
+                StateKeys.SELECTED_TR_TYPES: ['Tramvajs'],
+                StateKeys.METRICS: {},
+                StateKeys.DATA_VERSION: 1,
+            }
+        )
+        mock_watermark.return_value = 2
+        months = [date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1)]
+
+        with (
+            patch('state_manager.get_available_months', return_value=months),
+            patch('state_manager.get_available_tr_types') as mock_get_tr_types,
+            patch('state_manager.update_metrics') as mock_update_metrics,
+        ):
+            init_state(mock_db, mock_session_state)  # ty:ignore[invalid-argument-type]
+
+            mock_get_tr_types.assert_called_once_with(
+                mock_db,
+                date_range=(date(2025, 1, 1), date(2025, 1, 31)),
+                watermark=2,
+            )
+            mock_update_metrics.assert_called_once_with(
+                db=mock_db,
+                session_state=mock_session_state,
+                date_range=(date(2025, 1, 1), date(2025, 1, 31)),
+                tr_types=['Tramvajs'],
+                watermark=2,
+            )
+        assert mock_session_state[StateKeys.AVAILABLE_MONTHS] == months
+        assert mock_session_state[StateKeys.SELECTED_MONTH] == date(2025, 1, 1)
+        assert mock_session_state[StateKeys.DATA_VERSION] == 2
+
+    def test_init_state_reload_timeout_retried(self, setup_mocks, mock_watermark):
+        """Test that a timed out reload is reported and runs again next rerun"""
+        mock_db, mock_session_state = setup_mocks
+        old_months = [date(2025, 1, 1), date(2025, 2, 1)]
+        mock_session_state.update(
+            {
+                StateKeys.AVAILABLE_MONTHS: old_months,
+                StateKeys.SELECTED_MONTH: date(2025, 1, 1),
+                StateKeys.AVAILABLE_TR_TYPES: ['Autobuss', 'Tramvajs'],
+                StateKeys.SELECTED_TR_TYPES: ['Tramvajs'],
+                StateKeys.METRICS: {},
+                StateKeys.DATA_VERSION: 1,
+            }
+        )
+        mock_watermark.return_value = 2
+        months = [*old_months, date(2025, 3, 1)]
+
+        with (
+            patch('state_manager.get_available_months', return_value=months),
+            patch('state_manager.get_available_tr_types'),
+            patch(
+                'state_manager.update_metrics', side_effect=TimeoutError('Timeout')
+            ) as mock_update_metrics,
+            patch('state_manager.st.toast') as mock_toast,
+        ):
+            init_state(mock_db, mock_session_state)  # ty:ignore[invalid-argument-type]
+
+            mock_toast.assert_called_once_with(
+                body='Timeout', icon=':material/timer_off:'
+            )
+            assert mock_session_state[StateKeys.AVAILABLE_MONTHS] == old_months
+            assert mock_session_state[StateKeys.DATA_VERSION] == 1
+
+            mock_update_metrics.side_effect = None
+            init_state(mock_db, mock_session_state)  # ty:ignore[invalid-argument-type]
+
+            assert mock_update_metrics.call_count == 2
+        assert mock_session_state[StateKeys.AVAILABLE_MONTHS] == months
+        assert mock_session_state[StateKeys.DATA_VERSION] == 2
+
 
 def test_update_available_tr_types(setup_mocks, mock_tr_types):
     """Test update_available_tr_types updates session state"""
@@ -166,7 +273,9 @@ def test_update_available_tr_types(setup_mocks, mock_tr_types):
 
         update_available_tr_types(mock_db, mock_session_state, date_range)
 
-        mock_get_tr_types.assert_called_once_with(mock_db, date_range=date_range)
+        mock_get_tr_types.assert_called_once_with(
+            mock_db, date_range=date_range, watermark=0
+        )
 
         assert StateKeys.AVAILABLE_TR_TYPES in mock_session_state
         assert (
@@ -185,41 +294,82 @@ def test_update_metrics(setup_mocks, mock_tr_types):
 
     with (
         patch('state_manager.get_total_rides') as mock_total_rides,
-        patch('state_manager.get_rides_per_day') as mock_rides_per_day,
-        patch('state_manager.get_peak_hour') as mock_peak_hour,
-        patch('state_manager.get_popular_routes') as mock_popular_routes,
-        patch('state_manager.get_tr_distribution') as mock_tr_distribution,
-        patch('state_manager.get_peak_day') as mock_peak_day,
-        patch('state_manager.get_route_density') as mock_route_density,
+        patch('state_manager.get_month_metrics') as mock_month_metrics,
     ):
+        mock_month_metrics.return_value = {
+            metric: pl.DataFrame({'metric': [metric.value]}) for metric in MonthMetric
+        }
         update_metrics(mock_db, mock_session_state, date_range, tr_types)
 
         mock_total_rides.assert_called_once_with(
-            _db=mock_db, up_to_date=max_date, tr_types=tr_types
-        )
-        mock_rides_per_day.assert_called_once_with(
-            _db=mock_db, date_range=date_range, tr_types=tr_types
-        )
-        mock_peak_hour.assert_called_once_with(
-            _db=mock_db, date_range=date_range, tr_types=tr_types
+            _db=mock_db, up_to_date=max_date, tr_types=tr_types, watermark=0
         )
-        mock_popular_routes.assert_called_once_with(
-            _db=mock_db, date_range=date_range, tr_types=tr_types
-        )
-        mock_tr_distribution.assert_called_once_with(
-            _db=mock_db, date_range=date_range, tr_types=tr_types
-        )
-        mock_peak_day.assert_called_once_with(
-            _db=mock_db, date_range=date_range, tr_types=tr_types
-        )
-        mock_route_density.assert_called_once_with(
-            _db=mock_db, date_range=date_range, tr_types=tr_types
+        mock_month_metrics.assert_called_once_with(
+            _db=mock_db, date_range=date_range, tr_types=tr_types, watermark=0
         )
 
-        assert MetricsKeys.TOTAL_RIDES in mock_session_state[StateKeys.METRICS]
-        assert MetricsKeys.RIDES_PER_DAY in mock_session_state[StateKeys.METRICS]
-        assert MetricsKeys.PEAK_HOUR in mock_session_state[StateKeys.METRICS]
-        assert MetricsKeys.POPULAR_ROUTES in mock_session_state[StateKeys.METRICS]
-        assert MetricsKeys.TR_DISTRIBUTION in mock_session_state[StateKeys.METRICS]
-        assert MetricsKeys.PEAK_DAY in mock_session_state[StateKeys.METRICS]
-        assert MetricsKeys.ROUTE_DENSITY in mock_session_state[StateKeys.METRICS]
+        metrics = mock_session_state[StateKeys.METRICS]
+        assert set(metrics) == set(MetricsKeys)
+        assert metrics[MetricsKeys.TOTAL_RIDES] is mock_total_rides.return_value
+        assert metrics[MetricsKeys.PEAK_HOUR]['metric'][0] == 'peak_hour'
+        assert metrics[MetricsKeys.ROUTE_DENSITY]['metric'][0] == 'route_density'
+
+
+def test_update_metrics_runs_queries_concurrently(setup_mocks, mock_tr_types):
+    """Test that update_metrics dispatches both queries at the same time"""
+    mock_db, mock_session_state = setup_mocks
+    date_range = (date(2025, 11, 1), date(2025, 11, 30))
+    tr_types = mock_tr_types['TranspVeids'].to_list()
+    mock_session_state[StateKeys.METRICS] = {}
+    barrier = threading.Barrier(2)
+    threads = set()
+
+    def total_rides(**kwargs):
+        # Both queries block until the other one is running as well
+        barrier.wait(timeout=5)
+        threads.add(threading.current_thread().name)
+        return pl.DataFrame()
+
+    def month_metrics(**kwargs):
+        barrier.wait(timeout=5)
+        threads.add(threading.current_thread().name)
+        return {metric: pl.DataFrame() for metric in MonthMetric}
+
+    with (
+        patch('state_manager.get_total_rides', total_rides),
+        patch('state_manager.get_month_metrics', month_metrics),
+    ):
+        update_metrics(mock_db, mock_session_state, date_range, tr_types)
+
+    assert set(mock_session_state[StateKeys.METRICS]) == set(MetricsKeys)
+    assert len(threads) == 2
+
+
+def test_update_metrics_cancelled_by_rerun(setup_mocks, mock_tr_types):
+    """Test that a pending rerun interrupts the queries and keeps the old metrics"""
+    mock_db, mock_session_state = setup_mocks
+    date_range = (date(2025, 11, 1), date(2025, 11, 30))
+    tr_types = mock_tr_types['TranspVeids'].to_list()
+    old_metrics = {MetricsKeys.TOTAL_RIDES: pl.DataFrame({'total_rides': [1]})}
+    mock_session_state[StateKeys.METRICS] = old_metrics
+    scope = QueryScope()
+
+    def month_metrics(**kwargs):
+        while not scope.cancelled:
+            time.sleep(0.01)
+        raise duckdb.InterruptException('Interrupted!')
+
+    with (
+        patch('state_manager.QueryScope', return_value=scope),
+        patch('state_manager.get_total_rides'),
+        patch('state_manager.get_month_metrics', side_effect=month_metrics),
+        patch('state_manager.st.empty') as mock_empty,
+        pytest.raises(RerunException),
+    ):
+        # Streamlit raises at the placeholder update when a rerun is waiting
+        mock_empty.return_value.empty.side_effect = RerunException(RerunData())
+        update_metrics(mock_db, mock_session_state, date_range, tr_types)
+
+    assert scope.cancelled
+    assert mock_session_state[StateKeys.METRICS] is old_metrics
+    assert mock_db.scope.call_count == 2
@@ -0,0 +1,121 @@
+from datetime import date
+from itertools import combinations
+from unittest.mock import patch
+
+import duckdb
+import pytest
+from streamlit import cache_resource
+
+from data_manager import (
+    get_catalog,
+    get_ingest_log,
+    get_month_components,
+    get_month_metrics,
+    get_total_rides,
+    get_total_rides_components,
+)
+from database import Backend, DatabaseConnection
+from query_router import get_rollup_coverage
+from rollups import refresh_rollups
+from utils import last_day_of_month
+from warmup import WarmupStatus, start_warmup, warm_up
+
+TR_TYPES = ['Autobuss', 'Tramvajs', 'Trolejbuss']
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Local database with four months of validations and their rollups"""
+    DatabaseConnection._instance = None
+    for getter in (
+        get_catalog,
+        get_ingest_log,
+        get_month_components,
+        get_total_rides_components,
+        get_rollup_coverage,
+    ):
+        getter.clear()
+    db_file = tmp_path / 'validacijas.duckdb'
+    with duckdb.connect(str(db_file)) as conn:
+        conn.execute(
+            """
+            create table validacijas as
+            select
+                timestamp '2025-06-01' + to_minutes(i * 13) as Laiks,
+                ['Autobuss', 'Tramvajs', 'Trolejbuss'][1 + i % 3] as TranspVeids,
+                'R' || i % 7 as TMarsruts,
+                i % 19 as GarNr
+            from range(13000) t(i)
+            """
+        )
+        refresh_rollups(conn)
+    db = DatabaseConnection(backend=Backend.DUCKDB, path=str(db_file))
+    yield db
+    db.conn.close()
+    DatabaseConnection._instance = None
+    cache_resource.clear()
+
+
+def test_warm_up_caches_every_type_combination(db):
+    """Test that any selection of the warmed months needs no query"""
+    status = warm_up(db, months=2)
+
+    assert status.finished
+    assert status.error is None
+    assert status.done == status.total == 2 * len(TR_TYPES)
+
+    with patch.object(db, 'get_relation', side_effect=AssertionError):
+        for month in (date(2025, 8, 1), date(2025, 9, 1)):
+            date_range = (month, last_day_of_month(month))
+            for size in range(1, len(TR_TYPES) + 1):
+                for tr_types in combinations(TR_TYPES, size):
+                    get_month_metrics(db, date_range, list(tr_types), watermark=1)
+                    get_total_rides(db, date_range[1], list(tr_types), watermark=1)
+
+
+def test_warm_up_starts_with_latest_month(db):
+    """Test that the latest month is warmed up first"""
+    with patch('warmup.get_month_metrics') as mock_month_metrics:
+        warm_up(db, months=3)
+
+    date_ranges = [call.args[1] for call in mock_month_metrics.call_args_list]
+    assert date_ranges[0] == (date(2025, 9, 1), date(2025, 9, 30))
+    assert date_ranges[-1] == (date(2025, 7, 1), date(2025, 7, 31))
+
+
+def test_warm_up_reports_errors(db):
+    """Test that a failing query stops the warm-up and is reported"""
+    with patch('warmup.get_total_rides', side_effect=duckdb.IOException('lost')):
+        status = warm_up(db, months=1)
+
+    assert status.finished
+    assert isinstance(status.error, duckdb.IOException)
+    assert status.done == 0
+    assert status.progress == 1.0
+
+
+def test_status_progress():
+    """Test the progress and duration of a running warm-up"""
+    status = WarmupStatus(total=4, done=1)
+
+    assert not status.finished
+    assert status.progress == 0.25
+    assert status.duration_s >= 0
+
+
+def test_start_warmup_runs_once_in_background(db):
+    """Test that the warm-up thread is started once per process"""
+    with patch('warmup.warm_up') as mock_warm_up:
+        status = start_warmup(db, 2)
+        assert start_warmup(db, 2) is status
+
+    mock_warm_up.assert_called_once_with(db, 2, status)
+
+
+def test_start_warmup_disabled(db):
+    """Test that zero months disables the warm-up"""
+    with patch('warmup.warm_up') as mock_warm_up:
+        status = start_warmup(db, 0)
+
+    assert status.finished
+    mock_warm_up.assert_not_called()
@@ -0,0 +1,38 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from database import PoolStats
+from warmup import WarmupStatus
+from widgets.diagnostics import render_diagnostics
+
+
+@pytest.fixture
+def mock_streamlit():
+    """Patch streamlit in the diagnostics widget"""
+    with patch('widgets.diagnostics.st') as mock_st:
+        mock_st.columns.return_value = [MagicMock(), MagicMock(), MagicMock()]
+        mock_st.button.return_value = False
+        yield mock_st
+
+
+def test_render_diagnostics(mock_streamlit):
+    """Test that every statistics table and the process summary are rendered"""
+    db = MagicMock()
+    db.pool.stats = PoolStats(size=8, checkouts=3)
+
+    render_diagnostics(db, WarmupStatus(total=4, done=2))
+
+    assert mock_streamlit.dataframe.call_count == 5
+    summary = mock_streamlit.json.call_args.args[0]
+    assert summary['pool']['checkouts'] == 3
+    assert summary['warmup'] == {
+        'done': 2,
+        'total': 4,
+        'duration_s': pytest.approx(0, abs=1),
+        'error': None,
+    }
+    col1, _, col3 = mock_streamlit.columns.return_value
+    col1.metric.assert_called_once_with('Aktīvās sesijas', 0, border=True)
+    col3.metric.assert_called_once_with('Iesildīšana', '50%', border=True)
+    mock_streamlit.rerun.assert_not_called()
@@ -0,0 +1,153 @@
+"""
+Background warm-up of the data_manager caches.
+
+Metrics are cached per transport type, so warming every type of a month also covers
+every combination of types the sidebar can select.
+"""
+
+import argparse
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+
+import streamlit as st
+
+from data_manager import (
+    get_available_months,
+    get_available_tr_types,
+    get_month_metrics,
+    get_total_rides,
+    get_watermark,
+)
+from database import DatabaseConnection, db
+from utils import last_day_of_month
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WarmupStatus:
+    """
+    Progress of a warm-up run, counted in (month, transport type) pairs.
+    """
+
+    total: int = 0
+    done: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: float | None = None
+    error: Exception | None = None
+
+    @property
+    def finished(self) -> bool:
+        """
+        Whether the warm-up has stopped, successfully or not.
+        """
+        return self.finished_at is not None
+
+    @property
+    def progress(self) -> float:
+        """
+        Share of the pairs warmed up, between 0 and 1.
+        """
+        if self.finished:
+            return 1.0
+        return self.done / self.total if self.total else 0.0
+
+    @property
+    def duration_s(self) -> float:
+        """
+        Seconds since the start, up to the end when finished.
+        """
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+
+def warm_up(
+    db: DatabaseConnection,
+    months: int,
+    status: WarmupStatus | None = None,
+) -> WarmupStatus:
+    """
+    Compute the metrics of the latest months for every transport type.
+
+    The latest month is warmed up first, as it is the one every session opens with.
+    """
+    status = status or WarmupStatus()
+    try:
+        watermark = get_watermark(db)
+        tasks: list[tuple[tuple[date, date], str]] = []
+        for month in get_available_months(db, watermark=watermark)[::-1][:months]:
+            date_range = (month, last_day_of_month(month))
+            tr_types = get_available_tr_types(db, date_range, watermark=watermark)
+            tasks += [(date_range, tr) for tr in tr_types.get_column('TranspVeids')]
+        status.total = len(tasks)
+
+        for date_range, tr_type in tasks:
+            get_month_metrics(db, date_range, [tr_type], watermark=watermark)
+            get_total_rides(db, date_range[1], [tr_type], watermark=watermark)
+            status.done += 1
+            logger.info(
+                'Warm-up %d/%d: %s %s',
+                status.done,
+                status.total,
+                date_range[0],
+                tr_type,
+            )
+    except Exception as error:
+        status.error = error
+        logger.exception('Warm-up failed after %d/%d', status.done, status.total)
+    finally:
+        status.finished_at = time.monotonic()
+
+    logger.info('Warm-up of %d months finished in %.1f s', months, status.duration_s)
+    return status
+
+
+@st.cache_resource(show_spinner=False)
+def start_warmup(_db: DatabaseConnection, months: int) -> WarmupStatus:
+    """
+    Start the warm-up in a background thread, once per server process.
+    """
+    status = WarmupStatus()
+    if months <= 0:
+        status.finished_at = status.started_at
+        return status
+
+    thread = threading.Thread(
+        target=warm_up,
+        args=(_db, months, status),
+        name='warmup',
+        daemon=True,
+    )
+    thread.start()
+    return status
+
+
+_config = st.secrets.duckdb
+
+WARMUP_MONTHS: int = _config.get('warmup_months', 3)
+
+
+def main() -> None:
+    """
+    Warm up the persistent result cache before the app is started.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        '--months',
+        type=int,
+        default=WARMUP_MONTHS,
+        help='number of latest months to warm up',
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    status = warm_up(db, args.months)
+    if status.error:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
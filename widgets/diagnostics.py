@@ -0,0 +1,70 @@
+from dataclasses import asdict
+
+import streamlit as st
+
+from database import DatabaseConnection
+from diagnostics import cache_memory, latency_percentiles, route_shares, session_sizes
+from instrumentation import cache_stats, query_log
+from query_router import route_count_snapshot
+from result_cache import result_cache
+from single_flight import in_flight
+from warmup import WarmupStatus
+
+
+def render_diagnostics(db: DatabaseConnection, warmup: WarmupStatus) -> None:
+    """
+    Render the operational statistics of the server process.
+    """
+    st.title('Diagnostika')
+
+    if st.button('Atjaunot'):
+        st.rerun()
+
+    sessions = session_sizes()
+    memory = cache_memory()
+    col1, col2, col3 = st.columns(3)
+    col1.metric('Aktīvās sesijas', sessions.height, border=True)
+    col2.metric(
+        'Kešatmiņa, MB', f'{memory.get_column("bytes").sum() / 2**20:.1f}', border=True
+    )
+    col3.metric('Iesildīšana', f'{warmup.progress:.0%}', border=True)
+
+    st.subheader('st.cache_data trāpījumi')
+    st.dataframe(cache_stats.frame(), hide_index=True)
+
+    st.subheader('Vaicājumu latentums')
+    records = query_log.snapshot()
+    st.caption(f'Pēdējie {len(records)} vaicājumi')
+    st.dataframe(latency_percentiles(records), hide_index=True)
+
+    st.subheader('Vaicājumu avoti')
+    st.caption('Cik reizes katru vaicājumu apkalpoja apkopojums vai neapstrādātie dati')
+    st.dataframe(route_shares(route_count_snapshot()), hide_index=True)
+
+    st.subheader('Kešatmiņas aizņemtā atmiņa')
+    st.dataframe(memory, hide_index=True)
+
+    st.subheader('Sesiju metriku izmērs')
+    st.dataframe(sessions, hide_index=True)
+
+    st.subheader('Datubāze')
+    st.json(
+        {
+            'pool': asdict(db.pool.stats),
+            'result_cache': {
+                'enabled': result_cache.enabled,
+                'hits': result_cache.hits,
+                'misses': result_cache.misses,
+            },
+            'single_flight': {
+                'executions': in_flight.executions,
+                'shared': in_flight.shared,
+            },
+            'warmup': {
+                'done': warmup.done,
+                'total': warmup.total,
+                'duration_s': round(warmup.duration_s, 1),
+                'error': repr(warmup.error) if warmup.error else None,
+            },
+        }
+    )